@@ -21,6 +21,7 @@ CREATE TABLE map (
     building_id INTEGER REFERENCES building(id) NOT NULL,
     floor_number INTEGER NOT NULL,
     detail geometry(GEOMETRYCOLLECTION,2385) NOT NULL,-- SRID的值为2385,适合上海的单位为米的二维坐标系(X,Y),X方向为北,Y方向为东 https://epsg.io/2385
+    version INTEGER NOT NULL DEFAULT 0,-- 几何内容版本号，楼层内形状/位置/关联变化时递增
     UNIQUE (building_id, floor_number)
 );
 
@@ -106,6 +106,8 @@ class Map(models.Model):
     building = models.ForeignKey(Building, models.CASCADE)
     floor_number = models.IntegerField()
     detail = models.GeometryCollectionField(srid=2385)
+    # 几何内容版本号：楼层上任何形状、位置或关联关系变化时递增，导航缓存据此失效
+    version = models.IntegerField(default=0)
 
     class Meta:
         db_table = 'map'
@@ -1,5 +1,6 @@
 from .context import StoreareaContext, EventContext, EventareaContext, OtherareaContext,FacilityContext
-from map.context import MapContext
+from map.context import MapContext, MapVersionContext
+from map.signals import notify_geometry_changed
 from django.contrib.gis.geos import GeometryCollection, Polygon, Point
 from django.db import transaction
 import ezdxf
@@ -25,19 +26,32 @@ class StoreareaService:
     @staticmethod
     def create_storearea(shape, map_id=None):
         """创建新的店铺区域，并可选绑定到指定地图"""
-        return StoreareaContext.create(shape, map_id)
+        storearea = StoreareaContext.create(shape, map_id)
+        MapVersionContext.bump([map_id])
+        return storearea
 
     @staticmethod
     def update_shape(storearea_id, shape):
-        """更新店铺区域的形状"""
+        """更新店铺区域的形状，并增量更新所在楼层的导航网格"""
         # 可以在这里添加业务逻辑验证
-        return StoreareaContext.update_shape(storearea_id, shape)
+        # 行更新与版本号递增在同一事务中；导航网格的增量更新在事务提交后进行
+        with transaction.atomic():
+            old = StoreareaContext.get_by_id(storearea_id)
+            old_versions = MapVersionContext.get_versions(MapVersionContext.get_map_ids('store', storearea_id))
+            storearea = StoreareaContext.update_shape(storearea_id, shape)
+            MapVersionContext.bump(list(old_versions))
+            notify_geometry_changed(StoreareaService, 'store', old_versions,
+                                    old.shape if old else None, storearea.shape)
+        return storearea
 
     @staticmethod
     def delete_storearea(storearea_id):
         """删除店铺区域"""
         # 可以在这里添加业务逻辑验证
-        return StoreareaContext.delete(storearea_id)
+        # 关联记录会被级联删除，需要先取出所在地图
+        map_ids = MapVersionContext.get_map_ids('store', storearea_id)
+        StoreareaContext.delete(storearea_id)
+        MapVersionContext.bump(map_ids)
 
     @staticmethod
     def get_events_for_storearea(storearea_id):
@@ -115,17 +129,29 @@ class EventareaService:
     @staticmethod
     def create_eventarea(shape, map_id=None):
         """创建新的活动区域，并可选绑定到指定地图"""
-        return EventareaContext.create(shape, map_id)
+        eventarea = EventareaContext.create(shape, map_id)
+        MapVersionContext.bump([map_id])
+        return eventarea
 
     @staticmethod
     def update_eventarea_shape(eventarea_id, shape):
-        """更新活动区域的形状"""
-        return EventareaContext.update_shape(eventarea_id, shape)
+        """更新活动区域的形状，并增量更新所在楼层的导航网格"""
+        # 行更新与版本号递增在同一事务中；导航网格的增量更新在事务提交后进行
+        with transaction.atomic():
+            old = EventareaContext.get_by_id(eventarea_id)
+            old_versions = MapVersionContext.get_versions(MapVersionContext.get_map_ids('event', eventarea_id))
+            eventarea = EventareaContext.update_shape(eventarea_id, shape)
+            MapVersionContext.bump(list(old_versions))
+            notify_geometry_changed(EventareaService, 'event', old_versions,
+                                    old.shape if old else None, eventarea.shape)
+        return eventarea
 
     @staticmethod
     def delete_eventarea(eventarea_id):
         """删除活动区域"""
-        return EventareaContext.delete(eventarea_id)
+        map_ids = MapVersionContext.get_map_ids('event', eventarea_id)
+        EventareaContext.delete(eventarea_id)
+        MapVersionContext.bump(map_ids)
 
 
 class OtherareaService:
@@ -148,17 +174,29 @@ class OtherareaService:
     @staticmethod
     def create_otherarea(shape, map_id=None, type_val=None):
         """创建新的其他区域，并可选绑定到指定地图"""
-        return OtherareaContext.create(shape, map_id, type_val)
+        otherarea = OtherareaContext.create(shape, map_id, type_val)
+        MapVersionContext.bump([map_id])
+        return otherarea
 
     @staticmethod
     def update_otherarea_shape(otherarea_id, shape):
-        """更新其他区域的形状"""
-        return OtherareaContext.update_shape(otherarea_id, shape)
+        """更新其他区域的形状，并增量更新所在楼层的导航网格"""
+        # 行更新与版本号递增在同一事务中；导航网格的增量更新在事务提交后进行
+        with transaction.atomic():
+            old = OtherareaContext.get_by_id(otherarea_id)
+            old_versions = MapVersionContext.get_versions(MapVersionContext.get_map_ids('other', otherarea_id))
+            otherarea = OtherareaContext.update_shape(otherarea_id, shape)
+            MapVersionContext.bump(list(old_versions))
+            notify_geometry_changed(OtherareaService, 'other', old_versions,
+                                    old.shape if old else None, otherarea.shape)
+        return otherarea
 
     @staticmethod
     def delete_otherarea(otherarea_id):
         """删除其他区域"""
-        return OtherareaContext.delete(otherarea_id)
+        map_ids = MapVersionContext.get_map_ids('other', otherarea_id)
+        OtherareaContext.delete(otherarea_id)
+        MapVersionContext.bump(map_ids)
 
 class FacilityService:
     """
@@ -174,15 +212,27 @@ class FacilityService:
 
     @staticmethod
     def create_facility(location, map_id=None, type_val=None):
-        return FacilityContext.create(location, map_id, type_val)
+        facility = FacilityContext.create(location, map_id, type_val)
+        MapVersionContext.bump([map_id])
+        return facility
 
     @staticmethod
     def update_facility_location(facility_id, location):
-        return FacilityContext.update_location(facility_id, location)
+        # 行更新与版本号递增在同一事务中；导航网格的增量更新在事务提交后进行
+        with transaction.atomic():
+            old = FacilityContext.get_by_id(facility_id)
+            old_versions = MapVersionContext.get_versions(MapVersionContext.get_map_ids('facility', facility_id))
+            facility = FacilityContext.update_location(facility_id, location)
+            MapVersionContext.bump(list(old_versions))
+            notify_geometry_changed(FacilityService, 'facility', old_versions,
+                                    old.location if old else None, facility.location)
+        return facility
 
     @staticmethod
     def delete_facility(facility_id):
-        return FacilityContext.delete(facility_id)
+        map_ids = MapVersionContext.get_map_ids('facility', facility_id)
+        FacilityContext.delete(facility_id)
+        MapVersionContext.bump(map_ids)
 
 
 class MapEditorService:
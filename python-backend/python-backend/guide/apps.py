@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class GuideConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'guide'
+
+    def ready(self):
+        # 地图元素的形状/位置修改提交后，增量更新所在楼层的导航网格
+        from map.signals import element_geometry_changed
+        from guide.services import GridPatchService
+        element_geometry_changed.connect(GridPatchService.on_geometry_changed, dispatch_uid='guide_grid_patch')
@@ -0,0 +1,123 @@
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class ClosureStore:
+    """
+    临时封闭区域 (活动、检修时临时封闭的通道)
+    封闭区域不写入地图，不递增楼层版本号，缓存的导航网格不受影响；
+    寻路时把未过期的封闭区域栅格化成增量掩码，叠加在基础网格上
+    数据保存在 Django 缓存 (GUIDE_CLOSURE_CACHE) 中：每个封闭区域一个键，另有每个楼层一个 ID 索引，
+    索引的修改在楼层锁内进行，并发的添加/删除不会互相覆盖
+    多进程部署时需要配置共享的缓存后端 (如 Redis)，否则各进程只能看到自己添加的封闭区域
+    """
+
+    KEY_PREFIX = 'guide:closures:'
+    # 修改楼层封闭区域索引时持有的锁：超时后自动释放 (持锁进程崩溃时不会永久卡住)，等待超过 LOCK_WAIT 秒则放弃
+    LOCK_TIMEOUT = 5
+    LOCK_WAIT = 10.0
+
+    @staticmethod
+    def _cache():
+        return caches[getattr(settings, 'GUIDE_CLOSURE_CACHE', 'default')]
+
+    @classmethod
+    def _key(cls, map_id: int) -> str:
+        """楼层的封闭区域索引 {closure_id: expires_at}"""
+        return f"{cls.KEY_PREFIX}{int(map_id)}"
+
+    @classmethod
+    def _closure_key(cls, map_id: int, closure_id: str) -> str:
+        """单个封闭区域的数据"""
+        return f"{cls.KEY_PREFIX}{int(map_id)}:{closure_id}"
+
+    @classmethod
+    @contextmanager
+    def _index_lock(cls, map_id: int):
+        """
+        楼层索引的读-改-写必须互斥，否则并发的添加/删除会互相覆盖
+        锁用 cache.add 实现 (键不存在时才写入，各缓存后端都是原子操作)，多进程共享同一个缓存后端时同样有效
+        """
+        cache = cls._cache()
+        lock_key = f"{cls._key(map_id)}:lock"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + cls.LOCK_WAIT
+        while not cache.add(lock_key, token, timeout=cls.LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Closures of map #{map_id} are locked by another request")
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            # 只释放自己持有的锁 (超时后锁可能已被其他请求取得)
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    @classmethod
+    def _save_index(cls, map_id: int, index: dict, now: float):
+        """写回索引 (丢弃已过期的条目)，索引在最后一个封闭区域过期时一起过期；调用方须持有楼层锁"""
+        index = {closure_id: expires_at for closure_id, expires_at in index.items() if expires_at > now}
+        if not index:
+            cls._cache().delete(cls._key(map_id))
+            return
+        timeout = max(index.values()) - now
+        cls._cache().set(cls._key(map_id), index, timeout=max(int(timeout) + 1, 1))
+
+    @classmethod
+    def active(cls, map_id: int) -> List[dict]:
+        """
+        楼层上当前生效的封闭区域 (只读，不加锁)
+        :return: [{"id", "map_id", "geometry": EWKB 十六进制串, "expires_at": 时间戳, "reason"}, ...]，按 ID 排序
+        """
+        now = time.time()
+        index = cls._cache().get(cls._key(map_id)) or {}
+        closure_ids = sorted(closure_id for closure_id, expires_at in index.items() if expires_at > now)
+        if not closure_ids:
+            return []
+        closures = cls._cache().get_many([cls._closure_key(map_id, closure_id) for closure_id in closure_ids])
+        return [closures[key] for key in (cls._closure_key(map_id, closure_id) for closure_id in closure_ids)
+                if key in closures]
+
+    @classmethod
+    def add(cls, map_id: int, geometry, duration: float, reason: str = '') -> dict:
+        """
+        添加封闭区域：先写入封闭区域本身，再在楼层锁内登记到索引
+        :param geometry: Polygon / MultiPolygon
+        :param duration: 有效时长 (秒)
+        """
+        now = time.time()
+        closure = {
+            "id": uuid.uuid4().hex,
+            "map_id": int(map_id),
+            "geometry": geometry.hexewkb.decode(),
+            "expires_at": now + float(duration),
+            "reason": reason or '',
+        }
+        cls._cache().set(cls._closure_key(map_id, closure['id']), closure, timeout=int(duration) + 1)
+        with cls._index_lock(map_id):
+            index = cls._cache().get(cls._key(map_id)) or {}
+            index[closure['id']] = closure['expires_at']
+            cls._save_index(map_id, index, now)
+        return closure
+
+    @classmethod
+    def remove(cls, map_id: int, closure_id: str) -> Optional[dict]:
+        """
+        提前解除封闭
+        :return: 被删除的封闭区域，不存在 (或已过期) 时返回 None
+        """
+        now = time.time()
+        with cls._index_lock(map_id):
+            index = cls._cache().get(cls._key(map_id)) or {}
+            expires_at = index.pop(closure_id, None)
+            if expires_at is None or expires_at <= now:
+                return None
+            cls._save_index(map_id, index, now)
+        closure = cls._cache().get(cls._closure_key(map_id, closure_id))
+        cls._cache().delete(cls._closure_key(map_id, closure_id))
+        return closure
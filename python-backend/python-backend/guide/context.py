@@ -12,6 +12,82 @@ class GuideContext:
     职责：只负责从数据库提取几何数据，不负责路径计算逻辑
     """
 
+    # 设施点膨胀成障碍物的半径 (米)
+    FACILITY_RADIUS = 0.5
+
+    @staticmethod
+    def get_map_floor(map_id: int) -> Optional[Tuple[int, int]]:
+        """
+        获取地图所属的建筑与楼层号
+
+        :param map_id: 地图 ID
+        :return: (building_id, floor_number)，地图不存在时返回 None
+        """
+        return Map.objects.filter(pk=map_id).values_list('building_id', 'floor_number').first()
+
+    @staticmethod
+    def get_building_maps(building_id: int) -> List[Tuple[int, int, int]]:
+        """
+        获取建筑下的全部楼层地图
+
+        :param building_id: 建筑 ID
+        :return: [(map_id, floor_number, version), ...]，按楼层号升序
+        """
+        return list(
+            Map.objects.filter(building_id=building_id)
+            .order_by('floor_number', 'id')
+            .values_list('id', 'floor_number', 'version')
+        )
+
+    @staticmethod
+    def get_connector_facilities(map_ids: List[int], facility_types: List[int]) -> List[Tuple[int, int, Point]]:
+        """
+        获取若干楼层上的垂直交通设施 (电梯、扶梯等)，停用的设施不参与导航
+
+        :param map_ids: 地图 ID 列表
+        :param facility_types: 视为垂直交通的设施类型
+        :return: [(facility_id, map_id, location), ...]
+        """
+        return list(
+            FacilityMap.objects.filter(
+                map_id__in=map_ids,
+                facility__type__in=facility_types,
+                facility__location__isnull=False
+            )
+            .exclude(facility__is_active=False)
+            .order_by('facility_id', 'map_id')
+            .values_list('facility_id', 'map_id', 'facility__location')
+        )
+
+    @staticmethod
+    def get_facility_targets(map_id: int, facility_ids: Optional[List[int]] = None,
+                             facility_type: Optional[int] = None) -> List[Tuple[int, Point]]:
+        """
+        获取楼层上作为寻路目标的设施 (按 ID 列表或按类型筛选)，停用的设施不参与导航
+
+        :return: [(facility_id, location), ...]
+        """
+        queryset = Facility.objects.filter(facilitymap__map_id=map_id, location__isnull=False) \
+            .exclude(is_active=False)
+        if facility_ids is not None:
+            queryset = queryset.filter(id__in=facility_ids)
+        if facility_type is not None:
+            queryset = queryset.filter(type=facility_type)
+        return list(queryset.order_by('id').values_list('id', 'location'))
+
+    @staticmethod
+    def get_store_targets(map_id: int, store_ids: Optional[List[int]] = None) -> List[Tuple[int, Polygon]]:
+        """
+        获取楼层上作为寻路目标的商铺
+
+        :param store_ids: 商铺 ID 列表，为 None 时返回该楼层全部商铺
+        :return: [(storearea_id, shape), ...]
+        """
+        queryset = Storearea.objects.filter(storeareamap__map_id=map_id, shape__isnull=False)
+        if store_ids is not None:
+            queryset = queryset.filter(id__in=store_ids)
+        return list(queryset.order_by('id').values_list('id', 'shape'))
+
     @staticmethod
     def get_map_geometry_data(map_id: int) -> Tuple[Optional[Polygon], List[Polygon], List[Polygon]]:
         """
@@ -76,6 +152,47 @@ class GuideContext:
         for point in facilities:
             # buffer(0.5) 表示以点为中心，半径 0.5 米的圆
             if isinstance(point, Point):
-                obstacles.append(point.buffer(0.5))
+                obstacles.append(point.buffer(GuideContext.FACILITY_RADIUS))
 
         return outer_shell, holes, obstacles
+
+    @staticmethod
+    def get_obstacles_in_extent(map_id: int, extent: Tuple[float, float, float, float]) -> List[Polygon]:
+        """
+        获取外包矩形与 extent 相交的镂空与障碍物 (增量更新导航网格时重新标记这一块区域用)
+
+        :param extent: (min_x, min_y, max_x, max_y)
+        :return: 与 get_map_geometry_data 相同口径的障碍物列表 (镂空在前，设施已膨胀)
+        """
+        map_obj = Map.objects.filter(pk=map_id).first()
+        if map_obj is None:
+            return []
+
+        box = Polygon.from_bbox(extent)
+        box.srid = 2385
+        obstacles = []
+
+        # 1. 地图本身的镂空
+        if map_obj.detail and len(map_obj.detail) > 1:
+            obstacles.extend(hole for hole in map_obj.detail[1:] if hole.envelope.intersects(box))
+
+        # 2. 商铺、活动区域、其他区域 (数据库按外包矩形过滤)
+        obstacles.extend(Storearea.objects.filter(
+            storeareamap__map_id=map_id, shape__bboverlaps=box
+        ).values_list('shape', flat=True))
+        obstacles.extend(Eventarea.objects.filter(
+            eventareamap__map_id=map_id, shape__bboverlaps=box
+        ).values_list('shape', flat=True))
+        obstacles.extend(Otherarea.objects.filter(
+            otherareamap__map_id=map_id, shape__bboverlaps=box
+        ).values_list('shape', flat=True))
+
+        # 3. 设施：膨胀半径内可能碰到这块区域的都算
+        radius = GuideContext.FACILITY_RADIUS
+        search_box = Polygon.from_bbox((extent[0] - radius, extent[1] - radius, extent[2] + radius, extent[3] + radius))
+        search_box.srid = 2385
+        facilities = Facility.objects.filter(
+            facilitymap__map_id=map_id, location__bboverlaps=search_box
+        ).values_list('location', flat=True)
+        obstacles.extend(point.buffer(radius) for point in facilities if isinstance(point, Point))
+        return obstacles
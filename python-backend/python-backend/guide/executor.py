@@ -0,0 +1,247 @@
+import atexit
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+
+from guide.pathfinding import SEARCH_ENGINES, PathSmoother
+
+
+class SharedGrid:
+    """
+    工作进程内的导航网格
+    只保留搜索内核需要的部分 (展平的可行走数组、宽高、派生结构)，
+    提供与 GridSystem 相同的 walkable_flat / derived 接口，各搜索引擎的 for_grid 可以直接使用
+    可行走数组直接引用共享内存 (memoryview，不复制)，网格被淘汰时调用 close 解除映射
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, width: int, height: int):
+        self.width = width
+        self.height = height
+        self._shm = shm
+        self._walkable = shm.buf[:width * height]
+        self._derived = {}
+
+    def walkable_flat(self) -> memoryview:
+        return self._walkable
+
+    def derived(self, key, builder):
+        if key not in self._derived:
+            self._derived[key] = builder()
+        return self._derived[key]
+
+    def close(self):
+        # 派生结构 (如 np.frombuffer 得到的数组) 引用着共享内存，先释放它们才能解除映射
+        self._derived = {}
+        try:
+            self._walkable.release()
+            self._shm.close()
+        except BufferError:
+            # 仍有其他对象引用共享内存：映射随这些对象被回收时解除
+            pass
+
+
+# 工作进程内按 grid_key 缓存的网格，同一网格只按名字映射一次共享内存
+_worker_grids = OrderedDict()
+_worker_cache_size = 16
+
+
+def _init_worker(cache_size: int):
+    global _worker_cache_size
+    _worker_cache_size = cache_size
+
+
+def _is_stale(key: tuple, current: tuple) -> bool:
+    """同一楼层的其他版本 (key 为 (map_id, version, 变体...))，同一版本的净空、封闭区域等变体互不影响"""
+    return key[0] == current[0] and key[1] != current[1]
+
+
+def _worker_grid(grid_key: tuple, shm_name: str, width: int, height: int) -> SharedGrid:
+    """取工作进程缓存的网格，未命中时按名字映射共享内存 (保持映射，不复制可行走数组)"""
+    grid = _worker_grids.get(grid_key)
+    if grid is not None:
+        _worker_grids.move_to_end(grid_key)
+        return grid
+
+    grid = SharedGrid(shared_memory.SharedMemory(name=shm_name), width, height)
+    # 同一楼层的旧版本网格已经过期
+    for key in [key for key in _worker_grids if _is_stale(key, grid_key)]:
+        _worker_grids.pop(key).close()
+    _worker_grids[grid_key] = grid
+    while len(_worker_grids) > _worker_cache_size:
+        _worker_grids.popitem(last=False)[1].close()
+    return grid
+
+
+def _clear_worker_grids():
+    """解除工作进程缓存的全部网格的映射"""
+    while _worker_grids:
+        _worker_grids.popitem()[1].close()
+
+
+def _search_in_worker(grid_key: tuple, shm_name: str, width: int, height: int,
+                      start_node: Tuple[int, int], end_node: Tuple[int, int], engine: str,
+                      smooth: bool, budget: Tuple[Optional[int], Optional[float]]) \
+        -> Optional[List[Tuple[int, int]]]:
+    """
+    在工作进程中执行：搜索 + 视线平滑
+    :param budget: (展开节点数上限, 耗时上限(秒))，超出时抛出 SearchBudgetExceeded (会传回请求进程)
+    :return: 网格坐标路径，找不到路径返回 None
+    """
+    grid = _worker_grid(grid_key, shm_name, width, height)
+    search = SEARCH_ENGINES[engine].for_grid(grid).set_budget(*budget)
+    path_ids = search.search(search.to_id(*start_node), search.to_id(*end_node))
+    if path_ids is None:
+        return None
+
+    path_nodes = [search.to_cell(node_id) for node_id in path_ids]
+    if smooth:
+        path_nodes = PathSmoother(grid.walkable_flat(), width, height).smooth(path_nodes)
+    return path_nodes
+
+
+class RouteExecutor:
+    """
+    多进程寻路执行器
+    纯 Python 的网格搜索会一直持有 GIL，一条长路线会阻塞同一进程里的其他请求；
+    开启后 (GUIDE_ROUTE_WORKERS > 0) 搜索交给进程池完成，请求线程只是等待结果 (不占用 GIL)
+    各楼层的可行走数组按 grid.cache_key 发布到共享内存，工作进程首次用到时按名字映射并保持映射 (不复制)，
+    所有工作进程共用同一份物理内存；净空、临时封闭区域叠加后的网格带有各自的 cache_key，同样在进程池中搜索
+    居中代价 (加权 A*) 还需要每格一份代价表，不经过进程池，仍在请求线程内搜索
+    共享内存按使用中的任务计数：新版本发布后旧版本不再分配给新任务，但要等已提交的任务都结束后才释放 (unlink)，
+    否则排队中的任务在工作进程里按名字打开共享内存时会找不到；已经映射的工作进程不受 unlink 影响，淘汰网格时解除映射
+    """
+
+    _pool = None
+    # grid.cache_key -> 已发布的 SharedMemory
+    _published = OrderedDict()
+    # 共享内存名 -> 使用中 (已提交、尚未结束) 的任务数
+    _in_flight = {}
+    # 已过期但仍有任务在使用的共享内存，计数归零时释放
+    _retired = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def enabled() -> bool:
+        return getattr(settings, 'GUIDE_ROUTE_WORKERS', 0) > 0
+
+    @classmethod
+    def find_path(cls, grid, start_node: Tuple[int, int], end_node: Tuple[int, int], engine: str,
+                  smooth: bool, budget: Tuple[Optional[int], Optional[float]] = (None, None)) \
+            -> Optional[List[Tuple[int, int]]]:
+        """
+        在进程池中寻路
+        :param grid: 已缓存的 GridSystem 或其净空/封闭区域变体，cache_key 为 (map_id, version, 变体...)
+        :param budget: 单次搜索的预算 (展开节点数上限, 耗时上限(秒))
+        :return: 网格坐标路径，找不到路径返回 None
+        """
+        # 1. 确保网格已发布到共享内存，并登记一个使用中的任务
+        shm_name = cls._publish(grid)
+
+        # 2. 提交任务并等待，超时后放弃该请求
+        try:
+            future = cls._get_pool().submit(
+                _search_in_worker, grid.cache_key, shm_name, grid.width, grid.height,
+                start_node, end_node, engine, smooth, budget
+            )
+            return future.result(timeout=getattr(settings, 'GUIDE_ROUTE_TIMEOUT', 10.0))
+        except FutureTimeoutError:
+            # 已开始执行的任务无法中断，只能不再等待它的结果
+            future.cancel()
+            raise TimeoutError("Route search timed out")
+        except BrokenProcessPool:
+            # 工作进程异常退出 (如内存不足被杀)，下次请求时重建进程池
+            with cls._lock:
+                cls._pool = None
+            raise
+        finally:
+            cls._finish(shm_name)
+
+    @classmethod
+    def _get_pool(cls) -> ProcessPoolExecutor:
+        with cls._lock:
+            if cls._pool is None:
+                # spawn 方式启动：Django 进程中可能有其他线程，fork 出的子进程状态不可靠
+                cls._pool = ProcessPoolExecutor(
+                    max_workers=getattr(settings, 'GUIDE_ROUTE_WORKERS', 0),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(getattr(settings, 'GUIDE_GRID_CACHE_SIZE', 16),),
+                )
+            return cls._pool
+
+    @classmethod
+    def _publish(cls, grid) -> str:
+        """
+        把网格的可行走数组写入共享内存，同一 cache_key 只写一次
+        返回前把使用中的任务数加一，调用方在任务结束后必须调用 _finish
+        """
+        key = grid.cache_key
+        with cls._lock:
+            shm = cls._published.get(key)
+            if shm is not None:
+                cls._published.move_to_end(key)
+            else:
+                walkable = grid.walkable_flat()
+                shm = shared_memory.SharedMemory(create=True, size=max(len(walkable), 1))
+                shm.buf[:len(walkable)] = walkable
+
+                # 同一楼层的旧版本已经过期；超出容量时释放最久未使用的
+                for old_key in [k for k in cls._published if _is_stale(k, key)]:
+                    cls._retire(cls._published.pop(old_key))
+                cls._published[key] = shm
+                while len(cls._published) > getattr(settings, 'GUIDE_GRID_CACHE_SIZE', 16):
+                    cls._retire(cls._published.popitem(last=False)[1])
+
+            cls._in_flight[shm.name] = cls._in_flight.get(shm.name, 0) + 1
+            return shm.name
+
+    @classmethod
+    def _finish(cls, shm_name: str):
+        """任务结束：使用中的任务数减一，已过期的共享内存在没有任务使用时释放"""
+        with cls._lock:
+            count = cls._in_flight.get(shm_name, 0) - 1
+            if count > 0:
+                cls._in_flight[shm_name] = count
+                return
+            cls._in_flight.pop(shm_name, None)
+            shm = cls._retired.pop(shm_name, None)
+            if shm is not None:
+                cls._release(shm)
+
+    @classmethod
+    def _retire(cls, shm: shared_memory.SharedMemory):
+        """不再分配给新任务；仍有任务在使用时推迟到 _finish 中释放 (调用方持有 _lock)"""
+        if cls._in_flight.get(shm.name):
+            cls._retired[shm.name] = shm
+        else:
+            cls._release(shm)
+
+    @staticmethod
+    def _release(shm: shared_memory.SharedMemory):
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def shutdown(cls):
+        """关闭进程池并释放共享内存 (进程退出时自动调用)"""
+        with cls._lock:
+            if cls._pool is not None:
+                cls._pool.shutdown(wait=True, cancel_futures=True)
+                cls._pool = None
+            while cls._published:
+                cls._release(cls._published.popitem()[1])
+            while cls._retired:
+                cls._release(cls._retired.popitem()[1])
+            cls._in_flight.clear()
+
+
+atexit.register(RouteExecutor.shutdown)
@@ -0,0 +1,98 @@
+import heapq
+import itertools
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# 楼层转换图的节点：某个垂直交通设施在某一层的落脚点 (facility_id, map_id)
+ConnectorNode = Tuple[int, int]
+
+
+class FloorTransitionGraph:
+    """
+    楼层转换图 (按建筑预计算)
+    节点为垂直交通设施 (电梯、扶梯、楼梯) 在各楼层的落脚点
+    边分两类：同层两个设施之间的步行边 (代价为网格路径长度，附带路径)，以及跨层的换乘边
+    跨层寻路时只在这张小图上做 Dijkstra，楼层内部的细节交给各层缓存的导航网格
+    """
+
+    def __init__(self, building_id: int):
+        self.building_id = building_id
+        # map_id -> floor_number
+        self.floors: Dict[int, int] = {}
+        # 节点 -> 落脚点所在的网格坐标 (gx, gy)
+        self.access_cells: Dict[ConnectorNode, Tuple[int, int]] = {}
+        # 节点 -> [(相邻节点, 代价)]
+        self.edges: Dict[ConnectorNode, List[Tuple[ConnectorNode, float]]] = defaultdict(list)
+        # (节点 A, 节点 B) -> 同层步行边对应的网格路径
+        self.walk_paths: Dict[Tuple[ConnectorNode, ConnectorNode], List[Tuple[int, int]]] = {}
+
+    def add_connector(self, node: ConnectorNode, cell: Tuple[int, int]):
+        self.access_cells[node] = cell
+
+    def connectors_on(self, map_id: int) -> List[ConnectorNode]:
+        """某一层上的全部落脚点"""
+        return [node for node in self.access_cells if node[1] == map_id]
+
+    def add_walk_edge(self, node_a: ConnectorNode, node_b: ConnectorNode, cost: float,
+                      path: List[Tuple[int, int]]):
+        """同层步行边 (双向)"""
+        self.edges[node_a].append((node_b, cost))
+        self.edges[node_b].append((node_a, cost))
+        self.walk_paths[(node_a, node_b)] = path
+        self.walk_paths[(node_b, node_a)] = path[::-1]
+
+    def add_transition(self, node_a: ConnectorNode, node_b: ConnectorNode, cost: float):
+        """跨层换乘边 (双向)"""
+        self.edges[node_a].append((node_b, cost))
+        self.edges[node_b].append((node_a, cost))
+
+    def shortest_path(self, sources: Dict[ConnectorNode, float], targets: Dict[ConnectorNode, float]) \
+            -> Optional[Tuple[float, List[ConnectorNode]]]:
+        """
+        多源多汇 Dijkstra
+        :param sources: 起点到起始楼层各落脚点的代价
+        :param targets: 目标楼层各落脚点到终点的代价
+        :return: (总代价, 途经的落脚点序列)，不可达返回 None
+        """
+        # 计数器用于同代价时的出队顺序，避免比较节点本身
+        counter = itertools.count()
+        dist = {}
+        parent = {}
+        open_set = []
+        for node, cost in sources.items():
+            if cost < dist.get(node, float('inf')):
+                dist[node] = cost
+                parent[node] = None
+                heapq.heappush(open_set, (cost, next(counter), node))
+
+        settled = set()
+        best = None
+        while open_set:
+            cost, _, node = heapq.heappop(open_set)
+            # 剩余节点的代价都不小于已找到的最优解，可以提前结束
+            if best is not None and cost >= best[0]:
+                break
+            if node in settled:
+                continue
+            settled.add(node)
+
+            if node in targets and (best is None or cost + targets[node] < best[0]):
+                best = (cost + targets[node], node)
+
+            for neighbor, edge_cost in self.edges.get(node, ()):
+                new_cost = cost + edge_cost
+                if new_cost < dist.get(neighbor, float('inf')):
+                    dist[neighbor] = new_cost
+                    parent[neighbor] = node
+                    heapq.heappush(open_set, (new_cost, next(counter), neighbor))
+
+        if best is None:
+            return None
+
+        # 回溯落脚点序列
+        nodes = []
+        node = best[1]
+        while node is not None:
+            nodes.append(node)
+            node = parent[node]
+        return best[0], nodes[::-1]
@@ -0,0 +1,128 @@
+import hashlib
+import mmap
+import struct
+from typing import Dict, List
+
+import numpy as np
+
+from guide.storage import GuideDataStore
+
+
+class GridFile:
+    """
+    导航网格的磁盘格式 (每个 (map_id, version) 一个文件)
+    布局：
+    - 文件头：魔数、外包矩形 (min_x, min_y, max_x, max_y)、网格精度、宽高、数据表数量、源几何指纹
+    - 数据表目录：每项为 (名称, dtype, 偏移, 字节数)
+    - 数据表：外轮廓、障碍物、可行走三张占用矩阵 (每格 1 字节的布尔值)，以及可选的预计算表 (最近可走格子、连通分量编号等)
+    读取时用 mmap 映射整个文件，占用矩阵与预计算表都直接引用映射内存 (零拷贝、只读)，
+    多个工作进程通过系统页缓存共享同一份物理内存；占用矩阵不按位压缩，否则每个进程都要解压出一份私有副本
+    文件名只含 (map_id, version)，加载时按版本号信任文件；文件头另外记录源几何的指纹，
+    数据库重置、重新导入或绕过版本号的修改之后，可以开启 GUIDE_GRID_VERIFY 或执行 guide_grid_verify 命令比对
+    """
+
+    MAGIC = b'GUIDGRD3'
+    NAME = 'grid'
+    SUFFIX = '.bin'
+    # 文件头：魔数 + 外包矩形与精度 (5 个 double) + 宽、高、数据表数量 + 源几何指纹 (SHA-256)
+    HEADER = struct.Struct('<8s5d3I32s')
+    # 数据表目录项：名称、dtype 字符串、偏移、字节数
+    ENTRY = struct.Struct('<24s8sQQ')
+    # 数据表按 64 字节对齐，映射后可以直接作为 NumPy 数组使用
+    ALIGN = 64
+
+    @staticmethod
+    def path_for(map_id: int, version: int) -> str:
+        return GuideDataStore.path_for(map_id, version, GridFile.NAME, GridFile.SUFFIX)
+
+    @staticmethod
+    def fingerprint(outer_shell, holes: List, obstacles: List) -> bytes:
+        """
+        源几何指纹：外轮廓、镂空与障碍物 WKB 的 SHA-256
+        镂空与障碍物按 WKB 排序后参与计算，与数据库返回的顺序无关
+        """
+        digest = hashlib.sha256()
+        for wkb in [bytes(outer_shell.wkb)] + sorted(bytes(geometry.wkb) for geometry in list(holes) + list(obstacles)):
+            digest.update(struct.pack('<I', len(wkb)))
+            digest.update(wkb)
+        return digest.digest()
+
+    @staticmethod
+    def write(path: str, grid, tables: Dict[str, np.ndarray], fingerprint: bytes):
+        """
+        写入网格文件 (先写临时文件再重命名)
+        :param grid: GridSystem，取外包矩形、精度、外轮廓矩阵、障碍物矩阵与可行走矩阵
+        :param tables: 可选的预计算表，形状须为 (width, height)
+        :param fingerprint: 构建网格所用几何的指纹 (GridFile.fingerprint)
+        """
+        arrays = {
+            'shell': np.ascontiguousarray(grid.shell_mask, dtype=bool),
+            'obstacle': np.ascontiguousarray(grid.obstacle_mask, dtype=bool),
+            'walkable': np.ascontiguousarray(grid.walkable, dtype=bool),
+        }
+        for name, table in tables.items():
+            arrays[name] = np.ascontiguousarray(table)
+
+        # 1. 计算各数据表的偏移
+        offset = GridFile.HEADER.size + GridFile.ENTRY.size * len(arrays)
+        entries = []
+        for name, array in arrays.items():
+            offset = -(-offset // GridFile.ALIGN) * GridFile.ALIGN
+            entries.append((name, array, offset))
+            offset += array.nbytes
+
+        # 2. 依次写入文件头、目录与数据
+        def writer(f):
+            f.write(GridFile.HEADER.pack(GridFile.MAGIC, grid.min_x, grid.min_y, grid.max_x, grid.max_y,
+                                         grid.resolution, grid.width, grid.height, len(entries), fingerprint))
+            for name, array, position in entries:
+                f.write(GridFile.ENTRY.pack(name.encode(), array.dtype.str.encode(), position, array.nbytes))
+            for name, array, position in entries:
+                f.write(b'\0' * (position - f.tell()))
+                f.write(array.tobytes())
+
+        GuideDataStore.write_atomic(path, writer)
+
+    @staticmethod
+    def read(path: str) -> dict:
+        """
+        映射并解析网格文件
+        :return: {"extent", "resolution", "fingerprint", "shell_mask", "obstacle_mask", "walkable",
+                  "tables": {名称: 只读数组}}，数组均为映射内存上的只读视图
+        :raises ValueError: 文件不是网格文件或已损坏
+        """
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(buf) < GridFile.HEADER.size:
+            raise ValueError(f"Grid file is truncated: {path}")
+        magic, min_x, min_y, max_x, max_y, resolution, width, height, count, fingerprint = \
+            GridFile.HEADER.unpack_from(buf, 0)
+        if magic != GridFile.MAGIC:
+            raise ValueError(f"Not a navigation grid file: {path}")
+
+        # 1. 按目录取出各数据表 (np.frombuffer 直接引用映射内存)
+        arrays = {}
+        for index in range(count):
+            name, dtype, offset, nbytes = GridFile.ENTRY.unpack_from(
+                buf, GridFile.HEADER.size + index * GridFile.ENTRY.size)
+            if offset + nbytes > len(buf):
+                raise ValueError(f"Grid file is truncated: {path}")
+            dtype = np.dtype(dtype.rstrip(b'\0').decode())
+            arrays[name.rstrip(b'\0').decode()] = np.frombuffer(buf, dtype=dtype, count=nbytes // dtype.itemsize,
+                                                                 offset=offset)
+
+        # 2. 全部恢复为 (width, height)
+        grids = {name: array.reshape(width, height) for name, array in arrays.items()}
+        for name in ('shell', 'obstacle', 'walkable'):
+            if name not in grids:
+                raise ValueError(f"Grid file is missing table '{name}': {path}")
+        return {
+            "extent": (min_x, min_y, max_x, max_y),
+            "resolution": resolution,
+            "fingerprint": fingerprint,
+            "shell_mask": grids.pop('shell'),
+            "obstacle_mask": grids.pop('obstacle'),
+            "walkable": grids.pop('walkable'),
+            "tables": grids,
+        }
@@ -0,0 +1,185 @@
+import random
+import time
+from typing import Tuple
+
+from django.contrib.gis.geos import Polygon, Point
+from django.core.management.base import BaseCommand, CommandError
+
+from guide.pathfinding import SEARCH_ENGINES, QuadtreeGraph, QuadtreeSearch
+from guide.services import GridSystem
+
+
+def build_synthetic_floor(size: float, obstacle_count: int, seed: int = 0, wing: bool = False):
+    """
+    生成一个合成楼层：size x size 米的正方形外框 + 随机分布的矩形商铺和圆形设施
+    :param wing: 是否在右上方用墙围出一个封闭翼区，唯一的门开在背向左下角的上墙
+    :return: (outer_shell, obstacles)
+    """
+    rng = random.Random(seed)
+    outer_shell = Polygon(((0, 0), (0, size), (size, size), (size, 0), (0, 0)), srid=2385)
+
+    obstacles = []
+    for i in range(obstacle_count):
+        x = rng.uniform(0, size - 12)
+        y = rng.uniform(0, size - 12)
+        if i % 4 == 3:
+            # 设施：点膨胀 0.5 米
+            obstacles.append(Point(x, y, srid=2385).buffer(0.5))
+        else:
+            w = rng.uniform(2, 10)
+            h = rng.uniform(2, 10)
+            obstacles.append(Polygon(((x, y), (x, y + h), (x + w, y + h), (x + w, y), (x, y)), srid=2385))
+
+    if wing:
+        low, high = wing_bounds(size)
+        # 翼区内部清空，四面墙厚 1 米，上墙中间留 3 米宽的门
+        obstacles = [geometry for geometry in obstacles if not geometry.intersects(
+            Polygon(((low, low), (low, high), (high, high), (high, low), (low, low)), srid=2385))]
+        middle = (low + high) / 2
+        for x1, y1, x2, y2 in (
+                (low - 1, low - 1, low, high + 1),  # 左墙
+                (high, low - 1, high + 1, high + 1),  # 右墙
+                (low, low - 1, high, low),  # 下墙
+                (low, high, middle - 1.5, high + 1),  # 上墙 (门左侧)
+                (middle + 1.5, high, high, high + 1),  # 上墙 (门右侧)
+        ):
+            obstacles.append(Polygon(((x1, y1), (x1, y2), (x2, y2), (x2, y1), (x1, y1)), srid=2385))
+    return outer_shell, obstacles
+
+
+def wing_bounds(size: float) -> Tuple[float, float]:
+    """封闭翼区 (正方形) 内部的坐标范围"""
+    return size * 0.6, size * 0.85
+
+
+class Command(BaseCommand):
+    help = '导航模块性能基准测试 (合成楼层，不访问数据库)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', choices=['raster', 'search', 'quadtree'], help='要测试的环节')
+        parser.add_argument('--size', type=float, default=150.0, help='合成楼层边长 (米)')
+        parser.add_argument('--obstacles', type=int, default=200, help='障碍物数量')
+        parser.add_argument('--resolution', type=float, default=0.5, help='网格精度 (米)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--queries', type=int, default=20, help='随机寻路请求数量 (search)')
+        parser.add_argument('--wing', action='store_true',
+                            help='加入封闭翼区，寻路请求从左下区域走到翼区内部 (search)')
+
+    def handle(self, *args, **options):
+        outer_shell, obstacles = build_synthetic_floor(
+            options['size'], options['obstacles'], options['seed'], wing=options['wing']
+        )
+        handler = getattr(self, f"bench_{options['target']}")
+        handler(outer_shell, obstacles, options)
+
+    def _timed(self, func):
+        start = time.perf_counter()
+        result = func()
+        return result, time.perf_counter() - start
+
+    def bench_raster(self, outer_shell, obstacles, options):
+        """对比障碍物栅格化：NumPy 扫描线 vs 逐点 GEOS intersects"""
+        resolution = options['resolution']
+
+        vector_grid = GridSystem(outer_shell, resolution=resolution)
+        _, vector_time = self._timed(lambda: vector_grid.mark_obstacles(obstacles))
+
+        point_grid = GridSystem(outer_shell, resolution=resolution)
+
+        def per_point():
+            for geometry in obstacles:
+                point_grid._mark_geometry_per_point(geometry)
+
+        _, point_time = self._timed(per_point)
+
+        mismatched = int((vector_grid.obstacle_mask != point_grid.obstacle_mask).sum())
+        if mismatched:
+            raise CommandError(f"栅格化结果不一致: {mismatched} 个格子不同")
+
+        self.stdout.write(f"grid: {vector_grid.width} x {vector_grid.height}, obstacles: {len(obstacles)}")
+        self.stdout.write(f"blocked cells: {int(vector_grid.obstacle_mask.sum())}")
+        self.stdout.write(f"per-point GEOS : {point_time * 1000:.1f} ms")
+        self.stdout.write(f"numpy scanline : {vector_time * 1000:.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"speedup: {point_time / vector_time:.1f}x"))
+
+    def bench_search(self, outer_shell, obstacles, options):
+        """
+        对比各搜索引擎：展开节点数、耗时
+        最优引擎的路径代价必须与 A* 一致；近似引擎 (HPA*) 统计与最优代价的偏差
+        """
+        grid = GridSystem(outer_shell, resolution=options['resolution'])
+        grid.mark_obstacles(obstacles)
+        walkable = grid.walkable_flat()
+
+        # 1. 随机抽取可行走的起终点对
+        rng = random.Random(options['seed'])
+        cells = [node_id for node_id in range(len(walkable)) if walkable[node_id]]
+        queries = [(rng.choice(cells), rng.choice(cells)) for _ in range(options['queries'])]
+        if options['wing']:
+            # 起点在翼区外的左下部分，终点在翼区内部
+            low, high = (bound / grid.resolution for bound in wing_bounds(options['size']))
+            outside = [node_id for node_id in cells if max(divmod(node_id, grid.height)) < low * 0.8]
+            inside = [node_id for node_id in cells if low < min(divmod(node_id, grid.height))
+                      and max(divmod(node_id, grid.height)) < high]
+            queries = [(rng.choice(outside), rng.choice(inside)) for _ in range(options['queries'])]
+
+        self.stdout.write(f"grid: {grid.width} x {grid.height}, queries: {len(queries)}")
+
+        # 2. 逐个引擎跑同一批请求
+        baseline = None
+        for name, engine_class in SEARCH_ENGINES.items():
+            # 预计算结构 (如 HPA* 抽象图) 挂在网格上，单独计时
+            _, prepare_time = self._timed(lambda: engine_class.for_grid(grid))
+
+            expanded = 0
+            costs = []
+            elapsed = 0.0
+            for start, goal in queries:
+                search = engine_class.for_grid(grid)
+                path, cost_time = self._timed(lambda: search.search(start, goal))
+                elapsed += cost_time
+                expanded += search.expanded
+                costs.append(search.cost if path is not None else None)
+
+            if baseline is None:
+                baseline = (expanded, costs)
+
+            ratios = []
+            for cost_a, cost_b in zip(baseline[1], costs):
+                if (cost_a is None) != (cost_b is None):
+                    raise CommandError(f"{name} 的可达性与基准不一致")
+                if cost_a is None:
+                    continue
+                if engine_class.optimal and abs(cost_a - cost_b) > 1e-6:
+                    raise CommandError(f"{name} 的路径代价与基准不一致: {cost_a} != {cost_b}")
+                ratios.append(cost_b / cost_a if cost_a else 1.0)
+
+            line = f"{name:<13}: expanded {expanded:>9}  ({expanded / max(baseline[0], 1):.1%})  {elapsed * 1000:.1f} ms"
+            if prepare_time > 0.001:
+                line += f"  (prepare {prepare_time * 1000:.1f} ms)"
+            if not engine_class.optimal and ratios:
+                line += f"  cost {(sum(ratios) / len(ratios) - 1):+.2%} avg / {(max(ratios) - 1):+.2%} max"
+            self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS("optimal engines returned paths of equal cost"))
+
+    def bench_quadtree(self, outer_shell, obstacles, options):
+        """四叉树导航图与均匀网格的规模对比：节点数、内存占用"""
+        grid = GridSystem(outer_shell, resolution=options['resolution'])
+        grid.mark_obstacles(obstacles)
+
+        tree, build_time = self._timed(lambda: QuadtreeGraph(
+            grid.walkable_flat(), grid.width, grid.height, QuadtreeSearch.MAX_LEAF_SIZE
+        ))
+        stats = tree.stats()
+
+        self.stdout.write(f"grid: {grid.width} x {grid.height}, walkable cells: {stats['walkable_cells']}")
+        self.stdout.write(f"build: {build_time * 1000:.1f} ms")
+        self.stdout.write(f"nodes : {stats['grid_nodes']:>10} cells -> {stats['leaf_nodes']:>8} leaves "
+                          f"({stats['leaf_nodes'] / stats['grid_nodes']:.1%}), {stats['leaf_edges']} edges")
+        self.stdout.write(f"memory: {stats['grid_bytes'] / 1024:>10.1f} KB -> {stats['quadtree_bytes'] / 1024:>8.1f} KB "
+                          f"({stats['quadtree_bytes'] / stats['grid_bytes']:.1%})")
+        self.stdout.write(self.style.SUCCESS(
+            f"savings: {1 - stats['leaf_nodes'] / stats['grid_nodes']:.1%} nodes, "
+            f"{1 - stats['quadtree_bytes'] / stats['grid_bytes']:.1%} memory"
+        ))
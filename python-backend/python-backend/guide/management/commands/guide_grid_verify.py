@@ -0,0 +1,45 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Map
+from guide.context import GuideContext
+from guide.gridfile import GridFile
+
+
+class Command(BaseCommand):
+    help = '校验导航网格文件：与数据库中楼层的当前几何比对指纹，删除不一致或损坏的文件 (数据库重置、重新导入后使用)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--map-id', type=int, action='append', help='只校验指定楼层，可重复传入')
+        parser.add_argument('--dry-run', action='store_true', help='只报告，不删除文件')
+
+    def handle(self, *args, **options):
+        maps = Map.objects.order_by('id').values_list('id', 'version')
+        if options['map_id']:
+            maps = maps.filter(id__in=options['map_id'])
+            if not maps.exists():
+                raise CommandError(f"Maps not found: {options['map_id']}")
+
+        for map_id, version in maps:
+            path = GridFile.path_for(map_id, version)
+            if not os.path.exists(path):
+                continue
+
+            # 1. 文件头中的指纹与当前几何的指纹
+            try:
+                stored = GridFile.read(path)['fingerprint']
+            except (OSError, ValueError) as e:
+                stored, problem = None, str(e)
+            geometry = GuideContext.get_map_geometry_data(map_id)
+            if stored is not None:
+                if geometry[0] and stored == GridFile.fingerprint(*geometry):
+                    self.stdout.write(f"map #{map_id} v{version}: ok")
+                    continue
+                problem = 'built from different geometry'
+
+            # 2. 不一致的文件删除后，下次寻路时重新构建
+            if not options['dry_run']:
+                os.remove(path)
+            self.stdout.write(self.style.WARNING(f"map #{map_id} v{version}: {problem}, "
+                                                 f"{'would remove' if options['dry_run'] else 'removed'}"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Map
+from guide.services import StoreDistanceMatrixService
+
+
+class Command(BaseCommand):
+    help = '预计算楼层商铺步行距离矩阵 (可配合定时任务使用，已是最新版本的楼层会跳过)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--map-id', type=int, action='append', help='只计算指定楼层，可重复传入')
+        parser.add_argument('--force', action='store_true', help='即使当前版本已有结果也重新计算')
+
+    def handle(self, *args, **options):
+        service = StoreDistanceMatrixService()
+        maps = Map.objects.order_by('id').values_list('id', 'version')
+        if options['map_id']:
+            maps = maps.filter(id__in=options['map_id'])
+            if not maps.exists():
+                raise CommandError(f"Maps not found: {options['map_id']}")
+
+        for map_id, version in maps:
+            if not options['force'] and service.get_matrix(map_id) is not None:
+                self.stdout.write(f"map #{map_id} v{version}: up to date")
+                continue
+            try:
+                store_ids, _ = service.build_matrix(map_id, version)
+            except ValueError as e:
+                self.stderr.write(f"map #{map_id} v{version}: {e}")
+                continue
+            self.stdout.write(self.style.SUCCESS(f"map #{map_id} v{version}: {len(store_ids)} stores"))
@@ -0,0 +1,1286 @@
+import heapq
+import math
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+SQRT2 = math.sqrt(2)
+# 对角距离 (octile) 启发函数的系数：h = dx + dy + (√2 - 2) * min(dx, dy)
+OCTILE_K = SQRT2 - 2
+INF = float('inf')
+# 搜索预算的检查间隔 (展开节点数)，避免每次展开都读取时钟
+BUDGET_CHECK_INTERVAL = 1024
+
+
+class SearchBudgetExceeded(Exception):
+    """搜索展开的节点数或耗时超出预算"""
+
+
+class GridSearch:
+    """
+    搜索内核基类
+    网格被展平成一维数组，格子 (gx, gy) 的编号为 gx * height + gy
+    这样编号的大小顺序与 (gx, gy) 元组的字典序一致，堆中同 f 值时的出队顺序与元组实现相同
+    """
+
+    # 是否保证返回最短路径
+    optimal = True
+
+    def __init__(self, walkable, width: int, height: int):
+        """
+        :param walkable: 展平后的可行走数组 (bytes/bytearray)，非 0 表示可走
+        :param width: 网格 x 方向格子数
+        :param height: 网格 y 方向格子数
+        """
+        self.walkable = walkable
+        self.width = width
+        self.height = height
+        self.size = width * height
+        # 本次搜索展开（出队并扩展邻居）的节点数，用于 benchmark
+        self.expanded = 0
+        # 找到路径时的路径代价 (格子数，对角线按 √2 计)
+        self.cost = None
+        # 搜索预算：展开节点数上限、耗时上限 (秒)，为空表示不限制
+        self.max_expanded = None
+        self.time_limit = None
+        self._deadline = None
+
+        # 移动方向：(dx, dy, 编号偏移, 代价)，顺序与原实现保持一致
+        self.moves = [
+            (dx, dy, dx * height + dy, cost) for dx, dy, cost in (
+                (0, 1, 1.0), (0, -1, 1.0), (1, 0, 1.0), (-1, 0, 1.0),  # 上下右左
+                (1, 1, SQRT2), (1, -1, SQRT2), (-1, 1, SQRT2), (-1, -1, SQRT2)  # 对角线
+            )
+        ]
+
+    @classmethod
+    def for_grid(cls, grid):
+        """按导航网格 (GridSystem) 创建搜索内核"""
+        return cls(grid.walkable_flat(), grid.width, grid.height)
+
+    def set_budget(self, max_expanded: Optional[int] = None, time_limit: Optional[float] = None):
+        """
+        设置搜索预算，超出时 search 抛出 SearchBudgetExceeded，而不是把整个连通区域搜完
+        :return: self，便于链式调用
+        """
+        self.max_expanded = max_expanded
+        self.time_limit = time_limit
+        return self
+
+    def _check_budget(self, expanded: int) -> int:
+        """
+        检查搜索预算，返回下一次需要检查时的展开节点数
+        expanded 为 0 表示搜索刚开始，此时只记录截止时间
+        """
+        if expanded == 0:
+            self._deadline = time.perf_counter() + self.time_limit if self.time_limit else None
+        else:
+            if self.max_expanded is not None and expanded > self.max_expanded:
+                self.expanded = expanded
+                raise SearchBudgetExceeded(f"Route search budget exceeded: more than {self.max_expanded} nodes expanded")
+            if self._deadline is not None and time.perf_counter() > self._deadline:
+                self.expanded = expanded
+                raise SearchBudgetExceeded(
+                    f"Route search budget exceeded: time limit of {self.time_limit}s reached")
+
+        next_check = expanded + BUDGET_CHECK_INTERVAL
+        if self.max_expanded is not None:
+            next_check = min(next_check, self.max_expanded + 1)
+        return next_check
+
+    def to_id(self, gx: int, gy: int) -> int:
+        return gx * self.height + gy
+
+    def to_cell(self, node_id: int) -> Tuple[int, int]:
+        return divmod(node_id, self.height)
+
+    def octile(self, node_a: int, node_b: int) -> float:
+        """对角距离启发函数"""
+        ax, ay = divmod(node_a, self.height)
+        bx, by = divmod(node_b, self.height)
+        delta_x = abs(ax - bx)
+        delta_y = abs(ay - by)
+        return delta_x + delta_y + OCTILE_K * min(delta_x, delta_y)
+
+    @staticmethod
+    def _reconstruct(parent, goal: int) -> List[int]:
+        """沿父节点数组 (或字典) 从终点回溯到起点"""
+        path = [goal]
+        current = parent[goal]
+        while current != -1:
+            path.append(current)
+            current = parent[current]
+        return path[::-1]
+
+
+class AStarSearch(GridSearch):
+    """
+    A* 搜索内核
+    g 值、父节点用预分配的 array 存储，关闭集用 bytearray 位图，搜索过程中不为节点创建元组或字典
+    """
+
+    def search(self, start: int, goal: int) -> Optional[List[int]]:
+        """
+        :param start: 起点编号
+        :param goal: 终点编号
+        :return: 路径上的节点编号列表，找不到路径返回 None
+        """
+        walkable = self.walkable
+        width, height = self.width, self.height
+        moves = self.moves
+        goal_x, goal_y = divmod(goal, height)
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        # 1. 预分配缓冲区
+        g_score = array('d', [INF]) * self.size
+        parent = array('i', [-1]) * self.size
+        closed = bytearray(self.size)
+
+        g_score[start] = 0.0
+        open_set = [(0, start)]
+        expanded = 0
+        check_at = self._check_budget(0)
+
+        # 2. 主循环
+        while open_set:
+            current_f, current = heappop(open_set)
+
+            # --- 成功到达终点 ---
+            if current == goal:
+                self.expanded = expanded
+                self.cost = g_score[current]
+                return self._reconstruct(parent, current)
+
+            # 已按当前 g 值扩展过的节点，重复出队时直接跳过
+            if closed[current]:
+                continue
+            closed[current] = 1
+            expanded += 1
+            if expanded >= check_at:
+                check_at = self._check_budget(expanded)
+
+            gx, gy = divmod(current, height)
+            current_g = g_score[current]
+
+            # 遍历 8 个邻居
+            for dx, dy, offset, move_cost in moves:
+                nx = gx + dx
+                ny = gy + dy
+                if nx < 0 or nx >= width or ny < 0 or ny >= height:
+                    continue
+                neighbor = current + offset
+                if not walkable[neighbor]:
+                    continue
+
+                tentative_g = current_g + move_cost
+                if tentative_g < g_score[neighbor]:
+                    g_score[neighbor] = tentative_g
+                    parent[neighbor] = current
+                    # g 值变小时重新打开该节点
+                    closed[neighbor] = 0
+
+                    delta_x = abs(nx - goal_x)
+                    delta_y = abs(ny - goal_y)
+                    new_f = tentative_g + (delta_x + delta_y + OCTILE_K * min(delta_x, delta_y))
+                    heappush(open_set, (new_f, neighbor))
+
+        # 循环结束仍未找到终点
+        self.expanded = expanded
+        return None
+
+
+class WeightedAStarSearch(GridSearch):
+    """
+    带格子代价系数的 A* 内核
+    进入格子时的移动代价乘以该格子的系数 (>= 1)，例如离墙越近系数越大，路线会尽量走在通道中间
+    系数不小于 1 时对角距离启发函数仍然可采纳，结果是加权代价下的最短路径
+    """
+
+    def __init__(self, walkable, width: int, height: int, cell_cost):
+        """
+        :param cell_cost: 展平后的格子代价系数 (array('d') 或同类序列)，下标与 walkable 相同
+        """
+        super().__init__(walkable, width, height)
+        self.cell_cost = cell_cost
+
+    def search(self, start: int, goal: int) -> Optional[List[int]]:
+        """
+        :param start: 起点编号
+        :param goal: 终点编号
+        :return: 路径上的节点编号列表，找不到路径返回 None
+        """
+        walkable, cell_cost = self.walkable, self.cell_cost
+        width, height = self.width, self.height
+        moves = self.moves
+        goal_x, goal_y = divmod(goal, height)
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        g_score = array('d', [INF]) * self.size
+        parent = array('i', [-1]) * self.size
+        closed = bytearray(self.size)
+
+        g_score[start] = 0.0
+        open_set = [(0, start)]
+        expanded = 0
+        check_at = self._check_budget(0)
+
+        while open_set:
+            current_f, current = heappop(open_set)
+
+            if current == goal:
+                self.expanded = expanded
+                self.cost = g_score[current]
+                return self._reconstruct(parent, current)
+
+            if closed[current]:
+                continue
+            closed[current] = 1
+            expanded += 1
+            if expanded >= check_at:
+                check_at = self._check_budget(expanded)
+
+            gx, gy = divmod(current, height)
+            current_g = g_score[current]
+
+            for dx, dy, offset, move_cost in moves:
+                nx = gx + dx
+                ny = gy + dy
+                if nx < 0 or nx >= width or ny < 0 or ny >= height:
+                    continue
+                neighbor = current + offset
+                if not walkable[neighbor]:
+                    continue
+
+                tentative_g = current_g + move_cost * cell_cost[neighbor]
+                if tentative_g < g_score[neighbor]:
+                    g_score[neighbor] = tentative_g
+                    parent[neighbor] = current
+                    closed[neighbor] = 0
+
+                    delta_x = abs(nx - goal_x)
+                    delta_y = abs(ny - goal_y)
+                    heappush(open_set, (tentative_g + (delta_x + delta_y + OCTILE_K * min(delta_x, delta_y)),
+                                        neighbor))
+
+        self.expanded = expanded
+        return None
+
+
+class JumpPointSearch(GridSearch):
+    """
+    跳点搜索 (Jump Point Search) 内核
+    适用于代价均匀的 8 连通网格：沿直线/对角线方向连续“跳跃”，只把转折处的跳点放入开放列表，
+    跳过大量对称路径上的中间节点。邻居模型与 AStarSearch 相同 (对角线只要求目标格可走)，路径代价一致
+    """
+
+    def __init__(self, walkable, width: int, height: int):
+        super().__init__(walkable, width, height)
+        # 跳跃时逐格扫描，外面包一圈不可走的格子，省去每一步的越界判断
+        # 扩边后格子 (gx, gy) 的下标为 (gx + 1) * stride + gy + 1
+        self.stride = height + 2
+        padded = np.zeros((width + 2, height + 2), dtype=np.uint8)
+        padded[1:-1, 1:-1] = np.frombuffer(walkable, dtype=np.uint8).reshape(width, height)
+        self.padded = padded.tobytes()
+
+    def search(self, start: int, goal: int) -> Optional[List[int]]:
+        """
+        :param start: 起点编号
+        :param goal: 终点编号
+        :return: 路径上的节点编号列表 (逐格展开)，找不到路径返回 None
+        """
+        height = self.height
+        goal_x, goal_y = divmod(goal, height)
+        goal_p = self._to_padded(goal)
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        # 1. 预分配缓冲区 (父节点只记录跳点)
+        g_score = array('d', [INF]) * self.size
+        parent = array('i', [-1]) * self.size
+        closed = bytearray(self.size)
+
+        g_score[start] = 0.0
+        open_set = [(0, start)]
+        expanded = 0
+        check_at = self._check_budget(0)
+
+        # 2. 主循环
+        while open_set:
+            current_f, current = heappop(open_set)
+
+            if current == goal:
+                self.expanded = expanded
+                self.cost = g_score[current]
+                return self._expand_path(self._reconstruct(parent, current))
+
+            if closed[current]:
+                continue
+            closed[current] = 1
+            expanded += 1
+            if expanded >= check_at:
+                check_at = self._check_budget(expanded)
+
+            current_g = g_score[current]
+            current_p = self._to_padded(current)
+
+            # 3. 按前进方向剪枝后，沿每个方向跳跃，找到下一个跳点
+            for dx, dy in self._pruned_directions(current, parent[current]):
+                jump_p = self._jump(current_p, dx, dy, goal_p)
+                if jump_p == -1:
+                    continue
+                jump_point = self._from_padded(jump_p)
+
+                # 跳跃只沿单一直线或对角线方向，两点间的代价就是对角距离
+                tentative_g = current_g + self.octile(current, jump_point)
+                if tentative_g < g_score[jump_point]:
+                    g_score[jump_point] = tentative_g
+                    parent[jump_point] = current
+                    closed[jump_point] = 0
+
+                    jx, jy = divmod(jump_point, height)
+                    delta_x = abs(jx - goal_x)
+                    delta_y = abs(jy - goal_y)
+                    new_f = tentative_g + (delta_x + delta_y + OCTILE_K * min(delta_x, delta_y))
+                    heappush(open_set, (new_f, jump_point))
+
+        self.expanded = expanded
+        return None
+
+    def _to_padded(self, node_id: int) -> int:
+        gx, gy = divmod(node_id, self.height)
+        return (gx + 1) * self.stride + gy + 1
+
+    def _from_padded(self, padded_id: int) -> int:
+        px, py = divmod(padded_id, self.stride)
+        return (px - 1) * self.height + py - 1
+
+    def _pruned_directions(self, node_id: int, parent_id: int) -> List[Tuple[int, int]]:
+        """
+        邻居剪枝：只保留自然邻居和强迫邻居所在的方向
+        起点没有父节点，8 个方向都要搜索
+        """
+        if parent_id == -1:
+            return [(dx, dy) for dx, dy, _, _ in self.moves]
+
+        free = self.padded
+        stride = self.stride
+        gx, gy = divmod(node_id, self.height)
+        px, py = divmod(parent_id, self.height)
+        dx = (gx > px) - (gx < px)
+        dy = (gy > py) - (gy < py)
+        p = (gx + 1) * stride + gy + 1
+        directions = []
+
+        if dx and dy:
+            # A. 对角线方向：两个分量方向 + 对角线本身，外加被障碍挡出的强迫邻居
+            directions.append((0, dy))
+            directions.append((dx, 0))
+            directions.append((dx, dy))
+            if not free[p - dx * stride]:
+                directions.append((-dx, dy))
+            if not free[p - dy]:
+                directions.append((dx, -dy))
+        elif dx:
+            # B. 水平方向
+            directions.append((dx, 0))
+            if not free[p + 1]:
+                directions.append((dx, 1))
+            if not free[p - 1]:
+                directions.append((dx, -1))
+        else:
+            # C. 竖直方向
+            directions.append((0, dy))
+            if not free[p + stride]:
+                directions.append((1, dy))
+            if not free[p - stride]:
+                directions.append((-1, dy))
+
+        return directions
+
+    def _jump(self, p: int, dx: int, dy: int, goal_p: int) -> int:
+        """
+        从扩边下标 p 沿 (dx, dy) 方向跳跃
+        :return: 跳点的扩边下标，途中撞墙或出界返回 -1
+        """
+        if dx and dy:
+            return self._jump_diagonal(p, dx, dy, goal_p)
+        return self._jump_straight(p, dx, dy, goal_p)
+
+    def _jump_straight(self, p: int, dx: int, dy: int, goal_p: int) -> int:
+        free = self.padded
+        stride = self.stride
+        step = dx * stride + dy
+        # 与前进方向垂直的两侧偏移
+        side = 1 if dx else stride
+        while True:
+            p += step
+            if not free[p]:
+                return -1
+            if p == goal_p:
+                return p
+
+            # 侧面的障碍物在前方让出了通道 -> 出现强迫邻居，当前格子是跳点
+            if (free[p + step + side] and not free[p + side]) or (free[p + step - side] and not free[p - side]):
+                return p
+
+    def _jump_diagonal(self, p: int, dx: int, dy: int, goal_p: int) -> int:
+        free = self.padded
+        x_step = dx * self.stride
+        step = x_step + dy
+        while True:
+            p += step
+            if not free[p]:
+                return -1
+            if p == goal_p:
+                return p
+
+            if (free[p - x_step + dy] and not free[p - x_step]) or (free[p + x_step - dy] and not free[p - dy]):
+                return p
+
+            # 沿两个分量方向能跳到跳点时，当前格子也是跳点
+            if self._jump_straight(p, dx, 0, goal_p) != -1 or self._jump_straight(p, 0, dy, goal_p) != -1:
+                return p
+
+    def _expand_path(self, jump_points: List[int]) -> List[int]:
+        """把相邻跳点之间的直线/对角线段逐格展开，输出与 A* 相同粒度的路径"""
+        height = self.height
+        path = jump_points[:1]
+        for node_a, node_b in zip(jump_points, jump_points[1:]):
+            ax, ay = divmod(node_a, height)
+            bx, by = divmod(node_b, height)
+            step = ((bx > ax) - (bx < ax)) * height + ((by > ay) - (by < ay))
+            for _ in range(max(abs(bx - ax), abs(by - ay))):
+                path.append(path[-1] + step)
+        return path
+
+
+class BidirectionalAStarSearch(GridSearch):
+    """
+    双向 A* 搜索内核
+    从起点和终点同时搜索，每次扩展开放列表较小的一侧，两侧相遇时记录当前最优路径代价 mu
+    两侧使用平均势函数 p(v) = (h_终点(v) - h_起点(v)) / 2 (正向 g + p，反向 g - p)，
+    这样两侧的约化边权一致且非负，可以使用 “两侧堆顶之和 >= mu” 的相遇终止条件，结果最优
+    终点位于封闭区域时，反向搜索从区域内部往外找，避免正向搜索淹没整个开阔区域
+    """
+
+    def search(self, start: int, goal: int) -> Optional[List[int]]:
+        """
+        :param start: 起点编号
+        :param goal: 终点编号
+        :return: 路径上的节点编号列表，找不到路径返回 None
+        """
+        if start == goal:
+            self.expanded, self.cost = 0, 0.0
+            return [start]
+
+        walkable = self.walkable
+        width, height = self.width, self.height
+        moves = self.moves
+        start_x, start_y = divmod(start, height)
+        goal_x, goal_y = divmod(goal, height)
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        def potential(nx, ny):
+            """平均势函数：(到终点的对角距离 - 到起点的对角距离) / 2"""
+            to_goal_x, to_goal_y = abs(nx - goal_x), abs(ny - goal_y)
+            to_start_x, to_start_y = abs(nx - start_x), abs(ny - start_y)
+            return (to_goal_x + to_goal_y + OCTILE_K * min(to_goal_x, to_goal_y)
+                    - to_start_x - to_start_y - OCTILE_K * min(to_start_x, to_start_y)) * 0.5
+
+        # 1. 正向、反向各一套缓冲区，下标 0 为正向，1 为反向；反向的势函数取负
+        g_scores = (array('d', [INF]) * self.size, array('d', [INF]) * self.size)
+        parents = (array('i', [-1]) * self.size, array('i', [-1]) * self.size)
+        closed = (bytearray(self.size), bytearray(self.size))
+        signs = (1.0, -1.0)
+        open_sets = ([(potential(start_x, start_y), start)], [(-potential(goal_x, goal_y), goal)])
+        g_scores[0][start] = 0.0
+        g_scores[1][goal] = 0.0
+
+        best_cost = INF
+        meeting = -1
+        expanded = 0
+        check_at = self._check_budget(0)
+
+        # 2. 主循环：两侧堆顶之和不小于 mu 时，不可能再找到更短的路径
+        while open_sets[0] and open_sets[1]:
+            if open_sets[0][0][0] + open_sets[1][0][0] >= best_cost:
+                break
+
+            side = 0 if len(open_sets[0]) <= len(open_sets[1]) else 1
+            open_set = open_sets[side]
+            g_score, parent, side_closed = g_scores[side], parents[side], closed[side]
+            other_g = g_scores[1 - side]
+            sign = signs[side]
+
+            current_f, current = heappop(open_set)
+            if side_closed[current]:
+                continue
+            side_closed[current] = 1
+            expanded += 1
+            if expanded >= check_at:
+                check_at = self._check_budget(expanded)
+
+            gx, gy = divmod(current, height)
+            current_g = g_score[current]
+
+            for dx, dy, offset, move_cost in moves:
+                nx = gx + dx
+                ny = gy + dy
+                if nx < 0 or nx >= width or ny < 0 or ny >= height:
+                    continue
+                neighbor = current + offset
+                if not walkable[neighbor]:
+                    continue
+
+                tentative_g = current_g + move_cost
+                if tentative_g < g_score[neighbor]:
+                    g_score[neighbor] = tentative_g
+                    parent[neighbor] = current
+                    side_closed[neighbor] = 0
+
+                    # 另一侧已经到过这个格子：两侧在此相遇，尝试更新 mu
+                    if tentative_g + other_g[neighbor] < best_cost:
+                        best_cost = tentative_g + other_g[neighbor]
+                        meeting = neighbor
+
+                    heappush(open_set, (tentative_g + sign * potential(nx, ny), neighbor))
+
+        self.expanded = expanded
+        if meeting == -1:
+            return None
+
+        # 3. 相遇点分别回溯到起点和终点
+        self.cost = best_cost
+        forward = self._reconstruct(parents[0], meeting)
+        backward = self._reconstruct(parents[1], meeting)
+        return forward + backward[-2::-1]
+
+
+class DijkstraSearch(GridSearch):
+    """
+    一对多搜索内核：从起点出发做一次均匀代价扩散 (Dijkstra)，同时求出到多个目标的最短距离
+    目标可以由多个格子组成 (例如商铺四周的可走格子)，其中任一格子被确定最短距离即视为到达
+    起点也可以是一组格子 (多源扩散)，所有起点的初始代价都为 0
+    """
+
+    def __init__(self, walkable, width: int, height: int):
+        super().__init__(walkable, width, height)
+        self.g_score = None
+        self.parent = None
+
+    def search(self, start, goals: Dict[int, List[int]]) -> Dict[int, Tuple[int, float]]:
+        """
+        :param start: 起点编号，或多个起点编号组成的列表
+        :param goals: 格子编号 -> 该格子所属的目标序号列表
+        :return: 目标序号 -> (最先到达的格子编号, 代价)，不可达的目标不出现在结果中
+        """
+        walkable = self.walkable
+        width, height = self.width, self.height
+        moves = self.moves
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        g_score = array('d', [INF]) * self.size
+        parent = array('i', [-1]) * self.size
+        closed = bytearray(self.size)
+        self.g_score, self.parent = g_score, parent
+
+        remaining = {group for groups in goals.values() for group in groups}
+        reached = {}
+        sources = [start] if isinstance(start, int) else list(start)
+        open_set = []
+        for source in sources:
+            g_score[source] = 0.0
+            open_set.append((0.0, source))
+        heapq.heapify(open_set)
+        expanded = 0
+        check_at = self._check_budget(0)
+
+        while open_set and remaining:
+            current_g, current = heappop(open_set)
+            if closed[current]:
+                continue
+            closed[current] = 1
+            expanded += 1
+            if expanded >= check_at:
+                check_at = self._check_budget(expanded)
+
+            # 出队即确定最短距离，第一次碰到某个目标的格子时记录下来
+            for group in goals.get(current, ()):
+                if group in remaining:
+                    remaining.discard(group)
+                    reached[group] = (current, current_g)
+
+            gx, gy = divmod(current, height)
+            for dx, dy, offset, move_cost in moves:
+                nx = gx + dx
+                ny = gy + dy
+                if nx < 0 or nx >= width or ny < 0 or ny >= height:
+                    continue
+                neighbor = current + offset
+                if not walkable[neighbor] or closed[neighbor]:
+                    continue
+
+                tentative_g = current_g + move_cost
+                if tentative_g < g_score[neighbor]:
+                    g_score[neighbor] = tentative_g
+                    parent[neighbor] = current
+                    heappush(open_set, (tentative_g, neighbor))
+
+        self.expanded = expanded
+        return reached
+
+    def path_to(self, node_id: int) -> List[int]:
+        """回溯上一次搜索中起点到 node_id 的路径，node_id 必须是已到达的格子"""
+        return self._reconstruct(self.parent, node_id)
+
+
+class WaveExpansion:
+    """
+    有界波前扩散 (等时圈 / 可达范围)
+    整张网格的 8 邻接关系预先转成稀疏矩阵 (每个地图版本一次，挂在缓存的 GridSystem 上)，
+    每次请求只调用一次 scipy 的 Dijkstra (C 实现，带距离上限)，得到每个格子到起点的步行距离
+    """
+
+    def __init__(self, walkable, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.graph = self._build_graph(
+            np.frombuffer(walkable, dtype=np.uint8).reshape(width, height).astype(bool), width, height
+        )
+
+    @classmethod
+    def for_grid(cls, grid):
+        """按导航网格创建 (邻接矩阵随网格缓存)"""
+        return grid.derived('wave_expansion', lambda: cls(grid.walkable_flat(), grid.width, grid.height))
+
+    @staticmethod
+    def _build_graph(mask: np.ndarray, width: int, height: int) -> csr_matrix:
+        """两端都可走的相邻格子之间连边，代价与 GridSearch 的移动代价相同 (直行 1，斜行 √2)"""
+        ids = np.arange(width * height, dtype=np.int32).reshape(width, height)
+        rows, cols, weights = [], [], []
+        for dx, dy, cost in ((0, 1, 1.0), (0, -1, 1.0), (1, 0, 1.0), (-1, 0, 1.0),
+                             (1, 1, SQRT2), (1, -1, SQRT2), (-1, 1, SQRT2), (-1, -1, SQRT2)):
+            # 源格子窗口与平移 (dx, dy) 后的目标格子窗口
+            src = (slice(max(-dx, 0), width - max(dx, 0)), slice(max(-dy, 0), height - max(dy, 0)))
+            dst = (slice(max(dx, 0), width - max(-dx, 0)), slice(max(dy, 0), height - max(-dy, 0)))
+            both = mask[src] & mask[dst]
+            rows.append(ids[src][both])
+            cols.append(ids[dst][both])
+            weights.append(np.full(int(both.sum()), cost))
+        size = width * height
+        return csr_matrix((np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(size, size))
+
+    def expand(self, sources: List[int], limit: float) -> np.ndarray:
+        """
+        :param sources: 起点格子编号 (多个起点时取到最近起点的距离)
+        :param limit: 距离上限 (格子数)，超出上限的格子不再扩散
+        :return: 形状为 (width, height) 的距离矩阵 (格子数)，不可达或超出上限为 inf
+        """
+        distances = dijkstra(self.graph, directed=True, indices=list(sources), limit=limit, min_only=True)
+        return distances.reshape(self.width, self.height)
+
+    def expand_with_paths(self, sources: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        不限距离的多源扩散，同时返回最短路径树
+        :return: (展平的距离数组 (格子数), 前驱数组)，前驱为负数表示起点或不可达
+        """
+        distances, predecessors, _ = dijkstra(self.graph, directed=True, indices=list(sources),
+                                              return_predecessors=True, min_only=True)
+        return distances, predecessors
+
+    @staticmethod
+    def path_to(predecessors: np.ndarray, node_id: int) -> List[int]:
+        """沿前驱数组回溯到起点，返回起点到 node_id 的格子编号序列"""
+        path = [node_id]
+        while predecessors[path[-1]] >= 0:
+            path.append(int(predecessors[path[-1]]))
+        return path[::-1]
+
+
+class PathSmoother:
+    """
+    路径平滑 (String Pulling)
+    网格路径每个格子一个顶点，呈锯齿状；从锚点出发尽量向后“拉直”，
+    只在视线被障碍物挡住时保留转折点
+    """
+
+    def __init__(self, walkable, width: int, height: int):
+        """
+        :param walkable: 展平后的可行走数组，格子 (gx, gy) 的下标为 gx * height + gy
+        """
+        self.walkable = walkable
+        self.width = width
+        self.height = height
+
+    def line_of_sight(self, cell_a: Tuple[int, int], cell_b: Tuple[int, int]) -> bool:
+        """
+        判断两个格子中心的连线是否只经过可行走格子
+        按 supercover 方式遍历线段经过的所有格子；线段恰好穿过格点时，两侧的格子都必须可走 (保守判断)
+        """
+        walkable, height = self.walkable, self.height
+        x, y = cell_a
+        nx, ny = abs(cell_b[0] - x), abs(cell_b[1] - y)
+        sx = 1 if cell_b[0] > x else -1
+        sy = 1 if cell_b[1] > y else -1
+        ix = iy = 0
+
+        while ix < nx or iy < ny:
+            # 比较下一次穿过竖直网格线与水平网格线的先后
+            decision = (1 + 2 * ix) * ny - (1 + 2 * iy) * nx
+            if decision == 0:
+                if not walkable[(x + sx) * height + y] or not walkable[x * height + y + sy]:
+                    return False
+                x += sx
+                y += sy
+                ix += 1
+                iy += 1
+            elif decision < 0:
+                x += sx
+                ix += 1
+            else:
+                y += sy
+                iy += 1
+
+            if not walkable[x * height + y]:
+                return False
+        return True
+
+    def smooth(self, path: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """
+        :param path: 逐格的网格路径
+        :return: 只包含起点、真实转折点和终点的路径
+        """
+        if len(path) <= 2:
+            return list(path)
+
+        smoothed = [path[0]]
+        anchor = path[0]
+        for i in range(1, len(path) - 1):
+            # 锚点看不到下一个格子时，当前格子就是必须保留的转折点
+            if not self.line_of_sight(anchor, path[i + 1]):
+                anchor = path[i]
+                smoothed.append(anchor)
+        smoothed.append(path[-1])
+        return smoothed
+
+
+class HierarchicalGraph:
+    """
+    分层寻路 (HPA*) 的抽象图
+    网格被切成 cluster_size x cluster_size 的簇，相邻簇的公共边界上选出入口格子作为抽象节点：
+    - 簇间边：边界两侧一对相邻的入口格子，代价 1
+    - 簇内边：同一簇内两个入口之间、只在簇内行走的最短距离 (scipy 稀疏图 Dijkstra 预计算)
+    每个地图版本只构建一次 (挂在缓存的 GridSystem 上)
+    """
+
+    def __init__(self, walkable, width: int, height: int, cluster_size: int = 32):
+        self.walkable = walkable
+        self.width = width
+        self.height = height
+        self.cluster_size = cluster_size
+        self.mask = np.frombuffer(walkable, dtype=np.uint8).reshape(width, height).astype(bool)
+        self.clusters_x = -(-width // cluster_size)
+        self.clusters_y = -(-height // cluster_size)
+
+        # 抽象节点 (格子编号) -> [(相邻节点, 代价)]
+        self.edges: Dict[int, List[Tuple[int, float]]] = {}
+        # 簇 (cx, cy) -> 簇内的抽象节点
+        self.cluster_nodes: Dict[Tuple[int, int], List[int]] = {}
+
+        self._build_entrances()
+        self._build_intra_edges()
+
+    def cluster_of(self, node_id: int) -> Tuple[int, int]:
+        gx, gy = divmod(node_id, self.height)
+        return gx // self.cluster_size, gy // self.cluster_size
+
+    def cluster_window(self, cluster: Tuple[int, int]) -> Tuple[int, int, int, int]:
+        """簇覆盖的格子范围 (min_gx, max_gx, min_gy, max_gy)，左闭右开"""
+        size = self.cluster_size
+        min_gx, min_gy = cluster[0] * size, cluster[1] * size
+        return min_gx, min(min_gx + size, self.width), min_gy, min(min_gy + size, self.height)
+
+    def _add_node(self, node_id: int):
+        if node_id not in self.edges:
+            self.edges[node_id] = []
+            self.cluster_nodes.setdefault(self.cluster_of(node_id), []).append(node_id)
+
+    def _add_edge(self, node_a: int, node_b: int, cost: float):
+        self.edges[node_a].append((node_b, cost))
+        self.edges[node_b].append((node_a, cost))
+
+    def _build_entrances(self):
+        """扫描相邻簇的公共边界，连续可通行的一段边界产生 1~2 对入口"""
+        size, height, mask = self.cluster_size, self.height, self.mask
+
+        for cx in range(self.clusters_x):
+            for cy in range(self.clusters_y):
+                min_gx, max_gx, min_gy, max_gy = self.cluster_window((cx, cy))
+                # A. 与右侧簇的竖直边界
+                if max_gx < self.width:
+                    border = mask[max_gx - 1, min_gy:max_gy] & mask[max_gx, min_gy:max_gy]
+                    for gy in self._entrance_offsets(border):
+                        self._link((max_gx - 1) * height + min_gy + gy, max_gx * height + min_gy + gy)
+                # B. 与上方簇的水平边界
+                if max_gy < self.height:
+                    border = mask[min_gx:max_gx, max_gy - 1] & mask[min_gx:max_gx, max_gy]
+                    for gx in self._entrance_offsets(border):
+                        self._link((min_gx + gx) * height + max_gy - 1, (min_gx + gx) * height + max_gy)
+
+    def _link(self, node_a: int, node_b: int):
+        self._add_node(node_a)
+        self._add_node(node_b)
+        self._add_edge(node_a, node_b, 1.0)
+
+    @staticmethod
+    def _entrance_offsets(border: np.ndarray) -> List[int]:
+        """连续可通行段：短段取中点，长段 (>= 6 格) 取两端"""
+        offsets = []
+        padded = np.concatenate(([False], border, [False]))
+        changes = np.flatnonzero(padded[1:] != padded[:-1])
+        for start, end in zip(changes[0::2], changes[1::2]):
+            last = int(end) - 1
+            if last - start + 1 < 6:
+                offsets.append((int(start) + last) // 2)
+            else:
+                offsets.extend((int(start), last))
+        return offsets
+
+    def cluster_distances(self, cluster: Tuple[int, int], sources: List[int]) -> np.ndarray:
+        """
+        只在簇内行走时，从 sources 到簇内各格子的最短距离
+        :return: 形状 (len(sources), 簇格子数) 的距离矩阵，簇内局部编号为 lx * 簇高 + ly
+        """
+        min_gx, max_gx, min_gy, max_gy = self.cluster_window(cluster)
+        window = self.mask[min_gx:max_gx, min_gy:max_gy]
+        local_width, local_height = window.shape
+        local_ids = np.arange(local_width * local_height).reshape(local_width, local_height)
+
+        # 1. 8 连通边，两端都可走才连边
+        rows, cols, costs = [], [], []
+        for dx, dy, cost in ((0, 1, 1.0), (1, 0, 1.0), (1, 1, SQRT2), (1, -1, SQRT2)):
+            src = window[max(0, -dx):local_width - max(0, dx), max(0, -dy):local_height - max(0, dy)]
+            dst = window[max(0, dx):local_width - max(0, -dx), max(0, dy):local_height - max(0, -dy)]
+            valid = src & dst
+            src_ids = local_ids[max(0, -dx):local_width - max(0, dx), max(0, -dy):local_height - max(0, dy)][valid]
+            dst_ids = local_ids[max(0, dx):local_width - max(0, -dx), max(0, dy):local_height - max(0, -dy)][valid]
+            rows.extend((src_ids, dst_ids))
+            cols.extend((dst_ids, src_ids))
+            costs.extend((np.full(len(src_ids), cost), np.full(len(src_ids), cost)))
+
+        size = local_width * local_height
+        graph = csr_matrix((np.concatenate(costs), (np.concatenate(rows), np.concatenate(cols))), shape=(size, size))
+
+        # 2. 全局编号 -> 簇内局部编号
+        local_sources = [(node // self.height - min_gx) * local_height + node % self.height - min_gy
+                         for node in sources]
+        return dijkstra(graph, directed=True, indices=local_sources)
+
+    def to_local(self, cluster: Tuple[int, int], node_id: int) -> int:
+        min_gx, max_gx, min_gy, max_gy = self.cluster_window(cluster)
+        gx, gy = divmod(node_id, self.height)
+        return (gx - min_gx) * (max_gy - min_gy) + gy - min_gy
+
+    def _build_intra_edges(self):
+        """簇内入口两两之间的距离"""
+        for cluster, nodes in self.cluster_nodes.items():
+            if len(nodes) < 2:
+                continue
+            distances = self.cluster_distances(cluster, nodes)
+            local = [self.to_local(cluster, node) for node in nodes]
+            for i in range(len(nodes)):
+                for j in range(i + 1, len(nodes)):
+                    cost = float(distances[i, local[j]])
+                    if cost != INF:
+                        self._add_edge(nodes[i], nodes[j], cost)
+
+
+class HierarchicalSearch(GridSearch):
+    """
+    分层寻路 (HPA*) 内核：先在抽象图上做 A*，再逐段在簇内细化成逐格路径
+    路径是近似最优的；起终点相距不到两个簇、或抽象图上找不到路径 (只能斜穿簇角) 时退回普通 A*
+    """
+
+    # 簇边长 (格子数)
+    CLUSTER_SIZE = 32
+    # 结果不保证最优，benchmark 中只统计代价偏差
+    optimal = False
+
+    def __init__(self, walkable, width: int, height: int, graph: Optional[HierarchicalGraph] = None):
+        super().__init__(walkable, width, height)
+        self.graph = graph or HierarchicalGraph(walkable, width, height, self.CLUSTER_SIZE)
+
+    @classmethod
+    def for_grid(cls, grid):
+        # 抽象图随网格一起缓存，同一地图版本只构建一次
+        graph = grid.derived(('hpa', cls.CLUSTER_SIZE), lambda: HierarchicalGraph(
+            grid.walkable_flat(), grid.width, grid.height, cls.CLUSTER_SIZE
+        ))
+        return cls(grid.walkable_flat(), grid.width, grid.height, graph)
+
+    def search(self, start: int, goal: int) -> Optional[List[int]]:
+        """
+        :param start: 起点编号
+        :param goal: 终点编号
+        :return: 路径上的节点编号列表 (逐格展开)，找不到路径返回 None
+        """
+        graph = self.graph
+        start_cluster, goal_cluster = graph.cluster_of(start), graph.cluster_of(goal)
+
+        # 1. 近距离直接走普通 A*
+        if max(abs(start_cluster[0] - goal_cluster[0]), abs(start_cluster[1] - goal_cluster[1])) <= 1:
+            return self._flat_search(start, goal)
+
+        # 2. 把起点、终点临时接入抽象图
+        extra_edges = {start: self._connect(start, start_cluster), goal: []}
+        for node, cost in self._connect(goal, goal_cluster):
+            extra_edges.setdefault(node, []).append((goal, cost))
+
+        # 3. 抽象图 A*
+        abstract_path = self._abstract_search(start, goal, extra_edges)
+        if abstract_path is None:
+            return self._flat_search(start, goal)
+
+        # 4. 细化：簇间边本身就是相邻格子，簇内边在簇窗口里做局部 A*
+        path = [start]
+        expanded = self.expanded
+        for node_a, node_b in zip(abstract_path, abstract_path[1:]):
+            if graph.cluster_of(node_a) != graph.cluster_of(node_b):
+                path.append(node_b)
+                continue
+            segment = self._cluster_search(node_a, node_b)
+            expanded += segment[1]
+            path.extend(segment[0][1:])
+
+        self.expanded = expanded
+        return path
+
+    def _connect(self, node_id: int, cluster: Tuple[int, int]) -> List[Tuple[int, float]]:
+        """起点/终点到所在簇各入口的簇内距离"""
+        nodes = self.graph.cluster_nodes.get(cluster, [])
+        if not nodes:
+            return []
+        distances = self.graph.cluster_distances(cluster, [node_id])[0]
+        edges = []
+        for node in nodes:
+            cost = float(distances[self.graph.to_local(cluster, node)])
+            if cost != INF:
+                edges.append((node, cost))
+        return edges
+
+    def _abstract_search(self, start: int, goal: int, extra_edges: Dict[int, List[Tuple[int, float]]]) \
+            -> Optional[List[int]]:
+        height = self.height
+        goal_x, goal_y = divmod(goal, height)
+        edges = self.graph.edges
+        g_score = {start: 0.0}
+        parent = {start: -1}
+        closed = set()
+        open_set = [(0.0, start)]
+        expanded = 0
+        check_at = self._check_budget(0)
+
+        while open_set:
+            current_f, current = heapq.heappop(open_set)
+            if current == goal:
+                self.expanded = expanded
+                self.cost = g_score[goal]
+                return self._reconstruct(parent, goal)
+            if current in closed:
+                continue
+            closed.add(current)
+            expanded += 1
+            if expanded >= check_at:
+                check_at = self._check_budget(expanded)
+
+            current_g = g_score[current]
+            neighbors = edges.get(current, [])
+            if current in extra_edges:
+                neighbors = neighbors + extra_edges[current]
+            for neighbor, cost in neighbors:
+                tentative_g = current_g + cost
+                if tentative_g < g_score.get(neighbor, INF):
+                    g_score[neighbor] = tentative_g
+                    parent[neighbor] = current
+                    closed.discard(neighbor)
+                    nx, ny = divmod(neighbor, height)
+                    delta_x = abs(nx - goal_x)
+                    delta_y = abs(ny - goal_y)
+                    heapq.heappush(open_set, (tentative_g + delta_x + delta_y + OCTILE_K * min(delta_x, delta_y),
+                                              neighbor))
+
+        self.expanded = expanded
+        return None
+
+    def _cluster_search(self, node_a: int, node_b: int) -> Tuple[List[int], int]:
+        """在两点所在簇的窗口内做 A*，返回 (全局编号路径, 展开节点数)"""
+        graph = self.graph
+        cluster = graph.cluster_of(node_a)
+        min_gx, max_gx, min_gy, max_gy = graph.cluster_window(cluster)
+        local_height = max_gy - min_gy
+        window = graph.mask[min_gx:max_gx, min_gy:max_gy]
+
+        local = AStarSearch(window.tobytes(), max_gx - min_gx, local_height)
+        local_path = local.search(graph.to_local(cluster, node_a), graph.to_local(cluster, node_b))
+        path = []
+        for local_id in local_path:
+            lx, ly = divmod(local_id, local_height)
+            path.append((lx + min_gx) * self.height + ly + min_gy)
+        return path, local.expanded
+
+    def _flat_search(self, start: int, goal: int) -> Optional[List[int]]:
+        search = AStarSearch(self.walkable, self.width, self.height).set_budget(self.max_expanded, self.time_limit)
+        path = search.search(start, goal)
+        self.expanded, self.cost = search.expanded, search.cost
+        return path
+
+
+class QuadtreeGraph:
+    """
+    四叉树导航图 (自适应精度)
+    在与导航网格相同的可行走矩阵上构建：完全可走的方块尽量合并成大叶子 (边长不超过 max_leaf_size)，
+    靠近障碍物边缘的地方保留细小的叶子，不可走区域 (障碍物、外轮廓外侧) 不产生任何节点
+    叶子之间共享边或角即相邻 (与网格允许对角移动一致)，边权为两个叶子中心的距离
+    叶子按 Morton (Z 序) 编码排序，格子所在的叶子用二分查找定位，不需要逐格的索引矩阵
+    """
+
+    def __init__(self, walkable, width: int, height: int, max_leaf_size: int = 16):
+        self.width = width
+        self.height = height
+        self.max_leaf_size = max_leaf_size
+        mask = np.frombuffer(walkable, dtype=np.uint8).reshape(width, height).astype(bool)
+
+        # 1. 补齐到 2 的幂次的正方形，补出来的部分视为不可走
+        side = 1
+        while side < max(width, height, 1):
+            side *= 2
+        levels = [np.zeros((side, side), dtype=bool)]
+        levels[0][:width, :height] = mask
+
+        # 2. 自底向上：上一层 2x2 全部可走的方块在这一层合并为一个可走方块
+        size = 1
+        while size < max_leaf_size and size < side:
+            n = side // size // 2
+            levels.append(levels[-1].reshape(n, 2, n, 2).all(axis=(1, 3)))
+            size *= 2
+
+        # 3. 叶子：本层可走、且所在的上一层方块不能整体合并
+        xs, ys, sizes = [], [], []
+        for level, free in enumerate(levels):
+            leaf = free.copy()
+            if level + 1 < len(levels):
+                leaf &= ~np.repeat(np.repeat(levels[level + 1], 2, axis=0), 2, axis=1)
+            bx, by = np.nonzero(leaf)
+            xs.append(bx << level)
+            ys.append(by << level)
+            sizes.append(np.full(len(bx), 1 << level))
+        xs, ys, sizes = np.concatenate(xs), np.concatenate(ys), np.concatenate(sizes)
+
+        # 4. 按 Morton 编码排序，叶子覆盖的格子在 Z 序上是连续的一段
+        codes = self._morton(xs, ys)
+        order = np.argsort(codes, kind='stable')
+        self.leaf_x = xs[order].astype(np.int32)
+        self.leaf_y = ys[order].astype(np.int32)
+        self.leaf_size = sizes[order].astype(np.int32)
+        self.codes = codes[order]
+        self.count = len(self.codes)
+
+        # 5. 邻接表 (CSR)：比较每个格子与右、上、右上、右下方向格子所属的叶子
+        labels = np.full((width, height), -1, dtype=np.int32)
+        for index in range(self.count):
+            x, y, leaf_size = self.leaf_x[index], self.leaf_y[index], self.leaf_size[index]
+            labels[x:x + leaf_size, y:y + leaf_size] = index
+        pairs = [
+            (labels[:-1, :], labels[1:, :]),
+            (labels[:, :-1], labels[:, 1:]),
+            (labels[:-1, :-1], labels[1:, 1:]),
+            (labels[:-1, 1:], labels[1:, :-1]),
+        ]
+        edge_a = np.concatenate([a.ravel() for a, _ in pairs])
+        edge_b = np.concatenate([b.ravel() for _, b in pairs])
+        keep = (edge_a >= 0) & (edge_b >= 0) & (edge_a != edge_b)
+        edge_a, edge_b = edge_a[keep], edge_b[keep]
+        edge_a, edge_b = np.concatenate((edge_a, edge_b)), np.concatenate((edge_b, edge_a))
+        edges = np.unique(edge_a.astype(np.int64) * self.count + edge_b)
+        sources, targets = np.divmod(edges, self.count)
+
+        center_x = self.leaf_x + self.leaf_size / 2
+        center_y = self.leaf_y + self.leaf_size / 2
+        weights = np.hypot(center_x[sources] - center_x[targets], center_y[sources] - center_y[targets])
+
+        # 搜索时逐个读取，转成 array 避免 NumPy 标量的开销
+        self.indptr = array('i', np.searchsorted(sources, np.arange(self.count + 1)).astype(np.int32).tobytes())
+        self.indices = array('i', targets.astype(np.int32).tobytes())
+        self.weights = array('d', weights.astype(np.float64).tobytes())
+        self.center_x = array('d', center_x.tobytes())
+        self.center_y = array('d', center_y.tobytes())
+
+    @staticmethod
+    def _morton(xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """交错 x、y 的二进制位 (x 在低位)，得到 Z 序编码"""
+        codes = np.zeros(len(xs), dtype=np.int64)
+        xs, ys = xs.astype(np.int64), ys.astype(np.int64)
+        for bit in range(31):
+            codes |= ((xs >> bit) & 1) << (2 * bit)
+            codes |= ((ys >> bit) & 1) << (2 * bit + 1)
+        return codes
+
+    def leaf_of(self, gx: int, gy: int) -> int:
+        """格子所在的叶子编号，不可走的格子返回 -1"""
+        code = int(self._morton(np.array([gx]), np.array([gy]))[0])
+        index = int(np.searchsorted(self.codes, code, side='right')) - 1
+        if index >= 0 and code < self.codes[index] + int(self.leaf_size[index]) ** 2:
+            return index
+        return -1
+
+    def crossing(self, leaf_a: int, leaf_b: int) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        """
+        相邻两个叶子之间的一对过渡格子 (a 在叶子 A 内，b 在叶子 B 内，两格相邻)
+        共享边时取公共边的中点，只共享一个角时取角上的两个格子
+        """
+        a, b = [], []
+        axes = ((self.leaf_x[leaf_a], self.leaf_x[leaf_b]), (self.leaf_y[leaf_a], self.leaf_y[leaf_b]))
+        for start_a, start_b in axes:
+            end_a, end_b = start_a + self.leaf_size[leaf_a], start_b + self.leaf_size[leaf_b]
+            low, high = max(start_a, start_b), min(end_a, end_b)
+            if low < high:
+                a.append(int((low + high - 1) // 2))
+                b.append(a[-1])
+            elif start_b >= end_a:
+                a.append(int(end_a - 1))
+                b.append(int(start_b))
+            else:
+                a.append(int(start_a))
+                b.append(int(end_b - 1))
+        return (a[0], a[1]), (b[0], b[1])
+
+    def stats(self) -> Dict[str, int]:
+        """
+        与同一楼层的均匀网格相比的规模：节点数 (格子数 vs 叶子数) 与内存占用
+        搜索缓冲区按 A* 的 g 值 (8 字节) + 父节点 (4 字节) + 关闭标记 (1 字节) 每节点 13 字节估算
+        """
+        cells = self.width * self.height
+        structure = sum(len(item) * item.itemsize for item in (
+            self.indptr, self.indices, self.weights, self.center_x, self.center_y))
+        structure += sum(item.nbytes for item in (self.leaf_x, self.leaf_y, self.leaf_size, self.codes))
+        return {
+            "grid_nodes": cells,
+            "walkable_cells": int((self.leaf_size.astype(np.int64) ** 2).sum()),
+            "leaf_nodes": self.count,
+            "leaf_edges": len(self.indices) // 2,
+            "grid_bytes": cells + cells * 13,
+            "quadtree_bytes": structure + self.count * 13,
+        }
+
+
+class QuadtreeSearch(GridSearch):
+    """
+    四叉树 A* 内核：在叶子邻接图上搜索，再把叶子序列转换为格子路径
+    大面积开阔区域只对应少数几个叶子，展开的节点数远少于逐格搜索；
+    路径经过叶子中心附近，是近似最优的，返回的是相邻叶子之间的过渡格子序列 (每段都在同一个可走方块内，可直接连线)
+    """
+
+    # 叶子的最大边长 (格子数)，过大的叶子会让中心点之间的距离偏离真实步行距离
+    MAX_LEAF_SIZE = 16
+    optimal = False
+
+    def __init__(self, walkable, width: int, height: int, graph: Optional[QuadtreeGraph] = None):
+        super().__init__(walkable, width, height)
+        self.graph = graph or QuadtreeGraph(walkable, width, height, self.MAX_LEAF_SIZE)
+
+    @classmethod
+    def for_grid(cls, grid):
+        # 四叉树随网格一起缓存，同一地图版本只构建一次
+        graph = grid.derived(('quadtree', cls.MAX_LEAF_SIZE), lambda: QuadtreeGraph(
+            grid.walkable_flat(), grid.width, grid.height, cls.MAX_LEAF_SIZE
+        ))
+        return cls(grid.walkable_flat(), grid.width, grid.height, graph)
+
+    def search(self, start: int, goal: int) -> Optional[List[int]]:
+        """
+        :param start: 起点编号
+        :param goal: 终点编号
+        :return: 路径上的格子编号列表 (相邻叶子间的过渡格子)，找不到路径返回 None
+        """
+        graph = self.graph
+        height = self.height
+        start_x, start_y = divmod(start, height)
+        goal_x, goal_y = divmod(goal, height)
+        start_leaf = graph.leaf_of(start_x, start_y)
+        goal_leaf = graph.leaf_of(goal_x, goal_y)
+        if start_leaf == -1 or goal_leaf == -1:
+            self.expanded = 0
+            return None
+
+        # 1. 叶子图上的 A*：起点叶子的代价从起点格子中心算起，启发函数为到终点的直线距离
+        indptr, indices, weights = graph.indptr, graph.indices, graph.weights
+        center_x, center_y = graph.center_x, graph.center_y
+        goal_cx, goal_cy = goal_x + 0.5, goal_y + 0.5
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        g_score = array('d', [INF]) * graph.count
+        parent = array('i', [-1]) * graph.count
+        closed = bytearray(graph.count)
+        g_score[start_leaf] = math.hypot(center_x[start_leaf] - start_x - 0.5, center_y[start_leaf] - start_y - 0.5)
+        open_set = [(0.0, start_leaf)]
+        expanded = 0
+        check_at = self._check_budget(0)
+        found = False
+
+        while open_set:
+            current_f, current = heappop(open_set)
+            if current == goal_leaf:
+                found = True
+                break
+            if closed[current]:
+                continue
+            closed[current] = 1
+            expanded += 1
+            if expanded >= check_at:
+                check_at = self._check_budget(expanded)
+
+            current_g = g_score[current]
+            for position in range(indptr[current], indptr[current + 1]):
+                neighbor = indices[position]
+                tentative_g = current_g + weights[position]
+                if tentative_g < g_score[neighbor]:
+                    g_score[neighbor] = tentative_g
+                    parent[neighbor] = current
+                    closed[neighbor] = 0
+                    heappush(open_set, (tentative_g + math.hypot(center_x[neighbor] - goal_cx,
+                                                                 center_y[neighbor] - goal_cy), neighbor))
+
+        self.expanded = expanded
+        if not found:
+            return None
+
+        # 2. 叶子序列 -> 格子序列：起点、每对相邻叶子的过渡格子、终点
+        leaves = self._reconstruct(parent, goal_leaf)
+        cells = [(start_x, start_y)]
+        for leaf_a, leaf_b in zip(leaves, leaves[1:]):
+            cells.extend(graph.crossing(leaf_a, leaf_b))
+        cells.append((goal_x, goal_y))
+
+        path = [start]
+        cost = 0.0
+        for (ax, ay), (bx, by) in zip(cells, cells[1:]):
+            if (ax, ay) == (bx, by):
+                continue
+            cost += math.hypot(bx - ax, by - ay)
+            path.append(bx * height + by)
+        self.cost = cost
+        return path
+
+
+# 可选的搜索引擎，键为请求参数 / GUIDE_ROUTE_ENGINE 配置中使用的名称
+SEARCH_ENGINES = {
+    'astar': AStarSearch,
+    'jps': JumpPointSearch,
+    'bidirectional': BidirectionalAStarSearch,
+    'hpa': HierarchicalSearch,
+    'quadtree': QuadtreeSearch,
+}
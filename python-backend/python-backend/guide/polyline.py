@@ -0,0 +1,52 @@
+from typing import List, Sequence, Tuple
+
+
+class PolylineCodec:
+    """
+    紧凑的路线编码 (与 Google Encoded Polyline 算法相同)
+    坐标按 10^precision 量化为整数 (默认 precision=2，即厘米)，相邻点取差值，
+    差值做 zigzag 变换后按 5 位一组编码成可打印字符 (每组加 63，非末组再加 0x20)
+    每个点依次编码 x、y (注意 Google 的顺序是纬度在前)
+    """
+
+    DEFAULT_PRECISION = 2
+
+    @staticmethod
+    def encode(coords: Sequence[Tuple[float, float]], precision: int = DEFAULT_PRECISION) -> str:
+        factor = 10 ** precision
+        chunks = []
+        prev_x = prev_y = 0
+        for x, y in coords:
+            # 1. 量化后与上一个点做差
+            qx, qy = int(round(x * factor)), int(round(y * factor))
+            for delta in (qx - prev_x, qy - prev_y):
+                # 2. zigzag：负数映射为奇数，最低位表示符号
+                value = ~(delta << 1) if delta < 0 else delta << 1
+                # 3. 低位在前，每 5 位一个字符
+                while value >= 0x20:
+                    chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                    value >>= 5
+                chunks.append(chr(value + 63))
+            prev_x, prev_y = qx, qy
+        return ''.join(chunks)
+
+    @staticmethod
+    def decode(text: str, precision: int = DEFAULT_PRECISION) -> List[Tuple[float, float]]:
+        factor = 10 ** precision
+        values = []
+        value = shift = 0
+        for char in text:
+            byte = ord(char) - 63
+            value |= (byte & 0x1f) << shift
+            shift += 5
+            if byte < 0x20:
+                values.append(~(value >> 1) if value & 1 else value >> 1)
+                value = shift = 0
+
+        coords = []
+        x = y = 0
+        for dx, dy in zip(values[0::2], values[1::2]):
+            x += dx
+            y += dy
+            coords.append((x / factor, y / factor))
+        return coords
@@ -0,0 +1,219 @@
+import numpy as np
+from typing import List, Optional
+
+# 矢量化结果中单个矩形多边形的 WKB 布局：字节序、类型 (3 = Polygon)、环数、点数、5 个顶点坐标
+_RECT_WKB = np.dtype([('order', 'u1'), ('type', '<u4'), ('rings', '<u4'), ('points', '<u4'), ('coords', '<f8', (10,))])
+
+
+class PolygonRasterizer:
+    """
+    辅助类：多边形栅格化引擎
+    使用扫描线 + 奇偶填充规则，一次性判断一批格子中心点是否落在多边形内
+    用来替代 “每个格子构造一个 Point 再调用 GEOS 谓词” 的逐点判断
+    反方向的矢量化 (布尔矩阵 -> 多边形) 同样整体用数组完成
+    """
+
+    # 斜边经过格子中心的判断容差 (米)，坐标较大时放宽到若干个浮点间隔
+    BOUNDARY_TOLERANCE = 1e-9
+
+    @staticmethod
+    def polygon_rings(geometry) -> Optional[List[List[np.ndarray]]]:
+        """
+        提取几何体的环坐标
+        直接解析 WKB，一次 GEOS 调用拿到全部坐标，避免逐点访问 coords
+        :return: [[外环, 内环1, ...], ...] 每个多边形一组；非面状几何返回 None
+        """
+        if geometry is None or geometry.geom_type not in ('Polygon', 'MultiPolygon'):
+            return None
+
+        buf = bytes(geometry.wkb)
+        polygons, _ = PolygonRasterizer._parse_wkb(buf, 0)
+        return [rings for rings in polygons if rings]
+
+    @staticmethod
+    def _parse_wkb(buf: bytes, offset: int):
+        """
+        解析 Polygon / MultiPolygon 的 WKB
+        :return: (多边形环坐标列表, 解析结束位置)
+        """
+        order = '<' if buf[offset] == 1 else '>'
+        geom_type = int(np.frombuffer(buf, dtype=order + 'u4', count=1, offset=offset + 1)[0])
+        offset += 5
+
+        # 兼容 EWKB 的高位标志与 ISO WKB 的千位编码
+        has_z = bool(geom_type & 0x80000000) or (geom_type & 0xFFFF) // 1000 in (1, 3)
+        has_m = bool(geom_type & 0x40000000) or (geom_type & 0xFFFF) // 1000 in (2, 3)
+        if geom_type & 0x20000000:
+            offset += 4  # 跳过 SRID
+        base_type = (geom_type & 0xFFFF) % 1000
+        dims = 2 + has_z + has_m
+
+        count = int(np.frombuffer(buf, dtype=order + 'u4', count=1, offset=offset)[0])
+        offset += 4
+
+        if base_type == 6:
+            polygons = []
+            for _ in range(count):
+                sub, offset = PolygonRasterizer._parse_wkb(buf, offset)
+                polygons.extend(sub)
+            return polygons, offset
+
+        rings = []
+        for _ in range(count):
+            n_points = int(np.frombuffer(buf, dtype=order + 'u4', count=1, offset=offset)[0])
+            offset += 4
+            coords = np.frombuffer(buf, dtype=order + 'f8', count=n_points * dims, offset=offset)
+            offset += n_points * dims * 8
+            rings.append(coords.reshape(n_points, dims)[:, :2].astype(float))
+        return [rings], offset
+
+    @staticmethod
+    def rings_extent(polygons: List[List[np.ndarray]]):
+        """由外环坐标计算外包矩形 (min_x, min_y, max_x, max_y)，与 GEOS extent 结果一致"""
+        shells = np.concatenate([rings[0] for rings in polygons])
+        min_x, min_y = shells.min(axis=0)
+        max_x, max_y = shells.max(axis=0)
+        return float(min_x), float(min_y), float(max_x), float(max_y)
+
+    @staticmethod
+    def fill(rings: List[np.ndarray], cx: np.ndarray, cy: np.ndarray, include_boundary: bool = True) -> np.ndarray:
+        """
+        对单个多边形(外环+内环)做扫描线填充
+        :param rings: 环坐标列表
+        :param cx: 格子中心点 x 坐标 (升序)
+        :param cy: 格子中心点 y 坐标 (升序)
+        :param include_boundary: True 对应 intersects 语义(边界上的点算在内)，False 对应 contains 语义
+        :return: 形状为 (len(cx), len(cy)) 的布尔矩阵
+        """
+        n_cols, n_rows = len(cx), len(cy)
+        if n_cols == 0 or n_rows == 0:
+            return np.zeros((n_cols, n_rows), dtype=bool)
+
+        # 1. 把所有环的边拼成一个 (E, 4) 数组，奇偶规则下内环会自动被“挖掉”
+        edges = np.concatenate([
+            np.column_stack((ring[:-1], ring[1:])) for ring in rings if len(ring) > 1
+        ])
+        x1, y1, x2, y2 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+
+        # 2. 每一行扫描线与每条边求交
+        # 半开规则 (y1 <= y) != (y2 <= y)：水平边不参与，顶点只被计数一次
+        row_y = cy[:, None]
+        crosses = (y1 <= row_y) != (y2 <= row_y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xs = np.where(crosses, x1 + (row_y - y1) * (x2 - x1) / (y2 - y1), np.nan)
+
+        inside = np.zeros((n_rows, n_cols), dtype=bool)
+        max_crossings = int(crosses.sum(axis=1).max())
+
+        if max_crossings:
+            # 3. 每行的交点排序后两两配对，配对区间内的格子中心就在多边形内部
+            xs.sort(axis=1)  # NaN 会被排到末尾
+            xs = xs[:, :max_crossings]
+            starts, ends = xs[:, 0::2], xs[:, 1::2]
+            valid = ~np.isnan(ends)
+            rows = np.nonzero(valid)[0]
+
+            if include_boundary:
+                lo = np.searchsorted(cx, starts[valid], side='left')
+                hi = np.searchsorted(cx, ends[valid], side='right')
+            else:
+                lo = np.searchsorted(cx, starts[valid], side='right')
+                hi = np.searchsorted(cx, ends[valid], side='left')
+            hi = np.maximum(hi, lo)
+
+            # 4. 差分数组 + 前缀和，一次性把所有区间涂满
+            diff = np.zeros((n_rows, n_cols + 1), dtype=np.int32)
+            np.add.at(diff, (rows, lo), 1)
+            np.add.at(diff, (rows, hi), -1)
+            inside = np.cumsum(diff[:, :n_cols], axis=1) > 0
+
+        # 5. 扫描线无法正确处理的边界点：水平边上的点、顶点、以及斜边恰好经过的格子中心
+        on_boundary = PolygonRasterizer._boundary_hits(rings, cx, cy)
+        if include_boundary:
+            inside |= on_boundary
+        else:
+            inside &= ~on_boundary
+
+        return inside.T
+
+    @staticmethod
+    def _boundary_hits(rings: List[np.ndarray], cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+        """
+        找出落在边界上的格子中心 (顶点、水平边、斜边)
+        斜边的交点 x 由浮点除法算出，边恰好经过格子中心时可能差一两个舍入误差，
+        因此斜边按闭区间容差判断，不依赖扫描线配对的 searchsorted 结果
+        :return: 形状为 (len(cy), len(cx)) 的布尔矩阵
+        """
+        n_cols, n_rows = len(cx), len(cy)
+        hits = np.zeros((n_rows, n_cols), dtype=bool)
+
+        for ring in rings:
+            # A. 顶点：x、y 都与格子中心完全相等
+            col = np.searchsorted(cx, ring[:, 0]).clip(0, n_cols - 1)
+            row = np.searchsorted(cy, ring[:, 1]).clip(0, n_rows - 1)
+            exact = (cx[col] == ring[:, 0]) & (cy[row] == ring[:, 1])
+            hits[row[exact], col[exact]] = True
+
+            # B. 水平边：y 与某一行完全相等，x 落在边的范围内
+            y_start, y_end = ring[:-1, 1], ring[1:, 1]
+            row = np.searchsorted(cy, y_start).clip(0, n_rows - 1)
+            horizontal = (y_start == y_end) & (cy[row] == y_start)
+            for i in np.nonzero(horizontal)[0]:
+                x_a, x_b = sorted((ring[i, 0], ring[i + 1, 0]))
+                lo = np.searchsorted(cx, x_a, side='left')
+                hi = np.searchsorted(cx, x_b, side='right')
+                hits[row[i], lo:hi] = True
+
+            # C. 斜边：扫描线交点与最近的格子中心相差不超过容差，该中心算作在边上
+            sloped = np.nonzero(y_start != y_end)[0]
+            if not len(sloped):
+                continue
+            x_a, y_a = ring[sloped, 0], y_start[sloped]
+            x_b, y_b = ring[sloped + 1, 0], y_end[sloped]
+            row_y = cy[:, None]
+            # 闭区间：端点所在的行也参与 (端点本身是顶点，已由 A 处理，这里重复标记无妨)
+            spans = (row_y >= np.minimum(y_a, y_b)) & (row_y <= np.maximum(y_a, y_b))
+            rows, edge = np.nonzero(spans)
+            if not len(rows):
+                continue
+            xs = x_a[edge] + (cy[rows] - y_a[edge]) * (x_b[edge] - x_a[edge]) / (y_b[edge] - y_a[edge])
+            right = np.searchsorted(cx, xs).clip(0, n_cols - 1)
+            left = (right - 1).clip(0, n_cols - 1)
+            col = np.where(np.abs(cx[left] - xs) < np.abs(cx[right] - xs), left, right)
+            near = np.abs(cx[col] - xs) <= np.maximum(PolygonRasterizer.BOUNDARY_TOLERANCE, 64 * np.spacing(np.abs(xs)))
+            hits[rows[near], col[near]] = True
+
+        return hits
+
+    @staticmethod
+    def mask_to_wkb(mask: np.ndarray, min_x: float, min_y: float, resolution: float) -> Optional[bytes]:
+        """
+        把格子布尔矩阵矢量化为 MultiPolygon 的 WKB
+        每一列中连续为 True 的格子合并成一个竖条矩形，调用方对结果做一次 unary_union 即可得到合并后的区域
+        :param mask: 形状为 (width, height) 的布尔矩阵
+        :return: WKB 字节串，矩阵全为 False 时返回 None
+        """
+        # 1. 按列做游程编码：差分后 +1 为一段的起点，-1 为终点 (左闭右开)
+        padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+        padded[:, 1:-1] = mask
+        diff = np.diff(padded, axis=1)
+        start_gx, start_gy = np.nonzero(diff == 1)
+        _, end_gy = np.nonzero(diff == -1)
+        if not len(start_gx):
+            return None
+
+        # 2. 每段对应一个矩形 (逆时针闭合环)
+        x0 = min_x + start_gx * resolution
+        x1 = x0 + resolution
+        y0 = min_y + start_gy * resolution
+        y1 = min_y + end_gy * resolution
+        rects = np.zeros(len(start_gx), dtype=_RECT_WKB)
+        rects['order'] = 1
+        rects['type'] = 3
+        rects['rings'] = 1
+        rects['points'] = 5
+        rects['coords'] = np.column_stack((x0, y0, x1, y0, x1, y1, x0, y1, x0, y0))
+
+        # 3. 拼上 MultiPolygon 头 (小端、类型 6、多边形个数)
+        header = np.array([(1, 6, len(rects))], dtype=[('order', 'u1'), ('type', '<u4'), ('count', '<u4')])
+        return header.tobytes() + rects.tobytes()
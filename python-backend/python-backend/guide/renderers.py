@@ -0,0 +1,12 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class PolylineJSONRenderer(JSONRenderer):
+    """
+    紧凑路线格式的 JSON 响应
+    客户端通过 Accept: application/vnd.guide.polyline+json 或查询参数 ?format=polyline 选择 (DRF 内容协商)，
+    响应体仍是 JSON，只是路线字段由 GeoJSON 换成折线编码字符串 (由视图根据 request.accepted_renderer 决定)
+    """
+
+    media_type = 'application/vnd.guide.polyline+json'
+    format = 'polyline'
@@ -1,10 +1,43 @@
-from django.contrib.gis.geos import Point, LineString, Polygon
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry, Point, LineString, Polygon
+from django.db import connection
 from typing import Tuple, List, Optional
+import json
 import math
-import heapq
+from array import array
+import logging
+import os
+import threading
+import numpy as np
+from scipy import ndimage
 
 # Context 导入
+from core.cache import LRUCache
 from guide.context import GuideContext
+from guide.closures import ClosureStore
+from guide.executor import RouteExecutor
+from guide.floors import FloorTransitionGraph
+from guide.gridfile import GridFile
+from guide.pathfinding import SEARCH_ENGINES, DijkstraSearch, PathSmoother, WaveExpansion, WeightedAStarSearch
+from guide.polyline import PolylineCodec
+from guide.raster import PolygonRasterizer
+from guide.storage import GuideDataStore
+from guide.tour import TourOptimizer
+from map.context import MapVersionContext
+
+logger = logging.getLogger(__name__)
+
+# 进程级导航网格缓存，键为 (map_id, version)
+# 楼层几何变化时版本号递增，旧版本的网格不会再被命中
+grid_cache = LRUCache(getattr(settings, 'GUIDE_GRID_CACHE_SIZE', 16))
+# 进程级楼层转换图缓存，键为 (building_id, ((map_id, version), ...))
+floor_graph_cache = LRUCache(getattr(settings, 'GUIDE_FLOOR_GRAPH_CACHE_SIZE', 8))
+# 进程级路径结果缓存，键为 (map_id, version, 起点格子, 终点格子, 引擎, 是否平滑, 净空参数, 临时封闭区域)
+# 值为路线坐标与距离，命中时不再执行搜索，按请求的格式直接输出
+route_cache = LRUCache(getattr(settings, 'GUIDE_ROUTE_CACHE_SIZE', 1024))
+# 进程级临时封闭区域叠加网格缓存，键为 (map_id, version, 封闭区域 ID 组合)
+# 与基础网格分开缓存，并发请求只经过 LRUCache 的锁，不修改共享的基础网格
+closure_overlay_cache = LRUCache(getattr(settings, 'GUIDE_CLOSURE_OVERLAY_CACHE_SIZE', 16))
 
 
 class GridSystem:
@@ -26,8 +59,43 @@ class GridSystem:
         # 计算网格系统的 x方向、 y方向各自的格子总数
         self.width = int(math.ceil((self.max_x - self.min_x) / resolution))  # 这个方法 ceil 是向上取整
         self.height = int(math.ceil((self.max_y - self.min_y) / resolution))
-        # 障碍物集合，存储不可行走的网格坐标元组 (gx, gy)
-        self.obstacles = set()
+        # 障碍物矩阵，obstacle_mask[gx, gy] 为 True 表示该格子不可行走
+        self.obstacle_mask = np.zeros((self.width, self.height), dtype=bool)
+        # 外轮廓矩阵，格子中心被外轮廓 contains 时为 True
+        self.shell_mask = self._rasterize_shell()
+        # 可行走矩阵 = 在外轮廓内 且 不是障碍物，寻路时直接查表
+        self.walkable = self.shell_mask.copy()
+        # 展平后的可行走数组缓存，供搜索内核使用
+        self._walkable_flat = None
+        # 由可行走矩阵派生的预计算结构 (如 HPA* 抽象图)，可行走矩阵变化时清空
+        self._derived = {}
+        # 进程级缓存中的键 (map_id, version)，由 RoutePlanService.get_grid 设置，多进程寻路时用来标识网格
+        self.cache_key = None
+        # 叠加的临时封闭区域 ID (基础网格为空元组)，参与路径结果缓存的键
+        self.closure_key = ()
+
+    @classmethod
+    def from_masks(cls, extent: Tuple[float, float, float, float], resolution: float,
+                   shell_mask: np.ndarray, obstacle_mask: np.ndarray, derived: Optional[dict] = None,
+                   walkable: Optional[np.ndarray] = None) -> 'GridSystem':
+        """
+        由已栅格化的外轮廓矩阵与障碍物矩阵直接恢复网格 (从网格文件加载时使用)，不需要重新栅格化几何
+        :param derived: 随文件保存的预计算结构，键与 derived() 相同
+        :param walkable: 随文件保存的可行走矩阵 (只读映射内存)，为空时由外轮廓与障碍物矩阵计算
+        """
+        grid = cls.__new__(cls)
+        grid.resolution = resolution
+        grid.boundary = None
+        grid.min_x, grid.min_y, grid.max_x, grid.max_y = extent
+        grid.width, grid.height = shell_mask.shape
+        grid.obstacle_mask = obstacle_mask
+        grid.shell_mask = shell_mask
+        grid.walkable = walkable if walkable is not None else shell_mask & ~obstacle_mask
+        grid._walkable_flat = None
+        grid._derived = dict(derived or {})
+        grid.cache_key = None
+        grid.closure_key = ()
+        return grid
 
     def world_to_grid(self, x: float, y: float) -> Tuple[int, int]:
         """将世界坐标转为网格坐标"""
@@ -41,60 +109,389 @@ class GridSystem:
         wy = self.min_y + (gy + 0.5) * self.resolution
         return wx, wy
 
+    def cell_centers(self, min_gx: int, max_gx: int, min_gy: int, max_gy: int) -> Tuple[np.ndarray, np.ndarray]:
+        """批量计算 [min_gx, max_gx) x [min_gy, max_gy) 范围内格子中心的世界坐标，与 grid_to_world 结果完全一致"""
+        cx = self.min_x + (np.arange(min_gx, max_gx) + 0.5) * self.resolution
+        cy = self.min_y + (np.arange(min_gy, max_gy) + 0.5) * self.resolution
+        return cx, cy
+
+    def _rasterize_shell(self) -> np.ndarray:
+        """一次性把外轮廓栅格化，边界上的点不算在内 (与 boundary.contains 语义一致)"""
+        polygons = PolygonRasterizer.polygon_rings(self.boundary)
+        shell_mask = np.zeros((self.width, self.height), dtype=bool)
+        if not polygons:
+            return shell_mask
+
+        cx, cy = self.cell_centers(0, self.width, 0, self.height)
+        for rings in polygons:
+            shell_mask |= PolygonRasterizer.fill(rings, cx, cy, include_boundary=False)
+        return shell_mask
+
+    def _cell_window(self, extent: Tuple[float, float, float, float]) -> Tuple[int, int, int, int]:
+        """
+        计算外包矩形（Bounding Box）覆盖的格子范围
+        :param extent: (min_x, min_y, max_x, max_y)
+        :return: (min_gx, max_gx, min_gy, max_gy)，左闭右开
+        """
+        min_x, min_y, max_x, max_y = extent
+
+        # 把这个矩形区域的四个角，转换成网格坐标
+        min_gx, min_gy = self.world_to_grid(min_x, min_y)
+        max_gx, max_gy = self.world_to_grid(max_x, max_y)
+
+        # 修正边界，防止算出负数或者超出地图宽度的索引
+        min_gx = max(0, min_gx)
+        min_gy = max(0, min_gy)
+        max_gx = min(self.width, max_gx + 1)  # +1 是为了保证循环能覆盖到边缘
+        max_gy = min(self.height, max_gy + 1)
+        return min_gx, max_gx, min_gy, max_gy
+
+    def window_extent(self, window: Tuple[int, int, int, int]) -> Tuple[float, float, float, float]:
+        """
+        格子范围 (左闭右开) 覆盖的世界坐标外包矩形 (格子边缘，而不是格子中心)
+        _cell_window 向下取整，最后一行/列格子的中心可能超出原外包矩形，需要用这个范围查询会覆盖这些格子的障碍物
+        :return: (min_x, min_y, max_x, max_y)
+        """
+        min_gx, max_gx, min_gy, max_gy = window
+        return (self.min_x + min_gx * self.resolution, self.min_y + min_gy * self.resolution,
+                self.min_x + max_gx * self.resolution, self.min_y + max_gy * self.resolution)
+
     def mark_obstacles(self, geometry_list: List[Polygon]):
         """
-        向 self.obstacles 集合中存储障碍物占据的格子坐标
-        某个障碍物占据了哪些格子
-        逆向思维：判断这个格子是否在这个障碍物多边形内
+        向 self.obstacle_mask 矩阵中标记障碍物占据的格子
+        某个障碍物占据了哪些格子：格子中心点与障碍物相交 (intersects) 即视为被占据
+        面状障碍物走 NumPy 扫描线栅格化，其余几何类型退回逐点判断
         """
         for poly in geometry_list:
-            # 1. 性能优化：不要扫描全图，只扫描障碍物所在的那个矩形区域（Bounding Box）
-            # poly.extent 返回 (min_x, min_y, max_x, max_y)
-            min_x, min_y, max_x, max_y = poly.extent
-
-            # 2. 把这个矩形区域的四个角，转换成网格坐标
-            # min_gx, min_gy 是左下角格子的索引
-            # max_gx, max_gy 是右上角格子的索引
-            min_gx, min_gy = self.world_to_grid(min_x, min_y)
-            max_gx, max_gy = self.world_to_grid(max_x, max_y)
-
-            # 3. 修正边界，防止算出负数或者超出地图宽度的索引
-            min_gx = max(0, min_gx)
-            min_gy = max(0, min_gy)
-            max_gx = min(self.width, max_gx + 1)  # +1 是为了保证循环能覆盖到边缘
-            max_gy = min(self.height, max_gy + 1)
-
-            # 4. 循环遍历这个小区域内的每一个格子
-            for gx in range(min_gx, max_gx):
-                for gy in range(min_gy, max_gy):
-                    # 算出这个格子中心点在地图上的真实坐标 (wx, wy)
-                    wx, wy = self.grid_to_world(gx, gy)
-
-                    # 创建一个临时的点对象
-                    cell_center = Point(wx, wy, srid=2385)
-
-                    # 5. 关键判断：如果这个格子的中心点碰到了障碍物，这个格子就是不可走的
-                    if poly.intersects(cell_center):
-                        self.obstacles.add((gx, gy))
+            # 1. 提取环坐标，非面状几何（点、线）无法做扫描线填充
+            polygons = PolygonRasterizer.polygon_rings(poly)
+            if polygons is None:
+                self._mark_geometry_per_point(poly)
+                continue
+            if not polygons:
+                continue
+
+            # 2. 只扫描障碍物所在的那个矩形区域（Bounding Box）
+            min_gx, max_gx, min_gy, max_gy = self._cell_window(PolygonRasterizer.rings_extent(polygons))
+            if min_gx >= max_gx or min_gy >= max_gy:
+                continue
+
+            # 3. 批量算出窗口内所有格子中心，整块填充
+            cx, cy = self.cell_centers(min_gx, max_gx, min_gy, max_gy)
+            window = self.obstacle_mask[min_gx:max_gx, min_gy:max_gy]
+            for rings in polygons:
+                window |= PolygonRasterizer.fill(rings, cx, cy, include_boundary=True)
+
+            # 4. 同步更新可行走矩阵
+            self.walkable[min_gx:max_gx, min_gy:max_gy] &= ~window
+            self._invalidate_derived()
+
+    def _mark_geometry_per_point(self, geometry):
+        """
+        逐点判断的栅格化方式：为窗口内每个格子构造 Point 并调用 GEOS intersects
+        用于非面状几何的兜底，以及 benchmark 中作为对照组
+        """
+        # poly.extent 返回 (min_x, min_y, max_x, max_y)
+        min_gx, max_gx, min_gy, max_gy = self._cell_window(geometry.extent)
+
+        # 循环遍历这个小区域内的每一个格子
+        for gx in range(min_gx, max_gx):
+            for gy in range(min_gy, max_gy):
+                # 算出这个格子中心点在地图上的真实坐标 (wx, wy)
+                wx, wy = self.grid_to_world(gx, gy)
+
+                # 创建一个临时的点对象
+                cell_center = Point(wx, wy, srid=2385)
+
+                # 关键判断：如果这个格子的中心点碰到了障碍物，这个格子就是不可走的
+                if geometry.intersects(cell_center):
+                    self.obstacle_mask[gx, gy] = True
+                    self.walkable[gx, gy] = False
+                    self._invalidate_derived()
 
     def is_walkable(self, gx: int, gy: int) -> bool:
         """检查网格点是否在地图内且不是障碍物"""
         # 1. 数组边界检查，严格小于 self.width
         if not (0 <= gx < self.width and 0 <= gy < self.height):
             return False
-        # 2. 障碍物检查
-        if (gx, gy) in self.obstacles:
-            return False
-        # 3. 地图边界检查
-        # 算出这个格子中心的真实世界坐标
-        wx, wy = self.grid_to_world(gx, gy)
-        # 构造一个临时的点对象
-        point = Point(wx, wy, srid=2385)
-        # contains() 表示如果点在多边形内部返回 True，在外部返回 False
-        if not self.boundary.contains(point):
-            return False
+        # 2. 障碍物与地图边界检查：已预先栅格化到 walkable 矩阵中
+        return bool(self.walkable[gx, gy])
 
-        return True
+    def nearest_walkable(self, gx: int, gy: int, max_radius: Optional[float] = None) -> Optional[Tuple[int, int]]:
+        """
+        找离 (gx, gy) 最近的可行走格子，查预计算的最近可走格子表，O(1)
+        (gx, gy) 可以落在网格范围之外 (如地图外轮廓外侧)，此时从最近的边缘格子开始查
+        :param max_radius: 允许的最大距离 (格子数)，为空时不限制
+        :return: 自身可走时直接返回自身；范围内没有可走格子返回 None
+        """
+        if self.is_walkable(gx, gy):
+            return gx, gy
+
+        nearest = self.derived('nearest_walkable', self._build_nearest_walkable)
+        if nearest is None:
+            return None
+
+        cx = min(max(gx, 0), self.width - 1)
+        cy = min(max(gy, 0), self.height - 1)
+        nx, ny = divmod(int(nearest[cx, cy]), self.height)
+        if max_radius is not None and (nx - gx) ** 2 + (ny - gy) ** 2 > max_radius ** 2:
+            return None
+        return nx, ny
+
+    def _build_nearest_walkable(self) -> Optional[np.ndarray]:
+        """
+        最近可走格子表：对不可走区域做欧氏距离变换，记录每个格子最近的可走格子 (扁平编号)
+        :return: 形状为 (width, height) 的 int32 矩阵；整层都不可走时返回 None
+        """
+        if not self.walkable.any():
+            return None
+        # 输入中值为 0 的位置 (可走格子) 是距离变换的“源点”，indices 给出每个格子最近的源点坐标
+        indices = ndimage.distance_transform_edt(~self.walkable, return_distances=False, return_indices=True)
+        return (indices[0] * self.height + indices[1]).astype(np.int32)
+
+    def component_labels(self) -> np.ndarray:
+        """
+        可行走格子的连通分量编号 (8 邻域，与搜索内核允许对角移动一致)，不可走格子为 0
+        随网格按地图版本缓存，每个版本只计算一次
+        """
+        return self.derived('components', lambda: ndimage.label(
+            self.walkable, structure=np.ones((3, 3), dtype=bool)
+        )[0].astype(np.int32))
+
+    def connected(self, cell_a: Tuple[int, int], cell_b: Tuple[int, int]) -> bool:
+        """两个可走格子是否在同一连通分量内，不在时两点之间一定没有路径"""
+        labels = self.component_labels()
+        return labels[cell_a] != 0 and labels[cell_a] == labels[cell_b]
+
+    def clearance(self) -> np.ndarray:
+        """
+        净空距离场：每个可走格子到最近障碍物的距离 (米)，对可走矩阵做欧氏距离变换
+        格子中心到最近不可走格子中心的距离减去半格，近似为到障碍物边界的距离；网格范围外视为障碍物
+        距离截断在 clearance_horizon()，这样障碍物变化时只需要重算附近一圈 (见 patched)
+        随网格按地图版本缓存，每个版本只计算一次
+        """
+        def build():
+            padded = np.pad(self.walkable, 1, constant_values=False)
+            return self._clearance_values(ndimage.distance_transform_edt(padded)[1:-1, 1:-1])
+
+        return self.derived('clearance', build)
+
+    @staticmethod
+    def clearance_horizon() -> float:
+        """净空距离场的上限 (米)：只用于最小净空过滤与居中代价，超出两者上限的距离没有区别"""
+        return max(getattr(settings, 'GUIDE_MAX_CLEARANCE', 2.0), getattr(settings, 'GUIDE_CENTERING_RADIUS', 2.0))
+
+    def _clearance_values(self, distance: np.ndarray) -> np.ndarray:
+        """格子中心距离 (格子数) 换算为净空 (米) 并截断"""
+        clearance = np.maximum(distance - 0.5, 0) * self.resolution
+        return np.minimum(clearance, self.clearance_horizon()).astype(np.float32)
+
+    def with_clearance(self, min_clearance: float) -> 'GridSystem':
+        """
+        只保留净空不小于 min_clearance 米的格子 (如轮椅、推车需要的半宽)，其余格子视为障碍物
+        得到的网格挂在本网格上缓存，其连通分量、最近可走格子等派生结构也随之缓存
+        """
+        min_clearance = round(float(min_clearance), 2)
+
+        def build():
+            grid = GridSystem.from_masks((self.min_x, self.min_y, self.max_x, self.max_y), self.resolution,
+                                         self.shell_mask, self.obstacle_mask | (self.clearance() < min_clearance))
+            grid.cache_key = self.variant_key('clearance', min_clearance)
+            return grid
+
+        return self.derived(('with_clearance', min_clearance), build)
+
+    def variant_key(self, *variant) -> Optional[tuple]:
+        """
+        由本网格派生的网格 (净空、临时封闭区域) 的 cache_key：(map_id, version, variant)
+        多进程寻路按 cache_key 发布共享内存；本网格未缓存 (cache_key 为空) 时返回 None
+        """
+        return None if self.cache_key is None else self.cache_key + (variant,)
+
+    def patched(self, old_obstacle=None, new_obstacle=None, nearby: Optional[List[Polygon]] = None) -> 'GridSystem':
+        """
+        单个障碍物 (商铺、活动区域、设施等) 修改后的网格，不需要整层重新栅格化
+        本网格保持不变 (正在进行的搜索仍使用旧版本)，返回一份修改后的副本：
+        1. 清空旧几何外包窗口内的障碍物标记，重新标记与窗口相交的障碍物 (nearby)
+        2. 标记新几何
+        3. 净空距离场、最近可走格子表只在修改窗口附近重算；连通分量是全局性质，留给下次使用时整体重算 (毫秒级)
+        其余派生结构 (HPA* 抽象图、四叉树等) 不复制，使用时重新构建
+        :param old_obstacle: 修改前的障碍物几何，None 表示新增
+        :param new_obstacle: 修改后的障碍物几何，None 表示删除
+        :param nearby: 外包矩形与 old_obstacle 所在格子窗口 (window_extent(_cell_window(old_obstacle.extent))) 相交的
+                       全部障碍物 (修改后的状态)；窗口按格子边缘计算，比 old_obstacle 的外包矩形略大
+        """
+        grid = GridSystem.from_masks((self.min_x, self.min_y, self.max_x, self.max_y), self.resolution,
+                                     self.shell_mask, self.obstacle_mask.copy())
+        windows = []
+
+        # 1. 旧几何所在窗口先清空再重新标记
+        if old_obstacle is not None:
+            min_gx, max_gx, min_gy, max_gy = self._cell_window(old_obstacle.extent)
+            if min_gx < max_gx and min_gy < max_gy:
+                grid.obstacle_mask[min_gx:max_gx, min_gy:max_gy] = False
+                grid.walkable[min_gx:max_gx, min_gy:max_gy] = self.shell_mask[min_gx:max_gx, min_gy:max_gy]
+                grid.mark_obstacles(nearby or [])
+                windows.append((min_gx, max_gx, min_gy, max_gy))
+
+        # 2. 新几何
+        if new_obstacle is not None:
+            grid.mark_obstacles([new_obstacle])
+            windows.append(self._cell_window(new_obstacle.extent))
+
+        # 3. 派生表局部更新
+        derived = {}
+        windows = [window for window in windows if window[0] < window[1] and window[2] < window[3]]
+        clearance = self._derived.get('clearance')
+        if clearance is not None:
+            derived['clearance'] = grid._patch_clearance(np.array(clearance), windows)
+        nearest = self._derived.get('nearest_walkable')
+        if nearest is not None:
+            nearest = grid._patch_nearest_walkable(np.array(nearest), windows)
+            if nearest is not None:
+                derived['nearest_walkable'] = nearest
+        grid._derived = derived
+        return grid
+
+    def _expand_window(self, window: Tuple[int, int, int, int], margin: int) -> Tuple[int, int, int, int]:
+        min_gx, max_gx, min_gy, max_gy = window
+        return (max(min_gx - margin, 0), min(max_gx + margin, self.width),
+                max(min_gy - margin, 0), min(max_gy + margin, self.height))
+
+    def _patch_clearance(self, clearance: np.ndarray, windows: List[Tuple[int, int, int, int]]) -> np.ndarray:
+        """
+        局部更新净空距离场
+        距离场截断在 horizon，修改窗口外扩 horizon 以外的格子不受影响；
+        在外扩两倍 horizon 的范围内做距离变换，外扩一倍范围内的结果是准确的
+        """
+        margin = int(math.ceil(self.clearance_horizon() / self.resolution)) + 1
+        padded = np.pad(self.walkable, 1, constant_values=False)
+        for window in windows:
+            r_x0, r_x1, r_y0, r_y1 = self._expand_window(window, margin)
+            w_x0, w_x1, w_y0, w_y1 = self._expand_window(window, 2 * margin)
+            # padded 中格子 (gx, gy) 位于 (gx + 1, gy + 1)，多取一圈作为窗口外的边界
+            sub = padded[w_x0:w_x1 + 2, w_y0:w_y1 + 2]
+            if sub.all():
+                # 窗口内没有障碍物：外扩一倍范围内的格子净空都超过 horizon
+                values = np.full((w_x1 - w_x0, w_y1 - w_y0), self.clearance_horizon(), dtype=np.float32)
+            else:
+                values = self._clearance_values(ndimage.distance_transform_edt(sub)[1:-1, 1:-1])
+            clearance[r_x0:r_x1, r_y0:r_y1] = values[r_x0 - w_x0:r_x1 - w_x0, r_y0 - w_y0:r_y1 - w_y0]
+        return clearance
+
+    def _patch_nearest_walkable(self, nearest: np.ndarray, windows: List[Tuple[int, int, int, int]]) \
+            -> Optional[np.ndarray]:
+        """
+        局部更新最近可走格子表
+        吸附查询的半径不超过 GUIDE_ENDPOINT_SNAP_DISTANCE / GUIDE_CONNECTOR_SNAP_DISTANCE，
+        修改窗口外扩该半径以内的格子重新查找；之后仍有格子指向已不可走的格子时退回整体重算
+        (更远处的格子查到的仍是可走格子，但不保证最近，吸附半径内的查询不受影响)
+        """
+        if not self.walkable.any():
+            return None
+        snap_distance = max(getattr(settings, 'GUIDE_ENDPOINT_SNAP_DISTANCE', 10.0),
+                            getattr(settings, 'GUIDE_CONNECTOR_SNAP_DISTANCE', 2.0))
+        margin = int(math.ceil(snap_distance / self.resolution)) + 1
+        for window in windows:
+            r_x0, r_x1, r_y0, r_y1 = self._expand_window(window, margin)
+            w_x0, w_x1, w_y0, w_y1 = self._expand_window(window, 2 * margin)
+            sub = ~self.walkable[w_x0:w_x1, w_y0:w_y1]
+            if sub.all():
+                return self._build_nearest_walkable()
+            indices = ndimage.distance_transform_edt(sub, return_distances=False, return_indices=True)
+            table = (indices[0] + w_x0) * self.height + indices[1] + w_y0
+            nearest[r_x0:r_x1, r_y0:r_y1] = table[r_x0 - w_x0:r_x1 - w_x0, r_y0 - w_y0:r_y1 - w_y0]
+
+        if not self.walkable.ravel()[nearest.ravel()].all():
+            return self._build_nearest_walkable()
+        return nearest
+
+    def with_closures(self, closures: List[dict]) -> 'GridSystem':
+        """
+        叠加临时封闭区域后的网格
+        只复制一份障碍物矩阵，在封闭区域的外包窗口内栅格化，基础网格本身不变；
+        叠加结果由调用方缓存 (见 RoutePlanService.get_routing_grid)
+        :param closures: ClosureStore.active() 的返回值
+        """
+        key = tuple(closure['id'] for closure in closures)
+        if not key:
+            return self
+
+        overlay = GridSystem.from_masks((self.min_x, self.min_y, self.max_x, self.max_y), self.resolution,
+                                        self.shell_mask, self.obstacle_mask.copy())
+        overlay.mark_obstacles([GEOSGeometry(closure['geometry']) for closure in closures])
+        overlay.closure_key = key
+        overlay.cache_key = self.variant_key('closures', key)
+        return overlay
+
+    def centering_costs(self, weight: float, radius: float):
+        """
+        居中代价系数：离障碍物不足 radius 米的格子，移动代价按 1 + weight * (1 - 净空 / radius) 放大
+        通道足够宽时不影响路线，狭窄通道里路线会尽量走在中间
+        :return: 展平后的 array('d')，供 WeightedAStarSearch 使用
+        """
+        weight, radius = round(float(weight), 2), float(radius)
+        return self.derived(('centering', weight, radius), lambda: array('d', (
+            1.0 + weight * np.clip(1.0 - self.clearance() / radius, 0.0, 1.0)
+        ).astype(np.float64).tobytes()))
+
+    def walkable_cells_near(self, geometry, distance: float) -> List[int]:
+        """
+        几何体周围 distance 米范围内的可行走格子
+        商铺、设施本身是障碍物，用它们四周的可走格子作为到达点
+        :return: 格子的扁平编号列表 (gx * height + gy)
+        """
+        polygons = PolygonRasterizer.polygon_rings(geometry.buffer(distance))
+        if not polygons:
+            return []
+
+        min_gx, max_gx, min_gy, max_gy = self._cell_window(PolygonRasterizer.rings_extent(polygons))
+        if min_gx >= max_gx or min_gy >= max_gy:
+            return []
+
+        cx, cy = self.cell_centers(min_gx, max_gx, min_gy, max_gy)
+        area = np.zeros((max_gx - min_gx, max_gy - min_gy), dtype=bool)
+        for rings in polygons:
+            area |= PolygonRasterizer.fill(rings, cx, cy, include_boundary=True)
+        area &= self.walkable[min_gx:max_gx, min_gy:max_gy]
+
+        xs, ys = np.nonzero(area)
+        return ((xs + min_gx) * self.height + ys + min_gy).tolist()
+
+    def mask_polygon(self, mask: np.ndarray) -> Optional[GEOSGeometry]:
+        """
+        把格子布尔矩阵转成世界坐标下的 (Multi)Polygon：整体生成 WKB 后做一次 unary_union
+        :return: 矩阵全为 False 时返回 None
+        """
+        wkb = PolygonRasterizer.mask_to_wkb(mask, self.min_x, self.min_y, self.resolution)
+        if wkb is None:
+            return None
+        return GEOSGeometry(memoryview(wkb), srid=2385).unary_union
+
+    def walkable_flat(self) -> bytes:
+        """
+        展平后的可行走数组，格子 (gx, gy) 对应下标 gx * height + gy
+        从网格文件映射的只读矩阵直接返回映射内存的视图 (memoryview，不复制)，其余情况复制为 bytes
+        """
+        if self._walkable_flat is None:
+            if self.walkable.flags.writeable:
+                self._walkable_flat = self.walkable.tobytes()
+            else:
+                self._walkable_flat = self.walkable.data.cast('B')
+        return self._walkable_flat
+
+    def derived(self, key, builder):
+        """
+        按 key 惰性构建并缓存由可行走矩阵派生的结构
+        网格本身按地图版本缓存，因此派生结构每个版本只构建一次
+        """
+        if key not in self._derived:
+            self._derived[key] = builder()
+        return self._derived[key]
+
+    def _invalidate_derived(self):
+        self._walkable_flat = None
+        self._derived = {}
 
 
 class RoutePlanService:
@@ -102,167 +499,685 @@ class RoutePlanService:
     路径规划业务服务层
     """
 
+    # 网格精度 0.5 米 (可根据性能需求调整)
+    GRID_RESOLUTION = 0.5
+
     def __init__(self):
         # 创建上下文对象
         self.ctx = GuideContext()
+        # 楼层版本号 (导航网格、路线等缓存的键) 由地图模块统一维护
+        self.versions = MapVersionContext()
 
-    def validate_request_params(self, map_id, start_data, end_data) -> Tuple[bool, str]:
+    def validate_request_params(self, map_id, start_data, end_data, engine=None) -> Tuple[bool, str]:
         """
         在View中使用的，对Request请求参数的校验逻辑
         """
+        # 1-3. 楼层与起终点坐标校验
+        for point, label in ((start_data, 'start'), (end_data, 'end')):
+            is_valid, error_msg = self.validate_point(map_id, point, label)
+            if not is_valid:
+                return is_valid, error_msg
+
+        # 4. 搜索引擎校验 (可选)
+        if engine is not None and engine not in SEARCH_ENGINES:
+            return False, f"Unknown engine: {engine}, expected one of {', '.join(SEARCH_ENGINES)}"
+
+        return True, "Request params are valid"
+
+    def validate_point(self, map_id, point_data, label: str = 'start') -> Tuple[bool, str]:
+        """
+        单个坐标点参数的校验 (起点、终点，或只有起点的一对多/可达范围/多站点请求)
+        :param label: 参数名，用于错误信息
+        """
         # 1. 必填项校验
         if map_id is None:
             return False, "Missing parameter: map_id"
-        if not start_data or not end_data:
-            return False, "Missing parameter: start or end coordinates"
+        if not point_data:
+            return False, f"Missing parameter: {label} coordinates"
 
         # 2. 字典结构校验
-        if not isinstance(start_data, dict) or not isinstance(end_data, dict):
+        if not isinstance(point_data, dict):
             return False, "Coordinates must be JSON objects with x and y"
 
         # 3. 坐标数值校验
         try:
-            float(start_data.get('x'))
-            float(start_data.get('y'))
-            float(end_data.get('x'))
-            float(end_data.get('y'))
+            float(point_data.get('x'))
+            float(point_data.get('y'))
         except (ValueError, TypeError):
             return False, "Coordinates x and y must be valid numbers"
 
         return True, "Request params are valid"
 
-    def calculate_route(self, map_id: int, start_pt: Point, end_pt: Point) -> Optional[LineString]:
+    def validate_route_options(self, clearance=None, centering=None) -> Tuple[bool, str]:
+        """
+        净空相关的可选参数校验：clearance 为路线到障碍物的最小距离 (米)，centering 为居中代价权重
+        """
+        for name, value in (('clearance', clearance), ('centering', centering)):
+            if value is None:
+                continue
+            try:
+                value = float(value)
+            except (ValueError, TypeError):
+                return False, f"{name} must be a number"
+            if not math.isfinite(value) or value < 0:
+                return False, f"{name} must be a non-negative number"
+
+        max_clearance = getattr(settings, 'GUIDE_MAX_CLEARANCE', 2.0)
+        if clearance is not None and float(clearance) > max_clearance:
+            return False, f"clearance must not exceed {max_clearance}"
+        return True, "Route options are valid"
+
+    def calculate_route(self, map_id: int, start_pt: Point, end_pt: Point, engine: Optional[str] = None,
+                        clearance: Optional[float] = None, centering: Optional[float] = None) \
+            -> Optional[LineString]:
         """
         主入口：计算路径
+        :param engine: 搜索引擎名称 ('astar' / 'jps' / 'bidirectional' / 'hpa' / 'quadtree')，为空时使用 GUIDE_ROUTE_ENGINE 配置
+        :param clearance: 路线到障碍物的最小距离 (米)，净空不足的格子不可走
+        :param centering: 居中代价权重，大于 0 时路线尽量走在通道中间 (使用加权 A*，忽略 engine)
+        """
+        # 1-3. 获取该楼层的导航网格 (优先使用缓存)，按净空要求过滤
+        grid_sys = self.get_routing_grid(map_id)
+        search_grid = grid_sys.with_clearance(clearance) if clearance else grid_sys
+
+        # 4-5. 起点、终点坐标转换，不可走时吸附到最近的可走格子
+        start_node, end_node = self._locate_endpoints(search_grid, start_pt, end_pt)
+
+        # 6-8. 搜索、平滑并转换为折线
+        return self._route_on_grid(search_grid, start_node, end_node, engine, self._cell_costs(grid_sys, centering))
+
+    def plan_route(self, map_id: int, start_pt: Point, end_pt: Point, engine: Optional[str] = None,
+                   clearance: Optional[float] = None, centering: Optional[float] = None,
+                   route_format: str = 'geojson') -> Optional[dict]:
+        """
+        单楼层路径规划接口使用的入口：结果按 (楼层版本, 起终点格子, 净空参数, 临时封闭区域) 缓存
+        落在同一对格子上的请求路线完全相同，命中缓存时直接输出缓存的坐标，不执行搜索
+        :param route_format: 'geojson' 或 'polyline' (见 format_route)
+        :return: {"route": 路线, "distance": 米, "start": 吸附后的起点, "end": 吸附后的终点}，不可达返回 None
+        """
+        # 1. 楼层版本号与导航网格
+        version = self.versions.get_version(map_id)
+        if version is None:
+            raise ValueError(f"Map #{map_id} not found")
+        grid_sys = self.get_routing_grid(map_id, version)
+        search_grid = grid_sys.with_clearance(clearance) if clearance else grid_sys
+
+        # 2. 起终点转换为网格坐标，不可走时吸附到最近的可走格子
+        start_node, end_node = self._locate_endpoints(search_grid, start_pt, end_pt)
+
+        # 3. 查结果缓存
+        engine = engine or getattr(settings, 'GUIDE_ROUTE_ENGINE', 'astar')
+        key = (int(map_id), version, start_node, end_node, engine, getattr(settings, 'GUIDE_SMOOTH_PATH', True),
+               round(float(clearance or 0), 2), round(float(centering or 0), 2), grid_sys.closure_key)
+        result = route_cache.get(key)
+        if result is None:
+            # 4. 未命中：搜索并序列化
+            route_geometry = self._route_on_grid(search_grid, start_node, end_node, engine,
+                                                 self._cell_costs(grid_sys, centering))
+            if not route_geometry:
+                return None
+
+            result = {
+                # 一次 GEOS 调用取出全部坐标，输出时按格式直接拼装，不经过 GeoJSON 字符串
+                "coords": route_geometry.coords,
+                # route_geometry.length 自动计算米制长度，然后保留 2 位小数
+                "distance": round(route_geometry.length, 2)
+            }
+            route_cache.put(key, result)
+
+        # 5. 按请求的格式输出路线，附上吸附后的起终点 (与具体点击位置有关，不放进缓存)
+        return {
+            "route": self.format_route(result['coords'], route_format),
+            "distance": result['distance'],
+            "start": self._endpoint_info(grid_sys, start_pt, start_node),
+            "end": self._endpoint_info(grid_sys, end_pt, end_node),
+        }
+
+    @staticmethod
+    def format_route(coords, route_format: str = 'geojson') -> dict:
+        """
+        路线坐标的输出格式
+        - 'geojson': {"type": "LineString", "coordinates": [[x, y], ...]}
+        - 'polyline': {"type": "EncodedPolyline", "precision": 2, "points": 编码字符串}，坐标量化到厘米，
+          体积约为 GeoJSON 的几分之一，解码方法见 PolylineCodec
+        :param coords: LineString.coords 或 [(x, y), ...]
+        """
+        if route_format == 'polyline':
+            return {
+                "type": "EncodedPolyline",
+                "precision": PolylineCodec.DEFAULT_PRECISION,
+                "points": PolylineCodec.encode(coords),
+            }
+        return {"type": "LineString", "coordinates": [[x, y] for x, y in coords]}
+
+    def _locate_endpoints(self, grid_sys: GridSystem, start_pt: Point, end_pt: Point) \
+            -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        """
+        起点、终点坐标转换为网格坐标，不可走时吸附到最近的可走格子
+        """
+        return self._snap_endpoint(grid_sys, start_pt, "Start"), self._snap_endpoint(grid_sys, end_pt, "End")
+
+    def _snap_endpoint(self, grid_sys: GridSystem, point: Point, label: str) -> Tuple[int, int]:
+        """
+        把用户点击的位置吸附到最近的可走格子：点在商铺内部、外轮廓外侧时也能一次请求得到路线
+        超过 GUIDE_ENDPOINT_SNAP_DISTANCE 仍找不到可走格子时报错
+        """
+        snap_distance = getattr(settings, 'GUIDE_ENDPOINT_SNAP_DISTANCE', 10.0)
+        cell = grid_sys.nearest_walkable(*grid_sys.world_to_grid(point.x, point.y),
+                                         snap_distance / grid_sys.resolution)
+        if cell is None:
+            raise ValueError(f"{label} node is not walkable")
+        return cell
+
+    def _endpoint_info(self, grid_sys: GridSystem, point: Point, cell: Tuple[int, int]) -> dict:
+        """
+        响应中的起终点：吸附后的格子中心坐标，snapped 表示是否离开了原始点击的格子
+        """
+        wx, wy = grid_sys.grid_to_world(*cell)
+        return {"x": wx, "y": wy, "snapped": grid_sys.world_to_grid(point.x, point.y) != cell}
+
+    def _cell_costs(self, grid_sys: GridSystem, centering: Optional[float] = None):
+        """居中代价系数 (基于原始网格的净空距离场)，centering 为空或 0 时返回 None"""
+        if not centering:
+            return None
+        return grid_sys.centering_costs(centering, getattr(settings, 'GUIDE_CENTERING_RADIUS', 2.0))
+
+    def _route_on_grid(self, grid_sys: GridSystem, start_node: Tuple[int, int], end_node: Tuple[int, int],
+                       engine: Optional[str] = None, cell_costs=None) -> Optional[LineString]:
+        """
+        在导航网格上寻路，返回世界坐标折线
+        :param cell_costs: 居中代价系数，给出时使用加权 A*
+        """
+        # 0. 起终点不在同一连通分量时一定不可达，不必搜索
+        if not grid_sys.connected(start_node, end_node):
+            return None
+
+        smooth = getattr(settings, 'GUIDE_SMOOTH_PATH', True)
+
+        if cell_costs is not None:
+            # 1-2. 加权 A*；视线平滑会把路线重新拉向墙边，这里不做平滑
+            #      代价表不发布到共享内存，始终在请求线程内搜索
+            search = WeightedAStarSearch(grid_sys.walkable_flat(), grid_sys.width, grid_sys.height, cell_costs)
+            search.set_budget(*self._search_budget())
+            path_ids = search.search(search.to_id(*start_node), search.to_id(*end_node))
+            if path_ids is None:
+                return None
+            path_nodes = [search.to_cell(node_id) for node_id in path_ids]
+        elif RouteExecutor.enabled() and grid_sys.cache_key is not None:
+            # 1-2. 开启多进程寻路时，搜索与平滑都在工作进程中完成 (含净空、临时封闭区域网格；居中代价见上一分支)
+            engine = engine or getattr(settings, 'GUIDE_ROUTE_ENGINE', 'astar')
+            if engine not in SEARCH_ENGINES:
+                raise ValueError(f"Unknown engine: {engine}")
+            path_nodes = RouteExecutor.find_path(grid_sys, start_node, end_node, engine, smooth,
+                                                 self._search_budget())
+            if not path_nodes:
+                return None
+        else:
+            # 1. 执行搜索算法，返回网格坐标的列表
+            path_nodes = self._run_search(start_node, end_node, grid_sys, engine)
+
+            if not path_nodes:
+                return None
+
+            # 2. 视线平滑：去掉锯齿状的中间格子，只保留真实的转折点
+            if smooth:
+                path_nodes = self._smooth_path(path_nodes, grid_sys)
+
+        # 3. 结果转换 (Grid Nodes -> Geo LineString)
+        # 将网格路径转回世界坐标的折线
+        return self._construct_linestring(path_nodes, grid_sys)
+
+    def validate_building_request_params(self, start_data, end_data, engine=None) -> Tuple[bool, str]:
+        """
+        跨楼层路径请求的参数校验：起点、终点各自带 map_id
+        """
+        if not start_data or not end_data:
+            return False, "Missing parameter: start or end coordinates"
+        if not isinstance(start_data, dict) or not isinstance(end_data, dict):
+            return False, "Coordinates must be JSON objects with map_id, x and y"
+        if start_data.get('map_id') is None or end_data.get('map_id') is None:
+            return False, "Missing parameter: map_id of start or end"
+
+        return self.validate_request_params(start_data['map_id'], start_data, end_data, engine)
+
+    def calculate_building_route(self, start_map_id: int, start_pt: Point, end_map_id: int, end_pt: Point,
+                                 engine: Optional[str] = None) -> Optional[List[dict]]:
+        """
+        跨楼层路径规划
+        各楼层内部用缓存的导航网格寻路，楼层之间通过预计算的楼层转换图连接
+        :return: 按行进顺序排列的分段列表，每段为
+                 {"map_id", "floor_number", "route": LineString, "exit_facility_id": 离开本层使用的设施 ID}
+                 不可达返回 None
+        """
+        # 1. 起终点所在楼层
+        start_floor = self.ctx.get_map_floor(start_map_id)
+        if start_floor is None:
+            raise ValueError(f"Map #{start_map_id} not found")
+        end_floor = self.ctx.get_map_floor(end_map_id)
+        if end_floor is None:
+            raise ValueError(f"Map #{end_map_id} not found")
+        if start_floor[0] != end_floor[0]:
+            raise ValueError("Start and end maps belong to different buildings")
+
+        # 2. 同一楼层直接走单层寻路
+        if int(start_map_id) == int(end_map_id):
+            route = self.calculate_route(start_map_id, start_pt, end_pt, engine)
+            if not route:
+                return None
+            return [{"map_id": int(start_map_id), "floor_number": start_floor[1], "route": route,
+                     "exit_facility_id": None}]
+
+        # 3. 起终点网格坐标，不可走时吸附到最近的可走格子
+        start_grid = self.get_routing_grid(start_map_id)
+        end_grid = self.get_routing_grid(end_map_id)
+        start_node = self._snap_endpoint(start_grid, start_pt, "Start")
+        end_node = self._snap_endpoint(end_grid, end_pt, "End")
+
+        # 4. 起点 -> 起始楼层各设施、目标楼层各设施 -> 终点的步行代价
+        graph = self.get_floor_graph(start_floor[0])
+        source_paths, sources = {}, {}
+        for node in graph.connectors_on(int(start_map_id)):
+            result = self._walk_between(start_grid, start_node, graph.access_cells[node], engine)
+            if result:
+                source_paths[node], sources[node] = result
+        target_paths, targets = {}, {}
+        for node in graph.connectors_on(int(end_map_id)):
+            result = self._walk_between(end_grid, graph.access_cells[node], end_node, engine)
+            if result:
+                target_paths[node], targets[node] = result
+
+        # 5. 在楼层转换图上找代价最小的设施序列
+        best = graph.shortest_path(sources, targets)
+        if best is None:
+            return None
+        _, nodes = best
+
+        # 6. 拼装各楼层分段：同层相邻节点之间走步行边，跨层节点之间是换乘
+        legs = [{"map_id": int(start_map_id), "cells": list(source_paths[nodes[0]]), "exit_facility_id": None}]
+        for node_a, node_b in zip(nodes, nodes[1:]):
+            if node_a[1] == node_b[1]:
+                legs[-1]["cells"].extend(graph.walk_paths[(node_a, node_b)][1:])
+            else:
+                legs[-1]["exit_facility_id"] = node_a[0]
+                legs.append({"map_id": node_b[1], "cells": [graph.access_cells[node_b]], "exit_facility_id": None})
+        legs[-1]["cells"].extend(target_paths[nodes[-1]][1:])
+
+        # 7. 各分段转换为 LineString
+        for leg in legs:
+            cells = leg.pop("cells")
+            # 只经过换乘点的楼层只有一个格子，LineString 至少需要两个点
+            if len(cells) == 1:
+                cells = cells * 2
+            leg["floor_number"] = graph.floors[leg["map_id"]]
+            leg["route"] = self._construct_linestring(cells, self.get_grid(leg["map_id"]))
+        return legs
+
+    def validate_targets_request_params(self, map_id, start_data, targets_data) -> Tuple[bool, str]:
+        """
+        一对多路径请求的参数校验：targets 必须且只能指定一种目标
+        """
+        is_valid, error_msg = self.validate_point(map_id, start_data)
+        if not is_valid:
+            return is_valid, error_msg
+
+        if not isinstance(targets_data, dict):
+            return False, "Missing parameter: targets"
+        kinds = [kind for kind in ('facility_ids', 'facility_type', 'store_ids') if targets_data.get(kind) is not None]
+        if len(kinds) != 1:
+            return False, "targets must contain exactly one of facility_ids, facility_type, store_ids"
+
+        value = targets_data[kinds[0]]
+        try:
+            if kinds[0] == 'facility_type':
+                int(value)
+            elif not isinstance(value, list) or not value:
+                return False, f"{kinds[0]} must be a non-empty list"
+            else:
+                [int(item) for item in value]
+        except (ValueError, TypeError):
+            return False, f"{kinds[0]} must contain integers"
+
+        return True, "Request params are valid"
+
+    def calculate_routes_to_targets(self, map_id: int, start_pt: Point, targets_data: dict) -> List[dict]:
+        """
+        一对多路径规划：一次 Dijkstra 扩散求出起点到全部目标的步行距离
+        :param targets_data: {"facility_ids": [...]} / {"facility_type": 1} / {"store_ids": [...]}
+        :return: 按距离升序排列的结果 [{"type", "id", "route": LineString, "distance"}, ...]，不可达的目标不返回
+        """
+        # 1. 起点
+        grid_sys = self.get_routing_grid(map_id)
+        start_node = self._snap_endpoint(grid_sys, start_pt, "Start")
+
+        # 2. 查询目标几何
+        if targets_data.get('store_ids') is not None:
+            target_type = 'store'
+            targets = self.ctx.get_store_targets(map_id, [int(item) for item in targets_data['store_ids']])
+        else:
+            target_type = 'facility'
+            facility_ids = targets_data.get('facility_ids')
+            facility_type = targets_data.get('facility_type')
+            targets = self.ctx.get_facility_targets(
+                map_id,
+                facility_ids=[int(item) for item in facility_ids] if facility_ids is not None else None,
+                facility_type=int(facility_type) if facility_type is not None else None,
+            )
+
+        # 3. 每个目标周围的可走格子都是它的到达点
+        # 与起点不连通的格子不可能到达，提前排除，避免扩散为了它们搜完整个区域
+        snap_distance = getattr(settings, 'GUIDE_TARGET_SNAP_DISTANCE', 1.0)
+        labels = grid_sys.component_labels().ravel()
+        start_label = labels[start_node[0] * grid_sys.height + start_node[1]]
+        goals = {}
+        for index, (_, geometry) in enumerate(targets):
+            for node_id in grid_sys.walkable_cells_near(geometry, snap_distance):
+                if labels[node_id] == start_label:
+                    goals.setdefault(node_id, []).append(index)
+
+        # 4. 一次扩散得到全部目标
+        search = DijkstraSearch(grid_sys.walkable_flat(), grid_sys.width, grid_sys.height)
+        search.set_budget(*self._search_budget())
+        reached = search.search(search.to_id(*start_node), goals)
+
+        # 5. 回溯各目标的路径，平滑后的长度作为步行距离 (与单目标接口口径一致)
+        results = []
+        for index, (node_id, _) in reached.items():
+            path_nodes = [search.to_cell(item) for item in search.path_to(node_id)]
+            if len(path_nodes) == 1:
+                path_nodes = path_nodes * 2
+            elif getattr(settings, 'GUIDE_SMOOTH_PATH', True):
+                path_nodes = self._smooth_path(path_nodes, grid_sys)
+            route = self._construct_linestring(path_nodes, grid_sys)
+            results.append({
+                "type": target_type,
+                "id": targets[index][0],
+                "route": route,
+                "distance": route.length,
+            })
+
+        results.sort(key=lambda item: (item['distance'], item['id']))
+        return results
+
+    def get_floor_graph(self, building_id: int) -> FloorTransitionGraph:
+        """
+        获取建筑的楼层转换图：任一楼层版本号或临时封闭区域变化后重新构建
+        """
+        floors = self.ctx.get_building_maps(building_id)
+        # 临时封闭区域会改变同层设施之间的步行边，封闭区域变化时同样重新构建
+        key = (int(building_id), tuple(
+            (map_id, version, tuple(closure['id'] for closure in ClosureStore.active(map_id)))
+            for map_id, _, version in floors
+        ))
+        graph = floor_graph_cache.get(key)
+        if graph is None:
+            graph = self._build_floor_graph(building_id, floors)
+            floor_graph_cache.discard_if(lambda k: k[0] == key[0] and k != key)
+            floor_graph_cache.put(key, graph)
+        return graph
+
+    def _build_floor_graph(self, building_id: int, floors: List[Tuple[int, int, int]]) -> FloorTransitionGraph:
+        """
+        预计算楼层转换图
+        """
+        graph = FloorTransitionGraph(building_id)
+        graph.floors = {map_id: floor_number for map_id, floor_number, _ in floors}
+
+        # 1. 垂直交通设施在各层的落脚点：设施本身被当作障碍物，取附近最近的可走格子
+        connector_types = getattr(settings, 'GUIDE_CONNECTOR_FACILITY_TYPES', [0])
+        snap_distance = getattr(settings, 'GUIDE_CONNECTOR_SNAP_DISTANCE', 2.0)
+        locations = {}
+        for facility_id, map_id, location in self.ctx.get_connector_facilities(list(graph.floors), connector_types):
+            grid_sys = self.get_routing_grid(map_id)
+            cell = grid_sys.nearest_walkable(*grid_sys.world_to_grid(location.x, location.y),
+                                             int(math.ceil(snap_distance / grid_sys.resolution)))
+            if cell is not None:
+                graph.add_connector((facility_id, map_id), cell)
+                locations[(facility_id, map_id)] = location
+
+        # 2. 同层设施之间的步行边 (跳点搜索即可，代价与 A* 相同)
+        for map_id in graph.floors:
+            nodes = graph.connectors_on(map_id)
+            if len(nodes) < 2:
+                continue
+            grid_sys = self.get_routing_grid(map_id)
+            for i, node_a in enumerate(nodes):
+                for node_b in nodes[i + 1:]:
+                    result = self._walk_between(grid_sys, graph.access_cells[node_a], graph.access_cells[node_b],
+                                                'jps')
+                    if result:
+                        path, cost = result
+                        graph.add_walk_edge(node_a, node_b, cost, path)
+
+        # 3. 跨层换乘边：同一个设施关联到多个楼层，或相邻楼层上位置重合的设施 (分层绘制的扶梯)
+        transition_cost = getattr(settings, 'GUIDE_FLOOR_TRANSITION_COST', 15.0)
+        link_distance = getattr(settings, 'GUIDE_CONNECTOR_LINK_DISTANCE', 2.0)
+        nodes = list(graph.access_cells)
+        for i, node_a in enumerate(nodes):
+            for node_b in nodes[i + 1:]:
+                if node_a[1] == node_b[1]:
+                    continue
+                floor_gap = abs(graph.floors[node_a[1]] - graph.floors[node_b[1]])
+                same_facility = node_a[0] == node_b[0]
+                stacked = floor_gap == 1 and locations[node_a].distance(locations[node_b]) <= link_distance
+                if same_facility or stacked:
+                    graph.add_transition(node_a, node_b, transition_cost * max(floor_gap, 1))
+
+        return graph
+
+    def get_routing_grid(self, map_id: int, version: Optional[int] = None) -> GridSystem:
+        """
+        寻路使用的网格：缓存的基础网格叠加当前生效的临时封闭区域 (没有封闭区域时就是基础网格)
+        同一组封闭区域的叠加网格按 (map_id, version, 封闭区域 ID 组合) 缓存，封闭区域增减或过期后重新叠加
+        """
+        base = self.get_grid(map_id, version)
+        closures = ClosureStore.active(map_id)
+        if not closures:
+            return base
+
+        key = base.cache_key + (tuple(closure['id'] for closure in closures),)
+        overlay = closure_overlay_cache.get(key)
+        if overlay is None:
+            overlay = base.with_closures(closures)
+            # 同一楼层只有当前版本、当前这组封闭区域的叠加网格还会被访问
+            closure_overlay_cache.discard_if(lambda k: k[0] == key[0] and k != key)
+            closure_overlay_cache.put(key, overlay)
+        return overlay
+
+    def get_grid(self, map_id: int, version: Optional[int] = None) -> GridSystem:
+        """
+        获取楼层导航网格：按 (map_id, version) 查进程级缓存，未命中时重新构建
+        :param version: 调用方已查询过的楼层版本号，为空时在此查询
+        """
+        if version is None:
+            version = self.versions.get_version(map_id)
+        if version is None:
+            raise ValueError(f"Map #{map_id} not found")
+
+        key = (int(map_id), version)
+        grid_sys = grid_cache.get(key)
+        if grid_sys is None:
+            grid_sys = self._load_or_build_grid(map_id, version)
+            self._cache_grid(key, grid_sys)
+        return grid_sys
+
+    @staticmethod
+    def _cache_grid(key: Tuple[int, int], grid_sys: GridSystem):
+        grid_sys.cache_key = key
+        # 同一楼层的旧版本网格与路径结果已经过期，直接清理
+        grid_cache.discard_if(lambda k: k[0] == key[0] and k != key)
+        route_cache.discard_if(lambda k: k[0] == key[0] and k[1] != key[1])
+        grid_cache.put(key, grid_sys)
+
+    def patch_grid(self, map_id: int, old_version: Optional[int], new_version: Optional[int],
+                   old_obstacle=None, new_obstacle=None) -> bool:
+        """
+        编辑器修改单个障碍物后增量更新导航网格：由旧版本网格局部修补得到新版本网格，
+        放入进程缓存并写入网格文件 (其他进程直接 mmap 加载)，不必整层重新栅格化
+        :param old_obstacle: 修改前的障碍物几何 (设施已膨胀)，None 表示新增
+        :param new_obstacle: 修改后的障碍物几何，None 表示删除
+        :return: 是否完成修补；旧版本网格不在进程缓存中，或两个版本之间还有其他修改时返回 False，
+                 此时新版本在首次使用时完整构建
+        """
+        # 1. 只修补紧挨着的两个版本
+        #    旧版本只取进程缓存中的网格 (加载时已核对过几何指纹)；旧版本的网格文件无法与已被修改的几何比对，不作为基础
+        if old_version is None or new_version != old_version + 1:
+            return False
+        base = grid_cache.get((int(map_id), old_version))
+        if base is None:
+            return False
+
+        # 2. 清空旧几何所在窗口，重新标记窗口内的障碍物，再标记新几何
+        #    查询范围取被清空的格子窗口 (按格子边缘)，窗口最后一行/列格子的中心可能在旧几何外包矩形之外
+        nearby = []
+        if old_obstacle is not None:
+            nearby = self.ctx.get_obstacles_in_extent(
+                map_id, base.window_extent(base._cell_window(old_obstacle.extent)))
+        grid_sys = base.patched(old_obstacle, new_obstacle, nearby)
+
+        # 3. 持久化 (指纹取数据库中的当前几何) 并放入缓存
+        if getattr(settings, 'GUIDE_GRID_STORE', True):
+            self._write_grid_file(map_id, new_version, grid_sys,
+                                  GridFile.fingerprint(*self.ctx.get_map_geometry_data(map_id)))
+        self._cache_grid((int(map_id), new_version), grid_sys)
+        return True
+
+    def _load_or_build_grid(self, map_id: int, version: int) -> GridSystem:
+        """
+        优先从 GUIDE_DATA_DIR 下的网格文件 (mmap) 加载，没有文件时从数据库构建并写入文件
+        进程重启或新开工作进程时，同一版本的楼层不需要重新栅格化，也不需要读取楼层几何
+        文件按版本号信任；GUIDE_GRID_VERIFY 开启时先读取几何计算指纹，与文件头不一致则重新构建并覆盖
+        """
+        if not getattr(settings, 'GUIDE_GRID_STORE', True):
+            return self._build_grid(map_id)
+
+        # 1. 开启校验时读取当前几何 (只读取，不栅格化)
+        geometry = None
+        if getattr(settings, 'GUIDE_GRID_VERIFY', False):
+            geometry = self.ctx.get_map_geometry_data(map_id)
+            if not geometry[0]:
+                raise ValueError(f"Map #{map_id} outer_shell missing")
+
+        # 2. 已有文件：直接映射
+        path = GridFile.path_for(map_id, version)
+        if os.path.exists(path):
+            try:
+                return self._load_grid(path, GridFile.fingerprint(*geometry) if geometry else None)
+            except (OSError, ValueError):
+                # 文件损坏、格式不符或几何已变化，重新构建并覆盖
+                pass
+
+        # 3. 构建网格并写入文件 (连同源几何指纹)
+        geometry = geometry or self.ctx.get_map_geometry_data(map_id)
+        grid_sys = self._build_grid(map_id, geometry)
+        self._write_grid_file(map_id, version, grid_sys, GridFile.fingerprint(*geometry))
+        return grid_sys
+
+    @staticmethod
+    def _write_grid_file(map_id: int, version: int, grid_sys: GridSystem, fingerprint: bytes):
+        """网格连同预计算表 (连通分量、最近可走格子) 一起写入文件，键与 GridSystem.derived 相同，并清理旧版本"""
+        tables = {'components': grid_sys.component_labels()}
+        nearest = grid_sys.derived('nearest_walkable', grid_sys._build_nearest_walkable)
+        if nearest is not None:
+            tables['nearest_walkable'] = nearest
+        GridFile.write(GridFile.path_for(map_id, version), grid_sys, tables, fingerprint)
+        GuideDataStore.discard_stale(map_id, version, GridFile.NAME, GridFile.SUFFIX)
+
+    @staticmethod
+    def _load_grid(path: str, fingerprint: Optional[bytes] = None) -> GridSystem:
+        """
+        :param fingerprint: 期望的源几何指纹，给出时与文件头比对
+        :raises ValueError: 文件损坏，或指纹不一致
+        """
+        data = GridFile.read(path)
+        if fingerprint is not None and data['fingerprint'] != fingerprint:
+            raise ValueError(f"Grid file was built from different geometry: {path}")
+        return GridSystem.from_masks(data['extent'], data['resolution'], data['shell_mask'],
+                                     data['obstacle_mask'], derived=data['tables'], walkable=data['walkable'])
+
+    def _build_grid(self, map_id: int, geometry: Optional[tuple] = None) -> GridSystem:
+        """
+        从数据库加载楼层几何并构建导航网格
+        :param geometry: 调用方已读取的 get_map_geometry_data 结果，为空时在此读取
         """
         # 1. 获取地图几何数据 (调用 Context)
         # 期望返回:
         # outer_shell: Polygon (地图地板轮廓)
         # holes: List[Polygon] (地图本身镂空)
         # obstacles: List[Geometry] (商铺、活动区、其他区域、膨胀后的设施)
-        outer_shell, holes, obstacles = self.ctx.get_map_geometry_data(map_id)
+        outer_shell, holes, obstacles = geometry or self.ctx.get_map_geometry_data(map_id)
 
         if not outer_shell:
             raise ValueError(f"Map #{map_id} outer_shell missing")
 
         # 2. 初始化网格系统 (Grid System)
-        # 设定分辨率为 0.5 米 (可根据性能需求调整)
-        grid_sys = GridSystem(outer_shell, resolution=0.5)
+        grid_sys = GridSystem(outer_shell, resolution=self.GRID_RESOLUTION)
 
         # 3. 网格化障碍物
         # 将 holes 和 obstacles 合并处理
         all_obstacles = holes + obstacles
         grid_sys.mark_obstacles(all_obstacles)
+        return grid_sys
 
-        # 4. 起点、终点坐标转换
-        start_node = grid_sys.world_to_grid(start_pt.x, start_pt.y)
-        end_node = grid_sys.world_to_grid(end_pt.x, end_pt.y)
-
-        # 5. 校验起终点有效性
-        if not grid_sys.is_walkable(*start_node):
-            raise ValueError("Start node is not walkable")
-        if not grid_sys.is_walkable(*end_node):
-            raise ValueError("End node is not walkable")
-
-        # 6. 执行 A* 算法，返回网格坐标的列表
-        path_nodes = self._run_astar(start_node, end_node, grid_sys)
-
-        if not path_nodes:
-            return None
-
-        # 7. 结果转换 (Grid Nodes -> Geo LineString)
-        # 将网格路径转回世界坐标的折线
-        return self._construct_linestring(path_nodes, grid_sys)
-
-    def _run_astar(self, start_node: Tuple[int, int], end_node: Tuple[int, int], grid: GridSystem) \
-            -> List[Tuple[int, int]]:
+    def _run_search(self, start_node: Tuple[int, int], end_node: Tuple[int, int], grid: GridSystem,
+                    engine: Optional[str] = None) -> Optional[List[Tuple[int, int]]]:
         """
-        A* 算法核心逻辑
+        网格寻路：节点在搜索内核中以扁平整数编号表示，只在返回时转换回网格坐标
         :param start_node: (gx, gy) 起点
         :param end_node: (gx, gy) 终点
-        :param grid: 网格系统对象，用于判断可行走性
+        :param grid: 网格系统对象，提供可行走数组
+        :param engine: 搜索引擎名称，为空时使用 GUIDE_ROUTE_ENGINE 配置 (默认 A*)
         :return: [(x1, y1), (x2, y2), ...] 路径列表，如果找不到路径返回 None
         """
-        # 1. 初始化 open_set (优先队列)，存放 (f_score, node)，可能的扩展节点
-        # f_score = g_score + h_score
-        open_set = []
-        heapq.heappush(open_set, (0, start_node))
-
-        # 2. 初始化记录字典
-        # came_from: 记录路径回溯，key=当前节点, value=父节点
-        came_from = {}
-
-        # g_score: 从起点到当前节点的实际代价。默认无穷大。
-        g_score = {start_node: 0.0}
-
-        # f_score: 预估总代价。默认无穷大。
-        # f_score[start_node] = h(start_node, end)
-        f_score = {start_node: self._heuristic(start_node, end_node)}
-
-        # 定义移动方向和对应的代价
-        # (dx, dy, cost)
-        sqrt2 = math.sqrt(2)
-        movements = [
-            (0, 1, 1.0), (0, -1, 1.0), (1, 0, 1.0), (-1, 0, 1.0),  # 上下右左
-            (1, 1, sqrt2), (1, -1, sqrt2), (-1, 1, sqrt2), (-1, -1, sqrt2)  # 对角线
-        ]
-
-        # 3. 主循环，当 open_set 非空
-        while open_set:
-            # 取出 f_score 最小的节点
-            current_f, current = heapq.heappop(open_set)
-
-            # --- 成功到达终点 ---
-            if current == end_node:
-                return self._reconstruct_path(came_from, current)
-
-            # 遍历 8 个邻居
-            for dx, dy, move_cost in movements:
-                neighbor = (current[0] + dx, current[1] + dy)
-
-                # --- 核心判断：如果邻居不可走则跳过 ---
-                if not grid.is_walkable(*neighbor):
-                    continue
-
-                # 计算经过当前节点到达邻居的 tentative_g (临时G值)
-                tentative_g = g_score[current] + move_cost
-
-                # 如果临时G值小于该邻居之前的G值，或者之前没访问过该邻居 (字典里找不到 neighbor 这个 key，就返回 inf)
-                if tentative_g < g_score.get(neighbor, float('inf')):
-                    # 更新记录
-                    came_from[neighbor] = current
-                    g_score[neighbor] = tentative_g
+        result = self._search_with_cost(start_node, end_node, grid, engine)
+        return result[0] if result else None
 
-                    # 计算 f 值 = g + h
-                    new_f = tentative_g + self._heuristic(neighbor, end_node)
-                    f_score[neighbor] = new_f
+    def _search_with_cost(self, start_node: Tuple[int, int], end_node: Tuple[int, int], grid: GridSystem,
+                          engine: Optional[str] = None) -> Optional[Tuple[List[Tuple[int, int]], float]]:
+        """
+        网格寻路，同时返回网格路径长度
+        :return: (路径列表, 路径长度(米))，找不到路径返回 None
+        """
+        engine = engine or getattr(settings, 'GUIDE_ROUTE_ENGINE', 'astar')
+        if engine not in SEARCH_ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
 
-                    # 加入优先队列等待处理
-                    heapq.heappush(open_set, (new_f, neighbor))
+        search = SEARCH_ENGINES[engine].for_grid(grid).set_budget(*self._search_budget())
+        path_ids = search.search(search.to_id(*start_node), search.to_id(*end_node))
 
-        # 循环结束仍未找到终点
-        return None
+        if path_ids is None:
+            return None
+        return [search.to_cell(node_id) for node_id in path_ids], search.cost * grid.resolution
 
-    def _reconstruct_path(self, came_from: dict, current: Tuple[int, int]) -> List[Tuple[int, int]]:
+    def _walk_between(self, grid: GridSystem, start_node: Tuple[int, int], end_node: Tuple[int, int],
+                      engine: Optional[str] = None) -> Optional[Tuple[List[Tuple[int, int]], float]]:
         """
-        私有辅助方法：从终点回溯到起点，重建路径
+        楼层内两点之间的步行路径 (按配置做视线平滑)
+        :return: (路径列表, 网格路径长度(米))，不可达返回 None
         """
-        total_path = [current]
-        while current in came_from:
-            current = came_from[current]
-            total_path.append(current)
+        if not grid.connected(start_node, end_node):
+            return None
+        result = self._search_with_cost(start_node, end_node, grid, engine)
+        if result is None:
+            return None
+        path_nodes, cost = result
+        if getattr(settings, 'GUIDE_SMOOTH_PATH', True):
+            path_nodes = self._smooth_path(path_nodes, grid)
+        return path_nodes, cost
 
-        # 因为是从终点往回找的，所以要反转列表
-        return total_path[::-1]
+    @staticmethod
+    def _search_budget() -> Tuple[Optional[int], Optional[float]]:
+        """
+        单次搜索的预算：(展开节点数上限, 耗时上限(秒))
+        """
+        return (getattr(settings, 'GUIDE_SEARCH_MAX_EXPANDED', None),
+                getattr(settings, 'GUIDE_SEARCH_TIME_LIMIT', None))
 
-    def _heuristic(self, node_a: Tuple[int, int], node_b: Tuple[int, int]) -> float:
+    def _smooth_path(self, path_nodes: List[Tuple[int, int]], grid: GridSystem) -> List[Tuple[int, int]]:
         """
-        启发函数 (对角距离)
+        按网格视线拉直路径，路径长度不再包含阶梯状的额外距离
         """
-        delta_x = abs(node_a[0] - node_b[0])
-        delta_y = abs(node_a[1] - node_b[1])
-        h_value = delta_x + delta_y + (math.sqrt(2) - 2) * min(delta_x, delta_y)
-        return h_value
+        smoother = PathSmoother(grid.walkable_flat(), grid.width, grid.height)
+        return smoother.smooth(path_nodes)
 
     def _construct_linestring(self, path_nodes: List[Tuple[int, int]], grid: GridSystem) -> LineString:
         """
@@ -274,3 +1189,413 @@ class RoutePlanService:
             points.append((wx, wy))
 
         return LineString(points, srid=2385)
+
+
+class StoreDistanceMatrixService:
+    """
+    楼层商铺两两之间的步行距离矩阵
+    从每个商铺四周的可走格子出发做一次多源扩散 (WaveExpansion)，得到它到其余商铺的距离；
+    结果以 float32 矩阵保存在 GUIDE_DATA_DIR 下，文件名带楼层版本号，楼层变化后重新计算
+    """
+
+    MATRIX_NAME = 'store_matrix'
+
+    # 正在后台计算的楼层 (map_id, version)，避免重复启动
+    _building = set()
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.ctx = GuideContext()
+        self.versions = MapVersionContext()
+        self.route_service = RoutePlanService()
+
+    def get_matrix(self, map_id: int) -> Optional[Tuple[int, List[int], np.ndarray]]:
+        """
+        读取当前版本的距离矩阵
+        :return: (version, store_ids, distances)，尚未计算时返回 None
+        """
+        version = self.versions.get_version(map_id)
+        if version is None:
+            raise ValueError(f"Map #{map_id} not found")
+
+        path = GuideDataStore.path_for(map_id, version, self.MATRIX_NAME)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return version, data['store_ids'].tolist(), data['distances']
+
+    def schedule_build(self, map_id: int) -> bool:
+        """
+        在后台线程中计算距离矩阵 (GUIDE_STORE_MATRIX_ASYNC=False 时同步计算)
+        :return: 本次是否启动了计算 (已有同版本的计算在进行时返回 False)
+        """
+        version = self.versions.get_version(map_id)
+        if version is None:
+            raise ValueError(f"Map #{map_id} not found")
+
+        key = (int(map_id), version)
+        with self._lock:
+            if key in self._building:
+                return False
+            self._building.add(key)
+
+        if not getattr(settings, 'GUIDE_STORE_MATRIX_ASYNC', True):
+            self._build_and_release(key)
+            return True
+
+        threading.Thread(target=self._build_in_thread, args=(key,), daemon=True).start()
+        return True
+
+    def _build_in_thread(self, key: Tuple[int, int]):
+        try:
+            self._build_and_release(key)
+        finally:
+            # 后台线程持有独立的数据库连接，结束时关闭
+            connection.close()
+
+    def _build_and_release(self, key: Tuple[int, int]):
+        try:
+            self.build_matrix(*key)
+        finally:
+            with self._lock:
+                self._building.discard(key)
+
+    def build_matrix(self, map_id: int, version: int) -> Optional[Tuple[List[int], np.ndarray]]:
+        """
+        计算并保存 version 版本的距离矩阵
+        :return: (store_ids, distances)，distances[i, j] 为商铺 i 到商铺 j 的步行距离 (米)，不可达为 inf；
+                 计算期间楼层被修改 (商铺数据已不属于 version) 时丢弃结果，返回 None
+        """
+        # 1. 导航网格与商铺
+        grid_sys = self.route_service.get_grid(map_id, version)
+        stores = self.ctx.get_store_targets(map_id)
+        store_ids = [store_id for store_id, _ in stores]
+        count = len(stores)
+
+        # 2. 每个商铺四周的可走格子作为它的出入口
+        snap_distance = getattr(settings, 'GUIDE_TARGET_SNAP_DISTANCE', 1.0)
+        entrances = [grid_sys.walkable_cells_near(shape, snap_distance) for _, shape in stores]
+
+        distances = np.full((count, count), np.inf, dtype=np.float32)
+        np.fill_diagonal(distances, 0.0)
+
+        # 3. 从商铺 i 的全部出入口同时出发做一次 scipy Dijkstra (C 实现，邻接矩阵随网格缓存)，
+        #    商铺 j 的距离取其各出入口中的最小值；步行距离对称，只需要求编号更大的商铺
+        wave = WaveExpansion.for_grid(grid_sys)
+        for i in range(count - 1):
+            if not entrances[i]:
+                continue
+            reached = wave.expand(entrances[i], np.inf).ravel()
+            for j in range(i + 1, count):
+                if entrances[j]:
+                    distances[i, j] = distances[j, i] = reached[entrances[j]].min() * grid_sys.resolution
+
+        # 4. 商铺数据读自数据库的当前状态，计算期间版本号变化说明结果混入了新版本的几何，丢弃
+        if self.versions.get_version(map_id) != version:
+            logger.info("Map #%s changed while building store matrix v%s, result discarded", map_id, version)
+            return None
+
+        # 5. 持久化，并清理旧版本
+        path = GuideDataStore.path_for(map_id, version, self.MATRIX_NAME)
+        GuideDataStore.write_atomic(
+            path, lambda f: np.savez(f, store_ids=np.array(store_ids, dtype=np.int64), distances=distances)
+        )
+        GuideDataStore.discard_stale(map_id, version, self.MATRIX_NAME)
+        return store_ids, distances
+
+
+class ReachabilityService:
+    """
+    可达范围 (等时圈)：从一个起点出发，N 米 / N 秒步行范围内能到达的区域以及其中的商铺、设施
+    在缓存的导航网格上做一次有界波前扩散，按距离分段矢量化，不逐格调用 GEOS
+    """
+
+    UNITS = ('meters', 'seconds')
+
+    def __init__(self):
+        self.ctx = GuideContext()
+        self.route_service = RoutePlanService()
+
+    def validate_request_params(self, map_id, start_data, bands_data, unit='meters') -> Tuple[bool, str]:
+        """
+        参数校验：bands 为升序无关的正数列表，单位为米或秒
+        """
+        is_valid, error_msg = self.route_service.validate_point(map_id, start_data)
+        if not is_valid:
+            return is_valid, error_msg
+
+        if unit not in self.UNITS:
+            return False, f"unit must be one of {', '.join(self.UNITS)}"
+        max_bands = getattr(settings, 'GUIDE_REACHABILITY_MAX_BANDS', 10)
+        if not isinstance(bands_data, list) or not 0 < len(bands_data) <= max_bands:
+            return False, f"bands must be a list of 1 to {max_bands} numbers"
+        try:
+            bands = [float(band) for band in bands_data]
+        except (ValueError, TypeError):
+            return False, "bands must contain numbers"
+        if not all(math.isfinite(band) and band > 0 for band in bands):
+            return False, "bands must be positive numbers"
+
+        max_distance = getattr(settings, 'GUIDE_REACHABILITY_MAX_DISTANCE', 500.0)
+        if self._to_meters(max(bands), unit) > max_distance:
+            return False, f"bands must not exceed {max_distance} meters of walking"
+        return True, "Request params are valid"
+
+    def calculate_reachability(self, map_id: int, start_pt: Point, bands: List[float], unit: str = 'meters') \
+            -> List[dict]:
+        """
+        :param bands: 分段上限 (单位由 unit 决定)，如 [60, 120, 300] 秒
+        :return: 每段一项 [{"limit", "distance", "area", "stores", "facilities"}, ...]，按上限升序；
+                 area 为上一段上限到本段上限之间新增的可达区域 (无则为 None)，
+                 stores / facilities 为最近到达点落在本段内的商铺、设施 [{"id", "distance"}, ...]
+        """
+        # 1. 导航网格与起点
+        grid_sys = self.route_service.get_routing_grid(map_id)
+        start_node = self.route_service._snap_endpoint(grid_sys, start_pt, "Start")
+        bands = sorted(float(band) for band in bands)
+        limits = [self._to_meters(band, unit) for band in bands]
+
+        # 2. 一次有界扩散得到每个格子的步行距离 (米)
+        expansion = WaveExpansion.for_grid(grid_sys)
+        distances = expansion.expand([start_node[0] * grid_sys.height + start_node[1]],
+                                     limits[-1] / grid_sys.resolution) * grid_sys.resolution
+        flat_distances = distances.ravel()
+
+        # 3. 商铺、设施的步行距离取其四周可走格子中的最小值
+        snap_distance = getattr(settings, 'GUIDE_TARGET_SNAP_DISTANCE', 1.0)
+        targets = {
+            'stores': self.ctx.get_store_targets(map_id),
+            'facilities': self.ctx.get_facility_targets(map_id),
+        }
+        reached = {}
+        for kind, items in targets.items():
+            reached[kind] = []
+            for target_id, geometry in items:
+                cells = grid_sys.walkable_cells_near(geometry, snap_distance)
+                if cells:
+                    distance = float(flat_distances[cells].min())
+                    if math.isfinite(distance):
+                        reached[kind].append((distance, target_id))
+            reached[kind].sort()
+
+        # 4. 按分段矢量化区域并归类目标
+        results = []
+        lower = -1.0
+        for band, limit in zip(bands, limits):
+            entry = {
+                "limit": band,
+                "distance": limit,
+                "area": grid_sys.mask_polygon((distances > lower) & (distances <= limit)),
+            }
+            for kind in targets:
+                entry[kind] = [
+                    {"id": target_id, "distance": distance}
+                    for distance, target_id in reached[kind] if lower < distance <= limit
+                ]
+            results.append(entry)
+            lower = limit
+        return results
+
+    @staticmethod
+    def _to_meters(value: float, unit: str) -> float:
+        if unit == 'seconds':
+            return value * getattr(settings, 'GUIDE_WALKING_SPEED', 1.2)
+        return value
+
+
+class TourPlanService:
+    """
+    多站点逛街路线：从起点出发依次经过一组商铺，自动安排访问顺序
+    1. 起点与每个商铺各做一次多源扩散 (scipy Dijkstra，商铺四周的可走格子同时作为起点)，得到两两步行距离
+    2. 最近邻 + 2-opt / Or-opt 求访问顺序 (距离矩阵只用于排序)
+    3. 每段从上一段到达的格子出发做一次单源扩散，回溯到下一站点最近的出入口格子，各段首尾相接
+    """
+
+    def __init__(self):
+        self.ctx = GuideContext()
+        self.route_service = RoutePlanService()
+
+    def validate_request_params(self, map_id, start_data, store_ids) -> Tuple[bool, str]:
+        is_valid, error_msg = self.route_service.validate_point(map_id, start_data)
+        if not is_valid:
+            return is_valid, error_msg
+
+        max_stops = getattr(settings, 'GUIDE_TOUR_MAX_STOPS', 15)
+        if not isinstance(store_ids, list) or not store_ids:
+            return False, "store_ids must be a non-empty list"
+        try:
+            ids = {int(item) for item in store_ids}
+        except (ValueError, TypeError):
+            return False, "store_ids must contain integers"
+        if len(ids) > max_stops:
+            return False, f"store_ids must not contain more than {max_stops} stores"
+        return True, "Request params are valid"
+
+    def calculate_tour(self, map_id: int, start_pt: Point, store_ids: List[int]) -> dict:
+        """
+        :return: {"order": [商铺 ID], "distance": 总距离 (米),
+                  "legs": [{"from", "to", "route": LineString, "distance"}, ...], "unreachable": [商铺 ID]}
+                 第一段的 from 为 None (起点)
+        """
+        # 1. 起点与各商铺的出入口格子，与起点不连通的商铺直接判为不可达
+        grid_sys = self.route_service.get_routing_grid(map_id)
+        start_node = self.route_service._snap_endpoint(grid_sys, start_pt, "Start")
+        start_id = start_node[0] * grid_sys.height + start_node[1]
+        labels = grid_sys.component_labels().ravel()
+
+        snap_distance = getattr(settings, 'GUIDE_TARGET_SNAP_DISTANCE', 1.0)
+        requested = sorted({int(item) for item in store_ids})
+        stores = dict(self.ctx.get_store_targets(map_id, requested))
+        stops, entrances, unreachable = [], [[start_id]], []
+        for store_id in requested:
+            cells = []
+            if store_id in stores:
+                cells = [node_id for node_id in grid_sys.walkable_cells_near(stores[store_id], snap_distance)
+                         if labels[node_id] == labels[start_id]]
+            if cells:
+                stops.append(store_id)
+                entrances.append(cells)
+            else:
+                unreachable.append(store_id)
+
+        # 2. 每个站点一次多源扩散，得到距离子矩阵 (格子数)
+        expansion = WaveExpansion.for_grid(grid_sys)
+        count = len(entrances)
+        distances = np.zeros((count, count))
+        for i, cells in enumerate(entrances):
+            row = expansion.expand(cells, np.inf).ravel()
+            for j, targets in enumerate(entrances):
+                if i != j:
+                    distances[i, j] = row[targets].min()
+
+        # 3. 访问顺序
+        order = TourOptimizer.solve(distances)
+
+        # 4. 各段路线：从上一段到达的格子出发 (第一段为起点)，到下一站点最近的出入口格子
+        #    站点的多源距离可能来自另一个出入口，不能直接沿多源扩散的最短路径树回溯，否则相邻两段首尾不相接
+        smooth = getattr(settings, 'GUIDE_SMOOTH_PATH', True)
+        legs = []
+        previous, current = 0, start_id
+        for index in order:
+            row, predecessors = expansion.expand_with_paths([current])
+            targets = entrances[index]
+            goal = targets[int(np.argmin(row[targets]))]
+            path_nodes = [divmod(node_id, grid_sys.height) for node_id in WaveExpansion.path_to(predecessors, goal)]
+            if len(path_nodes) == 1:
+                path_nodes = path_nodes * 2
+            elif smooth:
+                path_nodes = self.route_service._smooth_path(path_nodes, grid_sys)
+            route = self.route_service._construct_linestring(path_nodes, grid_sys)
+            legs.append({
+                "from": stops[previous - 1] if previous else None,
+                "to": stops[index - 1],
+                "route": route,
+                "distance": route.length,
+            })
+            previous, current = index, goal
+
+        return {
+            "order": [leg['to'] for leg in legs],
+            "distance": sum(leg['distance'] for leg in legs),
+            "legs": legs,
+            "unreachable": unreachable,
+        }
+
+
+class ClosureService:
+    """
+    临时封闭区域的管理 (活动、检修时临时封闭通道)
+    封闭区域只影响寻路，不修改地图、不递增楼层版本号，到期后自动失效
+    """
+
+    def __init__(self):
+        self.ctx = GuideContext()
+        self.versions = MapVersionContext()
+
+    def validate_create_params(self, map_id, shape_data, duration) -> Tuple[bool, str]:
+        """
+        参数校验：shape 为 WKT 或 GeoJSON 面，duration 为有效时长 (秒)
+        """
+        if map_id is None or not str(map_id).isdigit():
+            return False, "map_id must be an integer"
+        if not shape_data:
+            return False, "Missing parameter: shape"
+        try:
+            geometry = self.parse_shape(shape_data)
+        except (ValueError, TypeError) as e:
+            return False, f"Invalid shape: {e}"
+        if geometry.geom_type not in ('Polygon', 'MultiPolygon') or geometry.empty:
+            return False, "shape must be a Polygon or MultiPolygon"
+
+        max_duration = getattr(settings, 'GUIDE_CLOSURE_MAX_DURATION', 7 * 24 * 3600)
+        try:
+            duration = float(duration)
+        except (ValueError, TypeError):
+            return False, "duration must be a number of seconds"
+        if not 0 < duration <= max_duration:
+            return False, f"duration must be between 0 and {max_duration} seconds"
+        return True, "Request params are valid"
+
+    @staticmethod
+    def parse_shape(shape_data) -> GEOSGeometry:
+        """WKT 字符串或 GeoJSON (字典/字符串) 转为几何，未指定坐标系时使用 2385"""
+        if isinstance(shape_data, dict):
+            shape_data = json.dumps(shape_data)
+        geometry = GEOSGeometry(str(shape_data))
+        if not geometry.srid:
+            geometry.srid = 2385
+        return geometry
+
+    def list_closures(self, map_id: int) -> List[dict]:
+        self._check_map(map_id)
+        return ClosureStore.active(map_id)
+
+    def add_closure(self, map_id: int, shape_data, duration: float, reason: str = '') -> dict:
+        self._check_map(map_id)
+        return ClosureStore.add(map_id, self.parse_shape(shape_data), duration, reason)
+
+    def remove_closure(self, map_id: int, closure_id: str) -> Optional[dict]:
+        self._check_map(map_id)
+        return ClosureStore.remove(map_id, closure_id)
+
+    def _check_map(self, map_id: int):
+        if self.versions.get_version(map_id) is None:
+            raise ValueError(f"Map #{map_id} not found")
+
+
+class GridPatchService:
+    """
+    单个元素的形状/位置修改提交后 (map.signals.element_geometry_changed) 增量更新相关楼层的导航网格
+    增量更新只是优化，任何失败都不影响编辑本身 (新版本网格会在首次寻路时完整构建)
+    """
+
+    @staticmethod
+    def obstacle_geometry(element_type: str, geometry):
+        """元素几何转为导航网格中的障碍物几何：设施点按 GuideContext.FACILITY_RADIUS 膨胀"""
+        if geometry is None:
+            return None
+        if element_type == 'facility':
+            return geometry.buffer(GuideContext.FACILITY_RADIUS) if isinstance(geometry, Point) else None
+        return geometry
+
+    @classmethod
+    def on_geometry_changed(cls, sender, element_type: str, old_versions: dict, old_geometry, new_geometry,
+                            **kwargs):
+        """element_geometry_changed 的接收函数 (在 GuideConfig.ready 中注册)"""
+        cls.element_changed(element_type, old_versions, old_geometry, new_geometry)
+
+    @classmethod
+    def element_changed(cls, element_type: str, old_versions: dict, old_geometry, new_geometry):
+        """
+        :param element_type: 'store' / 'event' / 'other' / 'facility'
+        :param old_versions: 修改前元素所在各楼层的版本号 {map_id: version}
+        """
+        service = RoutePlanService()
+        old_obstacle = cls.obstacle_geometry(element_type, old_geometry)
+        new_obstacle = cls.obstacle_geometry(element_type, new_geometry)
+        for map_id, old_version in old_versions.items():
+            try:
+                service.patch_grid(map_id, old_version, service.versions.get_version(map_id),
+                                   old_obstacle, new_obstacle)
+            except Exception:
+                logger.exception("Incremental grid patch failed for map #%s", map_id)
@@ -0,0 +1,57 @@
+import glob
+import os
+import tempfile
+
+from django.conf import settings
+
+
+class GuideDataStore:
+    """
+    导航模块的磁盘数据目录 (GUIDE_DATA_DIR)
+    预计算结果按 “楼层 + 版本号” 命名，楼层几何变化后旧版本文件自然失效并被清理
+    """
+
+    @staticmethod
+    def data_dir() -> str:
+        path = getattr(settings, 'GUIDE_DATA_DIR', os.path.join(settings.BASE_DIR, 'guide_data'))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def path_for(map_id: int, version: int, name: str, suffix: str = '.npz') -> str:
+        """例如 guide_data/map_3_v12_store_matrix.npz"""
+        return os.path.join(GuideDataStore.data_dir(), f"map_{int(map_id)}_v{int(version)}_{name}{suffix}")
+
+    @staticmethod
+    def write_atomic(path: str, writer):
+        """
+        先写临时文件再重命名，读取方不会看到写了一半的文件
+        :param writer: 接收文件对象的写入函数
+        """
+        directory = os.path.dirname(path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                writer(f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def discard_stale(map_id: int, version: int, name: str, suffix: str = '.npz'):
+        """
+        删除同一楼层更早版本的文件
+        更新的版本保留：后台任务写完旧版本时，其他进程可能已经写好了新版本的文件
+        """
+        prefix = f"map_{int(map_id)}_v"
+        pattern = os.path.join(GuideDataStore.data_dir(), f"{prefix}*_{name}{suffix}")
+        for path in glob.glob(pattern):
+            file_version = os.path.basename(path)[len(prefix):-len(f"_{name}{suffix}")]
+            if not file_version.isdigit() or int(file_version) >= int(version):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -1,11 +1,51 @@
+import itertools
+import os
+import tempfile
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
 from django.test import TestCase
 from unittest.mock import MagicMock, patch
 from django.contrib.gis.geos import Polygon, Point, LineString
-from guide.services import RoutePlanService, GridSystem
+from django.core.cache import cache
+from guide.closures import ClosureStore
+from guide import executor
+from guide.executor import RouteExecutor
+from guide.pathfinding import SEARCH_ENGINES, SearchBudgetExceeded
+from guide.polyline import PolylineCodec
+from guide.services import RoutePlanService, GridSystem, ReachabilityService, StoreDistanceMatrixService, \
+    TourPlanService, GridPatchService, grid_cache, floor_graph_cache, route_cache, closure_overlay_cache
+from guide.storage import GuideDataStore
+from guide.tour import TourOptimizer
+from guide.views import ClosureListView, ClosureDetailView
+from editor.views import StoreareaViewSet as EditorStoreareaViewSet
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.gis.geos import Polygon, GeometryCollection, Point
-from core.models import Map, Building, Storearea, StoreareaMap
+from core.models import Map, Building, Storearea, StoreareaMap, Facility, FacilityMap
+from management.services import FacilityService
+from map.signals import element_geometry_changed
+
+
+class GuideDataDirMixin:
+    """
+    导航服务用例的公共准备：清空进程级网格缓存，GUIDE_DATA_DIR 指向每个用例独立的临时目录 (self.tmp_dir)
+    """
+
+    def setUp(self):
+        super().setUp()
+        grid_cache.clear()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        data_dir = self.settings(GUIDE_DATA_DIR=self.tmp_dir.name)
+        data_dir.enable()
+        self.addCleanup(data_dir.disable)
+
+    @staticmethod
+    def rect(x0: float, y0: float, x1: float, y1: float) -> Polygon:
+        """合成楼层用的矩形 (外框、商铺、墙)"""
+        return Polygon(((x0, y0), (x0, y1), (x1, y1), (x1, y0), (x0, y0)), srid=2385)
 
 
 class GridSystemTestCase(TestCase):
@@ -70,17 +110,89 @@ class GridSystemTestCase(TestCase):
         # 但它在物理上位于大楼外部
         self.assertFalse(grid.is_walkable(8, 8))
 
+    def test_walkable_mask_matches_contains(self):
+        """
+        预计算的可行走矩阵必须与逐点 boundary.contains 判定一致
+        外轮廓的边压在格子中心上时，边界上的点不可走
+        """
+        shell = Polygon(((0.5, 0.5), (0.5, 9.5), (4.5, 9.5), (9.5, 4.5), (9.5, 0.5), (0.5, 0.5)), srid=2385)
+        grid = GridSystem(shell, resolution=0.5)
+
+        for gx in range(grid.width):
+            for gy in range(grid.height):
+                wx, wy = grid.grid_to_world(gx, gy)
+                expected = shell.contains(Point(wx, wy, srid=2385))
+                self.assertEqual(grid.is_walkable(gx, gy), expected, (gx, gy))
 
-class RoutePlanServiceTestCase(TestCase):
+
+class PolygonRasterizerTestCase(TestCase):
+    """
+    测试障碍物栅格化：NumPy 扫描线结果必须与逐点 GEOS intersects 完全一致
+    """
+
+    def setUp(self):
+        self.boundary = Polygon(((0, 0), (0, 20), (20, 20), (20, 0), (0, 0)), srid=2385)
+
+    def assert_same_as_per_point(self, geometry, resolution):
+        vector_grid = GridSystem(self.boundary, resolution=resolution)
+        vector_grid.mark_obstacles([geometry])
+
+        point_grid = GridSystem(self.boundary, resolution=resolution)
+        point_grid._mark_geometry_per_point(geometry)
+
+        self.assertTrue((vector_grid.obstacle_mask == point_grid.obstacle_mask).all())
+
+    def test_edges_on_cell_centers(self):
+        """障碍物的边正好压在格子中心上 (边界上的点算作相交)"""
+        rect = Polygon(((2.5, 2.5), (2.5, 7.5), (9.5, 7.5), (9.5, 2.5), (2.5, 2.5)), srid=2385)
+        triangle = Polygon(((3.5, 10.5), (6.5, 13.5), (9.5, 10.5), (3.5, 10.5)), srid=2385)
+        for geometry in (rect, triangle):
+            self.assert_same_as_per_point(geometry, resolution=1.0)
+
+    def test_slanted_edges_through_cell_centers(self):
+        """斜边恰好经过格子中心：扫描线交点的浮点舍入不能让边上的格子漏掉"""
+        # 1. 分辨率可精确表示时，交点本身没有舍入
+        triangle = Polygon(((0.5, 0.5), (6.5, 3.5), (0.5, 6.5), (0.5, 0.5)), srid=2385)
+        diamond = Polygon(((10.5, 2.5), (16.5, 8.5), (10.5, 14.5), (4.5, 8.5), (10.5, 2.5)), srid=2385)
+        for resolution in (1.0, 0.5, 0.25):
+            self.assert_same_as_per_point(triangle, resolution)
+            self.assert_same_as_per_point(diamond, resolution)
+
+        # 2. 顶点取自格子中心、分辨率不能精确表示时，交点与中心相差一个舍入误差
+        for resolution, cells in ((0.3, ((4, 50), (7, 44), (63, 63))), (0.1, ((20, 13), (113, 50), (62, 130)))):
+            grid = GridSystem(self.boundary, resolution=resolution)
+            points = [grid.grid_to_world(gx, gy) for gx, gy in cells]
+            self.assert_same_as_per_point(Polygon(points + points[:1], srid=2385), resolution)
+
+    def test_polygon_with_hole_and_buffer(self):
+        """带内环的多边形以及设施膨胀出来的圆"""
+        ring = Polygon(
+            ((2, 2), (2, 12), (12, 12), (12, 2), (2, 2)),
+            ((4.5, 4.5), (9.5, 4.5), (9.5, 9.5), (4.5, 9.5), (4.5, 4.5)),
+            srid=2385
+        )
+        circle = Point(15.2, 15.7, srid=2385).buffer(0.5)
+        for resolution in (1.0, 0.5, 0.25):
+            self.assert_same_as_per_point(ring, resolution)
+            self.assert_same_as_per_point(circle, resolution)
+
+
+class RoutePlanServiceTestCase(GuideDataDirMixin, TestCase):
     """
     测试 A* 算法服务层逻辑
     使用 Mock 屏蔽 Context/数据库 操作
     """
 
     def setUp(self):
+        super().setUp()
         self.service = RoutePlanService()
+        self.service.versions = MagicMock()
         # 基础地图: 20x20 米的正方形
-        self.map_boundary = Polygon(((0, 0), (0, 20), (20, 20), (20, 0), (0, 0)), srid=2385)
+        self.map_boundary = self.rect(0, 0, 20, 20)
+        # 楼层图与路线缓存同样是进程级的，每个用例前清空，避免互相影响
+        floor_graph_cache.clear()
+        route_cache.clear()
+        closure_overlay_cache.clear()
 
     @patch('guide.services.GuideContext')
     def test_simple_straight_path(self, MockContext):
@@ -154,33 +266,862 @@ class RoutePlanServiceTestCase(TestCase):
         """测试终点被完全包围无法到达的情况"""
         mock_ctx_instance = MockContext.return_value
 
-        # 障碍物完全包围终点 (10, 10)
+        # 环形障碍物完全包围终点 (10, 10)：终点所在的格子可走，但与外面不连通
+        ring = Polygon(((6, 6), (6, 14), (14, 14), (14, 6), (6, 6)),
+                       ((8, 8), (8, 12), (12, 12), (12, 8), (8, 8)), srid=2385)
+
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [ring])
+        self.service.ctx = mock_ctx_instance
+
+        start = Point(2, 2, srid=2385)
+        end = Point(10, 10, srid=2385)  # 在环的中间
+
+        # 终点可走但与起点不在同一连通分量，不执行搜索直接返回 None
+        with patch.object(RoutePlanService, '_run_search') as mock_search:
+            self.assertIsNone(self.service.calculate_route(1, start, end))
+            mock_search.assert_not_called()
+
+    def test_search_budget_exceeded(self):
+        """搜索展开节点数超出预算时抛出 SearchBudgetExceeded，而不是搜完整个区域"""
+        grid = GridSystem(Polygon(((0, 0), (0, 40), (40, 40), (40, 0), (0, 0)), srid=2385), resolution=0.5)
+        start, end = (1, 1), (78, 78)
+
+        # 各引擎都遵守预算 (开阔楼层上跳点搜索只展开很少的节点，这里用 0 预算检查)
+        for name in ('astar', 'jps', 'bidirectional', 'hpa'):
+            search = SEARCH_ENGINES[name].for_grid(grid).set_budget(max_expanded=0)
+            with self.assertRaises(SearchBudgetExceeded, msg=name):
+                search.search(search.to_id(*start), search.to_id(*end))
+
+        # 按配置设置预算：A* 沿对角线需要展开约 78 个节点
+        with self.settings(GUIDE_SEARCH_MAX_EXPANDED=100000, GUIDE_SEARCH_TIME_LIMIT=5.0):
+            self.assertIsNotNone(self.service._run_search(start, end, grid))
+        with self.settings(GUIDE_SEARCH_MAX_EXPANDED=50):
+            with self.assertRaises(SearchBudgetExceeded):
+                self.service._run_search(start, end, grid)
+
+    @patch('guide.services.GuideContext')
+    def test_endpoint_snapping(self, MockContext):
+        """起终点落在障碍物内或地图外时吸附到最近的可走格子，超出吸附距离才报错"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
         box = Polygon(((8, 8), (8, 12), (12, 12), (12, 8), (8, 8)), srid=2385)
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [box])
+        self.service.ctx = mock_ctx_instance
+
+        # 1. 终点在商铺内部 (靠近右边缘)，吸附到商铺外侧
+        result = self.service.plan_route(1, Point(2, 2, srid=2385), Point(11.6, 10.1, srid=2385))
+        self.assertFalse(result['start']['snapped'])
+        self.assertTrue(result['end']['snapped'])
+        self.assertAlmostEqual(result['end']['x'], 12.25)
+        self.assertAlmostEqual(result['end']['y'], 10.25)
+        self.assertEqual(result['route']['coordinates'][-1], [12.25, 10.25])
+
+        # 2. 起点在外轮廓外侧，吸附到最近的边缘格子
+        route = self.service.calculate_route(1, Point(25, 5, srid=2385), Point(2, 2, srid=2385))
+        self.assertAlmostEqual(route.coords[0][0], 19.75)
+
+        # 3. 超出吸附距离仍然报错
+        with self.assertRaises(ValueError) as cm:
+            self.service.calculate_route(1, Point(100, 100, srid=2385), Point(2, 2, srid=2385))
+        self.assertIn("Start node is not walkable", str(cm.exception))
+
+    @patch('guide.services.GuideContext')
+    def test_grid_cache_reuse_and_invalidation(self, MockContext):
+        """同一版本的楼层只构建一次网格，版本号变化后重新构建"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [])
+        self.service.ctx = mock_ctx_instance
+
+        start = Point(2, 2, srid=2385)
+        end = Point(18, 18, srid=2385)
+
+        # 1. 连续两次请求，只加载一次几何数据
+        self.service.calculate_route(1, start, end)
+        self.service.calculate_route(1, start, end)
+        self.assertEqual(mock_ctx_instance.get_map_geometry_data.call_count, 1)
+
+        # 2. 编辑器修改了楼层，版本号递增 -> 重新构建，旧版本条目被清理
+        self.service.versions.get_version.return_value = 2
+        self.service.calculate_route(1, start, end)
+        self.assertEqual(mock_ctx_instance.get_map_geometry_data.call_count, 2)
+        self.assertEqual(len(grid_cache), 1)
+
+    @patch('guide.services.GuideContext')
+    def test_route_cache_hit_and_invalidation(self, MockContext):
+        """同一对起终点格子的请求直接命中结果缓存，楼层版本号变化后缓存失效"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [])
+        self.service.ctx = mock_ctx_instance
+
+        # 1. 首次请求未命中，执行搜索
+        first = self.service.plan_route(1, Point(2, 2, srid=2385), Point(18, 18, srid=2385))
+        self.assertEqual(first['route']['type'], 'LineString')
+        self.assertEqual(route_cache.stats()['misses'], 1)
+
+        # 2. 落在同一对格子上的请求命中缓存，不再执行搜索
+        with patch.object(RoutePlanService, '_run_search') as mock_search:
+            second = self.service.plan_route(1, Point(2.1, 2.1, srid=2385), Point(18.1, 18.1, srid=2385))
+            mock_search.assert_not_called()
+        self.assertEqual(second, first)
+        self.assertEqual(route_cache.stats()['hits'], 1)
+
+        # 3. 版本号递增后重新搜索，旧版本的结果被清理
+        self.service.versions.get_version.return_value = 2
+        with patch.object(RoutePlanService, '_run_search', wraps=self.service._run_search) as mock_search:
+            self.service.plan_route(1, Point(2, 2, srid=2385), Point(18, 18, srid=2385))
+            mock_search.assert_called_once()
+        self.assertEqual(len(route_cache), 1)
+
+    def test_polyline_codec(self):
+        """折线编码：与 Google 算法的参考结果一致，按厘米量化后往返无损"""
+        # Google 文档中的示例 (纬度在前，这里对应 x 在前)
+        self.assertEqual(PolylineCodec.encode([(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)], precision=5),
+                         '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+
+        coords = [(0.0, 0.0), (12.34, -5.67), (12.35, -5.67), (-300.01, 1024.5)]
+        self.assertEqual(PolylineCodec.decode(PolylineCodec.encode(coords)), coords)
+
+    @patch('guide.services.GuideContext')
+    def test_polyline_route_format(self, MockContext):
+        """route_format='polyline' 返回折线编码，解码后与 GeoJSON 坐标相差不超过 1 厘米"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
+        wall = Polygon(((5, 9), (5, 11), (20, 11), (20, 9), (5, 9)), srid=2385)
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [wall])
+        self.service.ctx = mock_ctx_instance
+
+        geojson = self.service.plan_route(1, Point(2, 2, srid=2385), Point(18, 18, srid=2385))
+        encoded = self.service.plan_route(1, Point(2, 2, srid=2385), Point(18, 18, srid=2385),
+                                          route_format='polyline')
+
+        # 两种格式共用同一条缓存结果
+        self.assertEqual(route_cache.stats()['hits'], 1)
+        self.assertEqual(encoded['route']['type'], 'EncodedPolyline')
+        self.assertEqual(encoded['distance'], geojson['distance'])
+        decoded = PolylineCodec.decode(encoded['route']['points'], encoded['route']['precision'])
+        self.assertEqual(len(decoded), len(geojson['route']['coordinates']))
+        for (x, y), (gx, gy) in zip(decoded, geojson['route']['coordinates']):
+            self.assertAlmostEqual(x, gx, delta=0.01)
+            self.assertAlmostEqual(y, gy, delta=0.01)
+
+    @patch('guide.services.GuideContext')
+    def test_process_pool_matches_in_process(self, MockContext):
+        """多进程寻路与请求线程内寻路的结果一致"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
+        wall = Polygon(((5, 9), (5, 11), (20, 11), (20, 9), (5, 9)), srid=2385)
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [wall])
+        self.service.ctx = mock_ctx_instance
+
+        start = Point(10, 2, srid=2385)
+        end = Point(10, 18, srid=2385)
+        expected = self.service.calculate_route(1, start, end)
+        expected_clearance = self.service.calculate_route(1, start, end, clearance=1.0)
+
+        try:
+            with self.settings(GUIDE_ROUTE_WORKERS=1):
+                with patch.object(RoutePlanService, '_run_search') as mock_search:
+                    route = self.service.calculate_route(1, start, end)
+                    # 净空网格以自己的 cache_key 发布，同样在工作进程中搜索
+                    clearance_route = self.service.calculate_route(1, start, end, clearance=1.0)
+                    mock_search.assert_not_called()
+                self.assertEqual(list(RouteExecutor._published), [(1, 1), (1, 1, ('clearance', 1.0))])
+        finally:
+            RouteExecutor.shutdown()
+
+        self.assertEqual(route.coords, expected.coords)
+        self.assertEqual(clearance_route.coords, expected_clearance.coords)
 
+    def test_worker_maps_shared_grid(self):
+        """工作进程按名字映射共享内存，不复制；父进程释放 (unlink) 后已映射的网格仍可使用，淘汰时解除映射"""
+        self.addCleanup(RouteExecutor.shutdown)
+        self.addCleanup(executor._clear_worker_grids)
+        grid = MagicMock(cache_key=(1, 1), width=2, height=2)
+        grid.walkable_flat.return_value = bytes([1, 1, 1, 0])
+
+        name = RouteExecutor._publish(grid)
+        shared = executor._worker_grid((1, 1), name, 2, 2)
+        self.assertIsInstance(shared.walkable_flat(), memoryview)
+        self.assertEqual(bytes(shared.walkable_flat()), bytes([1, 1, 1, 0]))
+
+        # 1. 父进程发布新版本并释放旧版本
+        RouteExecutor._finish(name)
+        RouteExecutor._retire(RouteExecutor._published.pop((1, 1)))
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+        self.assertEqual(shared.walkable_flat()[2], 1)
+
+        # 2. 同一楼层的新版本进入工作进程缓存，旧网格被淘汰并解除映射
+        grid.cache_key = (1, 2)
+        new_name = RouteExecutor._publish(grid)
+        self.addCleanup(RouteExecutor._finish, new_name)
+        executor._worker_grid((1, 2), new_name, 2, 2)
+        self.assertEqual(list(executor._worker_grids), [(1, 2)])
+        with self.assertRaises(ValueError):
+            shared.walkable_flat()[0]
+
+    def test_shared_grid_released_after_in_flight_tasks(self):
+        """新版本发布后，旧版本的共享内存要等已提交的任务都结束后才释放"""
+        self.addCleanup(RouteExecutor.shutdown)
+        old_grid = MagicMock(cache_key=(1, 1), width=2, height=2)
+        old_grid.walkable_flat.return_value = bytes([1, 1, 1, 0])
+        new_grid = MagicMock(cache_key=(1, 2), width=2, height=2)
+        new_grid.walkable_flat.return_value = bytes([1, 1, 0, 0])
+
+        # 1. 旧版本有一个任务还在排队时发布了新版本：旧共享内存仍可按名字打开
+        old_name = RouteExecutor._publish(old_grid)
+        new_name = RouteExecutor._publish(new_grid)
+        RouteExecutor._finish(new_name)
+        shm = shared_memory.SharedMemory(name=old_name)
+        self.assertEqual(bytes(shm.buf[:4]), bytes([1, 1, 1, 0]))
+        shm.close()
+
+        # 2. 任务结束后释放
+        RouteExecutor._finish(old_name)
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=old_name)
+        self.assertEqual(RouteExecutor._retired, {})
+
+    @patch('guide.services.GuideContext')
+    def test_grid_file_store(self, MockContext):
+        """构建好的网格按版本写入文件，进程缓存清空后直接从文件映射加载，不再读取几何、不再栅格化"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 3
+        box = Polygon(((8, 8), (8, 12), (12, 12), (12, 8), (8, 8)), srid=2385)
         mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [box])
         self.service.ctx = mock_ctx_instance
 
+        built = self.service.get_grid(1)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['map_1_v3_grid.bin'])
+
+        # 1. 模拟进程重启：从文件加载，结果与构建的网格一致，预计算表随文件一起加载
+        grid_cache.clear()
+        with patch.object(GridSystem, 'mark_obstacles') as mock_mark:
+            loaded = self.service.get_grid(1)
+            mock_mark.assert_not_called()
+        self.assertEqual(mock_ctx_instance.get_map_geometry_data.call_count, 1)
+        # 可行走矩阵直接引用映射内存
+        self.assertFalse(loaded.walkable.flags.writeable)
+        self.assertIsInstance(loaded.walkable_flat(), memoryview)
+        self.assertEqual(bytes(loaded.walkable_flat()), built.walkable_flat())
+        self.assertEqual((loaded.min_x, loaded.min_y, loaded.resolution), (built.min_x, built.min_y, built.resolution))
+        self.assertTrue(np.array_equal(loaded.walkable, built.walkable))
+        self.assertTrue(np.array_equal(loaded.derived('components', lambda: None), built.component_labels()))
+        self.assertEqual(loaded.nearest_walkable(20, 20), built.nearest_walkable(20, 20))
+        route = self.service.calculate_route(1, Point(2, 2, srid=2385), Point(18, 18, srid=2385))
+        self.assertIsNotNone(route)
+
+        # 2. 版本号变化后重新构建，旧版本文件被清理
+        self.service.versions.get_version.return_value = 4
+        self.service.get_grid(1)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['map_1_v4_grid.bin'])
+
+        # 3. 文件损坏时重新构建
+        grid_cache.clear()
+        with open(os.path.join(self.tmp_dir.name, 'map_1_v4_grid.bin'), 'wb') as f:
+            f.write(b'broken')
+        self.assertTrue(np.array_equal(self.service.get_grid(1).walkable, built.walkable))
+        self.assertEqual(mock_ctx_instance.get_map_geometry_data.call_count, 3)
+
+        # 4. 数据库重置后同一 (map_id, version) 对应另一份几何：默认按版本号信任文件，开启校验后指纹不一致则重新构建
+        grid_cache.clear()
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [])
+        self.assertFalse(self.service.get_grid(1).is_walkable(20, 20))
+        with self.settings(GUIDE_GRID_VERIFY=True):
+            grid_cache.clear()
+            self.assertTrue(self.service.get_grid(1).is_walkable(20, 20))
+            grid_cache.clear()
+            self.assertTrue(self.service.get_grid(1).is_walkable(20, 20))
+
+    def test_run_astar_on_flat_walkable(self):
+        """搜索内核使用扁平编号，返回的路径仍是网格坐标，且障碍物变化后展平缓存同步刷新"""
+        grid = GridSystem(self.map_boundary, resolution=1.0)
+        flat = grid.walkable_flat()
+        self.assertEqual(len(flat), grid.width * grid.height)
+        self.assertIs(grid.walkable_flat(), flat)
+
+        # 1. 在 x=10 处放一堵墙，只在 y>=18 留口
+        wall = Polygon(((9.8, 0), (9.8, 17.8), (10.8, 17.8), (10.8, 0), (9.8, 0)), srid=2385)
+        grid.mark_obstacles([wall])
+        self.assertIsNot(grid.walkable_flat(), flat)
+        self.assertFalse(grid.walkable_flat()[10 * grid.height + 5])
+
+        # 2. 路径首尾正确，且每一步都落在可行走格子上、相邻格子之间
+        path = self.service._run_search((2, 2), (18, 2), grid)
+        self.assertEqual(path[0], (2, 2))
+        self.assertEqual(path[-1], (18, 2))
+        for (ax, ay), (bx, by) in zip(path, path[1:]):
+            self.assertTrue(grid.is_walkable(bx, by))
+            self.assertLessEqual(max(abs(ax - bx), abs(ay - by)), 1)
+        self.assertTrue(any(gy >= 18 for _, gy in path))
+
+    @patch('guide.services.GuideContext')
+    def test_jps_engine_matches_astar(self, MockContext):
+        """跳点搜索与 A* 路径长度一致，未知引擎在参数校验阶段被拒绝"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
+        wall_with_gap = Polygon(((5, 9), (5, 11), (20, 11), (20, 9), (5, 9)), srid=2385)
+        pillar = Point(4, 15, srid=2385).buffer(1.2)
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [wall_with_gap, pillar])
+        self.service.ctx = mock_ctx_instance
+
+        start = Point(10, 2, srid=2385)
+        end = Point(10, 18, srid=2385)
+        # 两种引擎可能选中不同的等长网格路径，关闭平滑后比较网格路径长度
+        with self.settings(GUIDE_SMOOTH_PATH=False):
+            astar_route = self.service.calculate_route(1, start, end, engine='astar')
+            jps_route = self.service.calculate_route(1, start, end, engine='jps')
+            self.assertAlmostEqual(jps_route.length, astar_route.length, places=6)
+            self.assertEqual(jps_route.coords[0], astar_route.coords[0])
+            self.assertEqual(jps_route.coords[-1], astar_route.coords[-1])
+
+            with self.settings(GUIDE_ROUTE_ENGINE='jps'):
+                route = self.service.calculate_route(1, start, end)
+                self.assertAlmostEqual(route.length, astar_route.length, places=6)
+
+        is_valid, error_msg = self.service.validate_request_params(
+            1, {"x": 1, "y": 1}, {"x": 2, "y": 2}, engine='dijkstra'
+        )
+        self.assertFalse(is_valid)
+        self.assertIn("Unknown engine", error_msg)
+
+    def test_validate_point(self):
+        """单点校验：错误信息指明出错的是起点还是终点，只有起点的请求不再把起点当终点校验"""
+        self.assertTrue(self.service.validate_point(1, {"x": 1, "y": 1})[0])
+        self.assertEqual(self.service.validate_point(None, {"x": 1, "y": 1}), (False, "Missing parameter: map_id"))
+        self.assertEqual(self.service.validate_point(1, {"x": "a", "y": 1}),
+                         (False, "Coordinates x and y must be valid numbers"))
+        self.assertEqual(self.service.validate_request_params(1, {"x": 1, "y": 1}, None),
+                         (False, "Missing parameter: end coordinates"))
+
+    @patch('guide.services.GuideContext')
+    def test_bidirectional_engine_matches_astar(self, MockContext):
+        """双向 A*：终点在只有一个门的房间里，路径长度与单向 A* 一致"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
+        room_walls = [
+            Polygon(((11, 11), (11, 18), (12, 18), (12, 11), (11, 11)), srid=2385),
+            Polygon(((12, 11), (12, 12), (18, 12), (18, 11), (12, 11)), srid=2385),
+            Polygon(((17, 12), (17, 18), (18, 18), (18, 12), (17, 12)), srid=2385),
+            Polygon(((11, 18), (11, 19), (13, 19), (13, 18), (11, 18)), srid=2385),
+        ]
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], room_walls)
+        self.service.ctx = mock_ctx_instance
+
         start = Point(2, 2, srid=2385)
-        end = Point(10, 10, srid=2385)  # 在盒子里面
+        end = Point(15, 15, srid=2385)
+        with self.settings(GUIDE_SMOOTH_PATH=False):
+            astar_route = self.service.calculate_route(1, start, end, engine='astar')
+            bidirectional_route = self.service.calculate_route(1, start, end, engine='bidirectional')
 
-        # 预期抛出 ValueError (因为 End node is not walkable)
-        # 或者如果 End node 勉强算 walkable 但无法到达，则返回 None
-        # 根据 services.py 逻辑，先检查 is_walkable
+        self.assertAlmostEqual(bidirectional_route.length, astar_route.length, places=6)
+        self.assertEqual(bidirectional_route.coords[0], astar_route.coords[0])
+        self.assertEqual(bidirectional_route.coords[-1], astar_route.coords[-1])
+        # 只能从上方的门进入房间
+        self.assertGreater(max(y for _, y in bidirectional_route.coords), 18)
 
-        # 由于障碍物占位，End point 所在的网格会被标记为 obstacle
-        with self.assertRaises(ValueError) as cm:
-            self.service.calculate_route(1, start, end)
+    @patch('guide.services.GuideContext')
+    def test_hpa_engine_on_large_floor(self, MockContext):
+        """分层寻路：长距离路线接近 A* 最优长度，抽象图随网格缓存、障碍物变化后重建"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
+        boundary = Polygon(((0, 0), (0, 60), (60, 60), (60, 0), (0, 0)), srid=2385)
+        walls = [
+            Polygon(((15, 0), (15, 45), (17, 45), (17, 0), (15, 0)), srid=2385),
+            Polygon(((35, 15), (35, 60), (37, 60), (37, 15), (35, 15)), srid=2385),
+        ]
+        mock_ctx_instance.get_map_geometry_data.return_value = (boundary, [], walls)
+        self.service.ctx = mock_ctx_instance
+
+        start = Point(2, 2, srid=2385)
+        end = Point(58, 58, srid=2385)
+        with self.settings(GUIDE_SMOOTH_PATH=False):
+            astar_route = self.service.calculate_route(1, start, end, engine='astar')
+            hpa_route = self.service.calculate_route(1, start, end, engine='hpa')
+
+        self.assertEqual(hpa_route.coords[0], astar_route.coords[0])
+        self.assertEqual(hpa_route.coords[-1], astar_route.coords[-1])
+        self.assertGreaterEqual(hpa_route.length, astar_route.length - 1e-6)
+        self.assertLess(hpa_route.length, astar_route.length * 1.2)
+        # 网格路径允许斜穿墙角，这里只检查每个顶点都不在墙内
+        for wall in walls:
+            self.assertFalse(any(wall.intersects(Point(coord)) for coord in hpa_route.coords))
+
+        grid = self.service.get_grid(1)
+        hierarchy = grid.derived(('hpa', 32), lambda: None)
+        self.assertIsNotNone(hierarchy)
+        grid.mark_obstacles([Point(50, 50, srid=2385).buffer(1)])
+        self.assertIsNone(grid.derived(('hpa', 32), lambda: None))
+
+    @patch('guide.services.GuideContext')
+    def test_quadtree_engine(self, MockContext):
+        """四叉树寻路：叶子数远少于格子数，路线绕开障碍物且长度接近 A*"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
+        boundary = Polygon(((0, 0), (0, 60), (60, 60), (60, 0), (0, 0)), srid=2385)
+        walls = [
+            Polygon(((15, 0), (15, 45), (17, 45), (17, 0), (15, 0)), srid=2385),
+            Polygon(((35, 15), (35, 60), (37, 60), (37, 15), (35, 15)), srid=2385),
+        ]
+        mock_ctx_instance.get_map_geometry_data.return_value = (boundary, [], walls)
+        self.service.ctx = mock_ctx_instance
+
+        start = Point(2, 2, srid=2385)
+        end = Point(58, 58, srid=2385)
+        astar_route = self.service.calculate_route(1, start, end, engine='astar')
+        quadtree_route = self.service.calculate_route(1, start, end, engine='quadtree')
+
+        self.assertEqual(quadtree_route.coords[0], astar_route.coords[0])
+        self.assertEqual(quadtree_route.coords[-1], astar_route.coords[-1])
+        self.assertLess(quadtree_route.length, astar_route.length * 1.15)
+        # 与 HPA* 用例相同，只检查每个顶点都不在墙内
+        for wall in walls:
+            self.assertFalse(any(wall.intersects(Point(coord)) for coord in quadtree_route.coords))
+
+        stats = self.service.get_grid(1).derived(('quadtree', 16), lambda: None).stats()
+        self.assertLess(stats['leaf_nodes'], stats['grid_nodes'] * 0.1)
+        self.assertLess(stats['quadtree_bytes'], stats['grid_bytes'])
+
+    @patch('guide.services.GuideContext')
+    def test_clearance_routing(self, MockContext):
+        """净空约束：窄缝宽度不足时改走宽通道；居中代价让路线离开墙边"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
+        # 横墙在 x=4~5 处留 1 米窄缝，在 x=12~16 处留 4 米宽口
+        walls = [
+            Polygon(((0, 9), (0, 11), (4, 11), (4, 9), (0, 9)), srid=2385),
+            Polygon(((5, 9), (5, 11), (12, 11), (12, 9), (5, 9)), srid=2385),
+            Polygon(((16, 9), (16, 11), (20, 11), (20, 9), (16, 9)), srid=2385),
+        ]
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], walls)
+        self.service.ctx = mock_ctx_instance
+        start = Point(4.5, 3, srid=2385)
+        end = Point(4.5, 17, srid=2385)
+
+        # 1. 不限制净空：直接穿过窄缝
+        route = self.service.calculate_route(1, start, end)
+        self.assertLess(route.length, 15)
 
-        self.assertIn("End node is not walkable", str(cm.exception))
+        # 2. 要求 0.8 米净空：窄缝不可走，绕到宽口，且全程与墙保持距离
+        route = self.service.calculate_route(1, start, end, clearance=0.8)
+        self.assertGreater(route.length, 20)
+        for wall in walls:
+            self.assertGreater(route.distance(wall), 0.5)
 
+        # 3. 净空场按网格缓存，同一要求的过滤网格只构建一次
+        grid = self.service.get_grid(1)
+        self.assertIs(grid.with_clearance(0.8), grid.with_clearance(0.8))
+        self.assertEqual(grid.clearance().shape, (grid.width, grid.height))
 
-class GuideIntegrationTestCase(APITestCase):
+        # 4. 居中代价：贴着外墙的起终点，路线中段离开墙边
+        start = Point(1, 0.5, srid=2385)
+        end = Point(19, 0.5, srid=2385)
+        plain = self.service.calculate_route(1, start, end)
+        centered = self.service.calculate_route(1, start, end, centering=2.0)
+        self.assertLess(max(y for _, y in plain.coords), 1)
+        self.assertGreater(max(y for _, y in centered.coords), 1.5)
+
+        # 5. 参数校验
+        self.assertTrue(self.service.validate_route_options(0.45, 2)[0])
+        self.assertFalse(self.service.validate_route_options(-1, None)[0])
+        self.assertFalse(self.service.validate_route_options(None, 'wide')[0])
+
+    @patch('guide.services.GuideContext')
+    def test_temporary_closure(self, MockContext):
+        """临时封闭区域：叠加在基础网格上参与寻路，增删与过期都不重建基础网格"""
+        self.addCleanup(cache.clear)
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [])
+        self.service.ctx = mock_ctx_instance
+        start = Point(2, 10, srid=2385)
+        end = Point(18, 10, srid=2385)
+
+        direct = self.service.plan_route(1, start, end)
+        base_grid = self.service.get_grid(1)
+
+        # 1. 封闭中间通道，只在上端留出口：路线绕行，命中的不是封闭前的缓存结果
+        closure = ClosureStore.add(1, Polygon(((9, 0), (9, 16), (11, 16), (11, 0), (9, 0)), srid=2385), 600)
+        detour = self.service.plan_route(1, start, end)
+        self.assertGreater(detour['distance'], direct['distance'] + 3)
+        self.assertIs(self.service.get_grid(1), base_grid)
+        self.assertTrue(base_grid.is_walkable(*base_grid.world_to_grid(10, 10)))
+        # 同一组封闭区域的叠加网格被复用，缓存在单独的 LRU 中，不挂在共享的基础网格上
+        self.assertIs(self.service.get_routing_grid(1), self.service.get_routing_grid(1))
+        self.assertEqual(len(closure_overlay_cache), 1)
+        self.assertNotIn('closure_overlay', base_grid._derived)
+
+        # 2. 到期后自动失效
+        with patch('guide.closures.time.time', return_value=closure['expires_at'] + 1):
+            self.assertEqual(ClosureStore.active(1), [])
+            self.assertEqual(self.service.plan_route(1, start, end)['distance'], direct['distance'])
+
+        # 3. 提前解除
+        self.assertIsNotNone(ClosureStore.remove(1, closure['id']))
+        self.assertIsNone(ClosureStore.remove(1, closure['id']))
+        self.assertEqual(self.service.plan_route(1, start, end)['distance'], direct['distance'])
+        self.assertIs(self.service.get_grid(1), base_grid)
+
+    def test_concurrent_closure_updates(self):
+        """并发添加/删除封闭区域：楼层索引的修改互斥，不丢失任何一次修改"""
+        self.addCleanup(cache.clear)
+        shape = Polygon(((9, 0), (9, 4), (11, 4), (11, 0), (9, 0)), srid=2385)
+        removed = [ClosureStore.add(1, shape, 600) for _ in range(4)]
+
+        # 放大读-改-写之间的时间窗口：没有锁时并发的修改会互相覆盖
+        # (缓存连接是线程本地的，要在后端类上打补丁，各线程才都会生效)
+        backend = type(ClosureStore._cache())
+        original_get = backend.get
+
+        def slow_get(self, key, *args, **kwargs):
+            value = original_get(self, key, *args, **kwargs)
+            if key == ClosureStore._key(1):
+                time.sleep(0.005)
+            return value
+
+        added = []
+        with patch.object(backend, 'get', slow_get):
+            threads = [threading.Thread(target=lambda: added.append(ClosureStore.add(1, shape, 600)))
+                       for _ in range(8)]
+            threads += [threading.Thread(target=ClosureStore.remove, args=(1, closure['id'])) for closure in removed]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual([closure['id'] for closure in ClosureStore.active(1)],
+                         sorted(closure['id'] for closure in added))
+
+    @patch('guide.services.GuideContext')
+    def test_incremental_grid_patch(self, MockContext):
+        """增量更新：挪动一个商铺后修补出的网格与派生表，与整层重新构建的结果一致"""
+        mock_ctx_instance = MockContext.return_value
+        neighbor = Polygon(((6, 6), (6, 9), (9, 9), (9, 6), (6, 6)), srid=2385)
+        # 紧贴旧外包矩形右侧 (x=12) 但不与之相交：旧窗口最后一列格子 (中心 x=12.25) 被清空后要由它重新标记
+        edge_neighbor = Polygon(((12.1, 8), (12.1, 12), (13, 12), (13, 8), (12.1, 8)), srid=2385)
+        old_shape = Polygon(((8, 8), (8, 12), (12, 12), (12, 8), (8, 8)), srid=2385)
+        new_shape = Polygon(((14, 2), (14, 5), (17, 5), (17, 2), (14, 2)), srid=2385)
+        self.service.versions.get_version.return_value = 1
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [neighbor, edge_neighbor, old_shape])
+        self.service.ctx = mock_ctx_instance
+
+        base = self.service.get_grid(1)
+        base.clearance()
+        base.nearest_walkable(10, 10)
+
+        # 1. 商铺挪走：数据库里已是新形状，旧外包窗口内只剩相邻商铺
+        obstacles = [neighbor, edge_neighbor, new_shape]
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], obstacles)
+        mock_ctx_instance.get_obstacles_in_extent.side_effect = lambda map_id, extent: [
+            shape for shape in obstacles if shape.envelope.intersects(Polygon.from_bbox(extent))]
+        # 中间隔了其他修改的版本不修补
+        self.assertFalse(self.service.patch_grid(1, 1, 3, old_shape, new_shape))
+        self.assertTrue(self.service.patch_grid(1, 1, 2, old_shape, new_shape))
+
+        self.service.versions.get_version.return_value = 2
+        patched = self.service.get_grid(1)
+        self.assertEqual(patched.cache_key, (1, 2))
+        self.assertIsNot(patched, base)
+        self.assertFalse(base.is_walkable(20, 20))
+
+        # 2. 与完整构建的结果比较
+        rebuilt = self.service._build_grid(1)
+        self.assertFalse(patched.is_walkable(24, 20))
+        self.assertTrue(np.array_equal(patched.walkable, rebuilt.walkable))
+        self.assertTrue(np.allclose(patched.clearance(), rebuilt.clearance()))
+        self.assertTrue(np.array_equal(patched.component_labels() > 0, rebuilt.component_labels() > 0))
+        for cell in [(20, 20), (29, 7), (15, 15), (0, 0)]:
+            got, expected = patched.nearest_walkable(*cell), rebuilt.nearest_walkable(*cell)
+            self.assertEqual((got[0] - cell[0]) ** 2 + (got[1] - cell[1]) ** 2,
+                             (expected[0] - cell[0]) ** 2 + (expected[1] - cell[1]) ** 2)
+
+        # 3. 新版本写入了网格文件 (旧版本文件被清理)，其他进程可以直接加载
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['map_1_v2_grid.bin'])
+        loaded = self.service._load_grid(os.path.join(self.tmp_dir.name, 'map_1_v2_grid.bin'))
+        self.assertTrue(np.array_equal(loaded.walkable, rebuilt.walkable))
+
+    def test_geometry_change_signal(self):
+        """地图模块的元素几何修改信号由导航模块接收，转交增量更新"""
+        with patch.object(GridPatchService, 'element_changed') as mock_changed:
+            element_geometry_changed.send(sender=None, element_type='store', old_versions={1: 1},
+                                          old_geometry=None, new_geometry=self.map_boundary)
+        mock_changed.assert_called_once_with('store', {1: 1}, None, self.map_boundary)
+
+    @patch('guide.services.GuideContext')
+    def test_path_smoothing(self, MockContext):
+        """视线平滑：开阔区域只剩起终点，绕墙时只保留转折点且距离不长于网格路径"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
+        wall_with_gap = Polygon(((5, 9), (5, 11), (20, 11), (20, 9), (5, 9)), srid=2385)
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [wall_with_gap])
+        self.service.ctx = mock_ctx_instance
+
+        # 1. 斜向直线：中间的锯齿顶点全部被拉直
+        route = self.service.calculate_route(1, Point(2, 2, srid=2385), Point(4, 7, srid=2385))
+        self.assertEqual(len(route.coords), 2)
+
+        # 2. 绕墙：顶点数大幅减少，距离变短，且每一段都不穿过墙体
+        start = Point(10, 2, srid=2385)
+        end = Point(10, 18, srid=2385)
+        with self.settings(GUIDE_SMOOTH_PATH=False):
+            raw_route = self.service.calculate_route(1, start, end)
+        route = self.service.calculate_route(1, start, end)
+
+        self.assertLess(len(route.coords), 6)
+        self.assertLess(route.length, raw_route.length)
+        self.assertFalse(route.intersects(wall_with_gap))
+
+    @patch('guide.services.GuideContext')
+    def test_routes_to_targets_sorted_by_distance(self, MockContext):
+        """一对多：一次扩散求出到各设施的距离，按远近排序，被围住的设施不返回"""
+        mock_ctx_instance = MockContext.return_value
+        self.service.versions.get_version.return_value = 1
+        # (15, 15) 处的设施被一圈墙围住
+        enclosure = Polygon(((12, 12), (12, 18), (18, 18), (18, 12), (12, 12)),
+                            ((13, 13), (17, 13), (17, 17), (13, 17), (13, 13)), srid=2385)
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [enclosure])
+        mock_ctx_instance.get_facility_targets.return_value = [
+            (1, Point(10, 2, srid=2385)), (2, Point(3, 3, srid=2385)), (3, Point(15, 15, srid=2385)),
+        ]
+        self.service.ctx = mock_ctx_instance
+
+        results = self.service.calculate_routes_to_targets(1, Point(2, 2, srid=2385), {"facility_type": 1})
+
+        self.assertEqual([item['id'] for item in results], [2, 1])
+        self.assertEqual(results[0]['type'], 'facility')
+        self.assertLess(results[0]['distance'], results[1]['distance'])
+        # 到达点在设施 1 米范围内
+        self.assertLessEqual(Point(results[1]['route'].coords[-1]).distance(Point(10, 2)), 1.0)
+        mock_ctx_instance.get_facility_targets.assert_called_once_with(1, facility_ids=None, facility_type=1)
+
+        is_valid, _ = self.service.validate_targets_request_params(
+            1, {"x": 1, "y": 1}, {"facility_type": 1, "store_ids": [2]}
+        )
+        self.assertFalse(is_valid)
+
+    @patch('guide.services.GuideContext')
+    def test_building_route_across_floors(self, MockContext):
+        """跨楼层：1 楼 -> 3 楼，经 1-2 楼的扶梯 7 与 2-3 楼分层绘制的扶梯 8/9 换乘"""
+        mock_ctx_instance = MockContext.return_value
+        mock_ctx_instance.get_map_floor.side_effect = lambda map_id: {1: (1, 1), 2: (1, 2), 3: (1, 3)}.get(map_id)
+        mock_ctx_instance.get_building_maps.return_value = [(1, 1, 0), (2, 2, 0), (3, 3, 0)]
+        self.service.versions.get_version.return_value = 0
+        mock_ctx_instance.get_map_geometry_data.return_value = (self.map_boundary, [], [])
+        mock_ctx_instance.get_connector_facilities.return_value = [
+            (7, 1, Point(18, 2, srid=2385)), (7, 2, Point(18, 2, srid=2385)),
+            (8, 2, Point(2, 18, srid=2385)), (9, 3, Point(2.5, 18, srid=2385)),
+        ]
+        self.service.ctx = mock_ctx_instance
+
+        legs = self.service.calculate_building_route(1, Point(2, 2, srid=2385), 3, Point(18, 18, srid=2385))
+
+        self.assertEqual([leg['map_id'] for leg in legs], [1, 2, 3])
+        self.assertEqual([leg['exit_facility_id'] for leg in legs], [7, 8, None])
+        # 起点 -> 扶梯 7 -> (2 楼) -> 扶梯 8 -> (3 楼) -> 终点，每段都是平滑后的直线
+        self.assertEqual(legs[0]['route'].coords[0], (2.25, 2.25))
+        self.assertEqual(legs[-1]['route'].coords[-1], (18.25, 18.25))
+        for leg in legs:
+            self.assertEqual(len(leg['route'].coords), 2)
+
+        # 楼层转换图按建筑缓存，第二次请求不再查询设施
+        self.service.calculate_building_route(1, Point(2, 2, srid=2385), 3, Point(18, 18, srid=2385))
+        self.assertEqual(mock_ctx_instance.get_connector_facilities.call_count, 1)
+
+        # 没有连通的设施时不可达
+        floor_graph_cache.clear()
+        mock_ctx_instance.get_connector_facilities.return_value = [(7, 1, Point(18, 2, srid=2385))]
+        self.assertIsNone(
+            self.service.calculate_building_route(1, Point(2, 2, srid=2385), 3, Point(18, 18, srid=2385))
+        )
+
+
+class StoreDistanceMatrixServiceTestCase(GuideDataDirMixin, TestCase):
+    """
+    测试商铺距离矩阵的计算与按版本持久化
+    """
+
+    def setUp(self):
+        super().setUp()
+        boundary = self.rect(0, 0, 20, 20)
+        self.stores = [(11, self.rect(1, 1, 4, 4)), (12, self.rect(1, 12, 4, 15)), (13, self.rect(14, 1, 17, 4))]
+        self.service = StoreDistanceMatrixService()
+        self.service.ctx = MagicMock()
+        self.service.versions = MagicMock()
+        self.service.versions.get_version.return_value = 1
+        self.service.ctx.get_store_targets.return_value = self.stores
+        self.service.route_service.ctx = self.service.ctx
+        self.service.route_service.versions = self.service.versions
+        self.service.ctx.get_map_geometry_data.return_value = (boundary, [], [shape for _, shape in self.stores])
+
+    def test_build_and_refresh(self):
+        with self.settings(GUIDE_STORE_MATRIX_ASYNC=False):
+            self.assertIsNone(self.service.get_matrix(1))
+            self.assertTrue(self.service.schedule_build(1))
+
+            version, store_ids, distances = self.service.get_matrix(1)
+            self.assertEqual(version, 1)
+            self.assertEqual(store_ids, [11, 12, 13])
+            self.assertEqual(distances.dtype, np.float32)
+            self.assertTrue(np.allclose(distances, distances.T))
+            # 商铺 11 与 12 之间空地约 8 米，出入口各向外扩 1 米
+            self.assertAlmostEqual(float(distances[0, 1]), 6.0, delta=1.0)
+            self.assertLess(distances[0, 1], distances[1, 2])
+
+            # 楼层修改后版本号递增：旧文件被清理，新版本需要重新计算
+            self.service.versions.get_version.return_value = 2
+            self.assertIsNone(self.service.get_matrix(1))
+            self.service.schedule_build(1)
+            self.assertEqual(self.service.get_matrix(1)[0], 2)
+            # 同一目录下还有导航网格文件，这里只看距离矩阵
+            matrices = [name for name in os.listdir(self.tmp_dir.name) if name.endswith('_store_matrix.npz')]
+            self.assertEqual(matrices, ['map_1_v2_store_matrix.npz'])
+
+    def test_build_discarded_when_map_changes(self):
+        """计算期间楼层被修改：结果不写入旧版本的文件，也不删除更新版本的文件"""
+        self.service.build_matrix(1, 1)
+        # 其他进程已经算好了版本 2
+        self.service.versions.get_version.return_value = 2
+        self.service.build_matrix(1, 2)
+
+        # 版本 1 的后台任务这时才结束：网格与商铺取自版本 1 之后的数据库状态
+        with patch.object(self.service.versions, 'get_version', side_effect=[2]):
+            self.assertIsNone(self.service.build_matrix(1, 1))
+        matrices = [name for name in os.listdir(self.tmp_dir.name) if name.endswith('_store_matrix.npz')]
+        self.assertEqual(matrices, ['map_1_v2_store_matrix.npz'])
+
+        # 即使写入了旧版本，也只清理比它更早的文件
+        GuideDataStore.discard_stale(1, 1, StoreDistanceMatrixService.MATRIX_NAME)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, 'map_1_v2_store_matrix.npz')))
+
+
+class ReachabilityServiceTestCase(GuideDataDirMixin, TestCase):
+    """
+    测试可达范围 (等时圈) 的分段区域与目标归类
+    """
+
+    def setUp(self):
+        super().setUp()
+        # 40x10 米的走廊，x=20 处一道墙只在上端留 2 米通道
+        boundary = self.rect(0, 0, 40, 10)
+        self.wall = self.rect(20, 0, 21, 8)
+        self.stores = [(11, self.rect(8, 1, 10, 3)), (12, self.rect(24, 1, 26, 3))]
+        self.service = ReachabilityService()
+        self.service.ctx = MagicMock()
+        self.service.ctx.get_store_targets.return_value = self.stores
+        self.service.ctx.get_facility_targets.return_value = [(7, Point(2, 9, srid=2385))]
+        self.service.route_service.ctx = self.service.ctx
+        self.service.route_service.versions = MagicMock()
+        self.service.route_service.versions.get_version.return_value = 1
+        self.service.ctx.get_map_geometry_data.return_value = (
+            boundary, [], [self.wall] + [shape for _, shape in self.stores])
+
+    def test_bands(self):
+        results = self.service.calculate_reachability(1, Point(2, 2, srid=2385), [25, 15])
+
+        # 1. 分段按上限升序，区域互不重叠
+        self.assertEqual([item['limit'] for item in results], [15, 25])
+        near, far = results[0]['area'], results[1]['area']
+        self.assertAlmostEqual(near.intersection(far).area, 0, places=6)
+        self.assertFalse(near.intersects(self.wall.buffer(-0.1)))
+        # 直线 15 米以内、墙左侧的点在第一段；墙后方直线距离 20 米但需绕行约 28 米，不在 25 米内
+        self.assertTrue(near.contains(Point(12, 2)))
+        self.assertFalse(near.union(far).contains(Point(22, 1)))
+
+        # 2. 目标按最近到达点归入各自分段
+        self.assertEqual([item['id'] for item in results[0]['stores']], [11])
+        self.assertEqual([item['id'] for item in results[0]['facilities']], [7])
+        self.assertEqual(results[1]['stores'], [])
+
+        # 3. 按秒计算：折算为步行距离
+        with self.settings(GUIDE_WALKING_SPEED=1.0):
+            results = self.service.calculate_reachability(1, Point(2, 2, srid=2385), [60], unit='seconds')
+        self.assertEqual(results[0]['distance'], 60)
+        self.assertEqual([item['id'] for item in results[0]['stores']], [11, 12])
+
+    def test_validate_request_params(self):
+        start = {"x": 2, "y": 2}
+        self.assertTrue(self.service.validate_request_params(1, start, [60, 120], 'seconds')[0])
+        self.assertFalse(self.service.validate_request_params(1, start, [], 'meters')[0])
+        self.assertFalse(self.service.validate_request_params(1, start, [-5], 'meters')[0])
+        self.assertFalse(self.service.validate_request_params(1, start, [10], 'minutes')[0])
+        self.assertFalse(self.service.validate_request_params(1, start, [100000], 'meters')[0])
+
+
+class TourPlanServiceTestCase(GuideDataDirMixin, TestCase):
+    """
+    测试多站点路线：访问顺序求解与各段路线
+    """
+
+    def setUp(self):
+        super().setUp()
+        boundary = self.rect(0, 0, 30, 30)
+        # 商铺 ID 的顺序故意与沿途顺序不同
+        self.stores = [
+            (11, self.rect(25, 25, 28, 28)),
+            (12, self.rect(10, 2, 13, 5)),
+            (13, self.rect(25, 10, 28, 13)),
+            (14, self.rect(2, 25, 5, 28)),
+        ]
+        self.service = TourPlanService()
+        self.service.ctx = MagicMock()
+        self.service.ctx.get_store_targets.return_value = self.stores
+        self.service.route_service.ctx = self.service.ctx
+        self.service.route_service.versions = MagicMock()
+        self.service.route_service.versions.get_version.return_value = 1
+        self.service.ctx.get_map_geometry_data.return_value = (boundary, [], [shape for _, shape in self.stores])
+
+    def test_optimizer_matches_brute_force(self):
+        """随机实例上与穷举结果比较：最近邻 + 2-opt/Or-opt 不应差太多"""
+        rng = np.random.default_rng(7)
+        for _ in range(20):
+            points = rng.uniform(0, 100, size=(8, 2))
+            distances = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+            order = TourOptimizer.solve(distances)
+            self.assertEqual(sorted(order), list(range(1, 8)))
+
+            best = min(TourOptimizer.tour_length([0] + list(perm), distances)
+                       for perm in itertools.permutations(range(1, 8)))
+            self.assertLess(TourOptimizer.tour_length([0] + order, distances), best * 1.1)
+
+    def test_tour(self):
+        tour = self.service.calculate_tour(1, Point(1, 1, srid=2385), [11, 12, 13, 14, 99])
+
+        # 1. 沿外圈依次经过，不存在的商铺列为不可达
+        self.assertIn(tour['order'], ([12, 13, 11, 14], [14, 11, 13, 12]))
+        self.assertEqual(tour['unreachable'], [99])
+
+        # 2. 各段首尾都在对应商铺附近
+        legs = tour['legs']
+        self.assertIsNone(legs[0]['from'])
+        self.assertEqual([leg['from'] for leg in legs[1:]], tour['order'][:-1])
+        stores = dict(self.stores)
+        for leg in legs:
+            self.assertLessEqual(Point(leg['route'].coords[-1]).distance(stores[leg['to']]), 1.0)
+            self.assertGreater(leg['distance'], 0)
+        # 各段首尾相接：下一段从上一段到达的格子出发
+        for leg, next_leg in zip(legs, legs[1:]):
+            self.assertEqual(leg['route'].coords[-1], next_leg['route'].coords[0])
+        self.assertAlmostEqual(tour['distance'], sum(leg['distance'] for leg in legs))
+
+    def test_validate_request_params(self):
+        start = {"x": 1, "y": 1}
+        self.assertTrue(self.service.validate_request_params(1, start, [11, 12])[0])
+        self.assertFalse(self.service.validate_request_params(1, start, [])[0])
+        self.assertFalse(self.service.validate_request_params(1, start, ['a'])[0])
+        self.assertFalse(self.service.validate_request_params(1, start, list(range(16)))[0])
+
+
+class GuideIntegrationTestCase(GuideDataDirMixin, APITestCase):
     """
     第二步：集成测试
     测试 Views -> Services -> Context -> DB 的完整链路
     """
 
     def setUp(self):
+        # 导航网格与预计算数据写入临时目录，不与开发数据库的文件混用
+        super().setUp()
         # 1. 创建基础建筑 (外键依赖)
         self.building = Building.objects.create(
             name="Test Mall",
@@ -248,14 +1189,205 @@ class GuideIntegrationTestCase(APITestCase):
         # 打印一下结果看看
         print(f"\n[Integration Test] Route Distance: {data['distance']} meters")
 
+    def test_route_api_polyline_format(self):
+        """?format=polyline 与 Accept 头都可以选择折线编码的路线"""
+        payload = {
+            "map_id": self.map_obj.id,
+            "start": {"x": 2.0, "y": 2.0},
+            "end": {"x": 18.0, "y": 18.0}
+        }
+
+        response = self.client.post(self.url + '?format=polyline', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/vnd.guide.polyline+json')
+        self.assertEqual(response.data['route']['type'], 'EncodedPolyline')
+        self.assertGreater(len(PolylineCodec.decode(response.data['route']['points'])), 1)
+
+        response = self.client.post(self.url, payload, format='json',
+                                    HTTP_ACCEPT='application/vnd.guide.polyline+json')
+        self.assertEqual(response.data['route']['type'], 'EncodedPolyline')
+
+    def test_editor_shape_update_invalidates_grid(self):
+        """编辑器修改商铺形状后，地图版本号递增，导航网格按新几何重新构建"""
+        self.client.post(self.url, {
+            "map_id": self.map_obj.id,
+            "start": {"x": 2.0, "y": 2.0},
+            "end": {"x": 18.0, "y": 18.0}
+        }, format='json')
+        old_version = Map.objects.get(pk=self.map_obj.id).version
+
+        # 把商铺挪到角落，原本被挡住的 (10, 10) 变为可走
+        response = self.client.patch(
+            f'/api/editor/storearea/{self.store.id}/',
+            {"shape": "POLYGON((14 0, 14 4, 18 4, 18 0, 14 0))"},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Map.objects.get(pk=self.map_obj.id).version, old_version + 1)
+
+        response = self.client.post(self.url, {
+            "map_id": self.map_obj.id,
+            "start": {"x": 10.0, "y": 10.0},
+            "end": {"x": 18.0, "y": 18.0}
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_building_route_api(self):
+        """跨楼层接口：通过同时关联两层的扶梯从 1 楼走到 2 楼"""
+        boundary = Polygon(((0, 0), (0, 20), (20, 20), (20, 0), (0, 0)), srid=2385)
+        upper_map = Map.objects.create(
+            building=self.building,
+            floor_number=2,
+            detail=GeometryCollection(boundary, srid=2385)
+        )
+        escalator = Facility.objects.create(location=Point(18, 2, srid=2385), type=0, is_active=True)
+        FacilityMap.objects.create(facility=escalator, map=self.map_obj)
+        FacilityMap.objects.create(facility=escalator, map=upper_map)
+
+        response = self.client.post('/api/guide/route/building/', {
+            "start": {"map_id": self.map_obj.id, "x": 2.0, "y": 2.0},
+            "end": {"map_id": upper_map.id, "x": 2.0, "y": 18.0}
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        legs = response.data['legs']
+        self.assertEqual([leg['map_id'] for leg in legs], [self.map_obj.id, upper_map.id])
+        self.assertEqual(legs[0]['exit_facility_id'], escalator.id)
+        self.assertIsNone(legs[1]['exit_facility_id'])
+
+    def test_disabled_connector_changes_building_route(self):
+        """管理端停用换乘设施后楼层版本号递增，跨楼层路线改走另一部扶梯"""
+        upper_map = Map.objects.create(
+            building=self.building,
+            floor_number=2,
+            detail=GeometryCollection(self.rect(0, 0, 20, 20), srid=2385)
+        )
+        near = Facility.objects.create(location=Point(4, 2, srid=2385), type=0, is_active=True)
+        far = Facility.objects.create(location=Point(18, 2, srid=2385), type=0, is_active=True)
+        for facility in (near, far):
+            FacilityMap.objects.create(facility=facility, map=self.map_obj)
+            FacilityMap.objects.create(facility=facility, map=upper_map)
+        payload = {
+            "start": {"map_id": self.map_obj.id, "x": 2.0, "y": 2.0},
+            "end": {"map_id": upper_map.id, "x": 2.0, "y": 18.0}
+        }
+
+        response = self.client.post('/api/guide/route/building/', payload, format='json')
+        self.assertEqual(response.data['legs'][0]['exit_facility_id'], near.id)
+
+        old_version = Map.objects.get(pk=self.map_obj.id).version
+        FacilityService.update_facility(near.id, {"is_active": "false"})
+        self.assertEqual(Map.objects.get(pk=self.map_obj.id).version, old_version + 1)
+
+        response = self.client.post('/api/guide/route/building/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['legs'][0]['exit_facility_id'], far.id)
+
+    def test_targets_api(self):
+        """一对多接口：返回到商铺的步行距离与路径"""
+        response = self.client.post('/api/guide/route/targets/', {
+            "map_id": self.map_obj.id,
+            "start": {"x": 2.0, "y": 2.0},
+            "targets": {"store_ids": [self.store.id]},
+            "with_paths": True
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['id'], self.store.id)
+        self.assertIn("route", results[0])
+
+        # 字符串形式的布尔值按字面解析，无法识别的值返回 400
+        payload = {
+            "map_id": self.map_obj.id,
+            "start": {"x": 2.0, "y": 2.0},
+            "targets": {"store_ids": [self.store.id]},
+        }
+        for value in ("false", "0"):
+            response = self.client.post('/api/guide/route/targets/', dict(payload, with_paths=value), format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("route", response.data['results'][0])
+        response = self.client.post('/api/guide/route/targets/', dict(payload, with_paths="maybe"), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reachability_api(self):
+        """可达范围接口：返回各分段的 GeoJSON 区域与其中的商铺"""
+        response = self.client.post('/api/guide/reachability/', {
+            "map_id": self.map_obj.id,
+            "start": {"x": 2.0, "y": 2.0},
+            "bands": [5, 40],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        bands = response.data['bands']
+        self.assertEqual([band['limit'] for band in bands], [5, 40])
+        self.assertIn(bands[0]['area']['type'], ('Polygon', 'MultiPolygon'))
+        self.assertEqual(bands[0]['stores'], [])
+        self.assertEqual([store['id'] for store in bands[1]['stores']], [self.store.id])
+
+    def test_tour_api(self):
+        """多站点路线接口：返回访问顺序与每一段的路线"""
+        response = self.client.post('/api/guide/route/tour/', {
+            "map_id": self.map_obj.id,
+            "start": {"x": 2.0, "y": 2.0},
+            "store_ids": [self.store.id],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['order'], [self.store.id])
+        self.assertEqual(len(response.data['legs']), 1)
+        self.assertEqual(response.data['legs'][0]['route']['type'], 'LineString')
+        self.assertEqual(response.data['unreachable'], [])
+
+    def test_closures_api(self):
+        """临时封闭区域接口：添加后路线绕行，删除后恢复"""
+        self.addCleanup(cache.clear)
+        payload = {
+            "map_id": self.map_obj.id,
+            "start": {"x": 2.0, "y": 2.0},
+            "end": {"x": 18.0, "y": 2.0}
+        }
+        direct = self.client.post(self.url, payload, format='json').data['distance']
+
+        response = self.client.post('/api/guide/closures/', {
+            "map_id": self.map_obj.id,
+            "shape": "POLYGON((14 0, 14 6, 15 6, 15 0, 14 0))",
+            "duration": 600,
+            "reason": "maintenance",
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        closure_id = response.data['id']
+
+        response = self.client.get('/api/guide/closures/', {"map_id": self.map_obj.id})
+        self.assertEqual([item['id'] for item in response.data['closures']], [closure_id])
+        self.assertGreater(self.client.post(self.url, payload, format='json').data['distance'], direct)
+
+        response = self.client.delete(f'/api/guide/closures/{closure_id}/?map_id={self.map_obj.id}')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.post(self.url, payload, format='json').data['distance'], direct)
+
+        # 封闭区域的写接口与编辑器的写接口使用同一组权限类
+        for view in (ClosureListView, ClosureDetailView):
+            self.assertEqual(view.permission_classes, EditorStoreareaViewSet.permission_classes)
+
+    def test_store_distances_api(self):
+        """商铺距离矩阵接口：同步计算后返回整张矩阵"""
+        with self.settings(GUIDE_STORE_MATRIX_ASYNC=False):
+            response = self.client.get('/api/guide/store_distances/', {"map_id": self.map_obj.id})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['store_ids'], [self.store.id])
+        self.assertEqual(response.data['distances'], [[0.0]])
+
     def test_api_missing_params(self):
         """测试参数缺失情况"""
         payload = {"map_id": self.map_obj.id}  # 缺少 start/end
         response = self.client.post(self.url, payload, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-    def test_api_invalid_coordinates(self):
-        """测试无效坐标 (起点在墙里)"""
+    def test_api_snaps_start_inside_store(self):
+        """起点在商铺内部时吸附到商铺外最近的可走格子，一次请求即可得到路线"""
         # 起点 (10, 10) 正好在刚才创建的 Storearea 内部
         payload = {
             "map_id": self.map_obj.id,
@@ -264,6 +1396,19 @@ class GuideIntegrationTestCase(APITestCase):
         }
         response = self.client.post(self.url, payload, format='json')
 
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["start"]["snapped"])
+        self.assertFalse(response.data["end"]["snapped"])
+
+    def test_api_invalid_coordinates(self):
+        """测试无效坐标 (起点远在地图之外，超出吸附距离)"""
+        payload = {
+            "map_id": self.map_obj.id,
+            "start": {"x": 100.0, "y": 100.0},
+            "end": {"x": 18.0, "y": 18.0}
+        }
+        response = self.client.post(self.url, payload, format='json')
+
         # 预期报错：Start node is not walkable
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("error", response.data)
\ No newline at end of file
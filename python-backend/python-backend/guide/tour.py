@@ -0,0 +1,95 @@
+from typing import List
+
+import numpy as np
+
+
+class TourOptimizer:
+    """
+    多站点逛街路线的访问顺序 (开放式 TSP：从起点出发，依次经过全部站点，不要求回到起点)
+    站点数只有十几个，用最近邻构造初始解，再交替做 2-opt 与 Or-opt 局部改进，直到没有改进为止
+    距离矩阵的第 0 行/列为起点，1..n 为各站点；起点始终固定在路线开头
+    """
+
+    # 局部改进的最大轮数 (每轮 2-opt + Or-opt)，防止浮点误差导致来回震荡
+    MAX_ROUNDS = 50
+
+    @staticmethod
+    def solve(distances: np.ndarray) -> List[int]:
+        """
+        :param distances: (n+1) x (n+1) 距离矩阵，不要求对称
+        :return: 站点的访问顺序 (矩阵下标 1..n 的排列)
+        """
+        if len(distances) <= 2:
+            return list(range(1, len(distances)))
+
+        tour = TourOptimizer.nearest_neighbour(distances)
+        for _ in range(TourOptimizer.MAX_ROUNDS):
+            improved = TourOptimizer.two_opt(tour, distances)
+            improved = TourOptimizer.or_opt(tour, distances) or improved
+            if not improved:
+                break
+        return tour[1:]
+
+    @staticmethod
+    def tour_length(tour: List[int], distances: np.ndarray) -> float:
+        return float(sum(distances[a, b] for a, b in zip(tour, tour[1:])))
+
+    @staticmethod
+    def nearest_neighbour(distances: np.ndarray) -> List[int]:
+        """从起点出发，每次走向最近的未访问站点"""
+        remaining = set(range(1, len(distances)))
+        tour = [0]
+        while remaining:
+            current = tour[-1]
+            nearest = min(remaining, key=lambda node: (distances[current, node], node))
+            remaining.discard(nearest)
+            tour.append(nearest)
+        return tour
+
+    @staticmethod
+    def two_opt(tour: List[int], distances: np.ndarray) -> bool:
+        """
+        2-opt：翻转 tour[i..j]，即把边 (i-1, i) 与 (j, j+1) 换成 (i-1, j) 与 (i, j+1)
+        路线是开放的，j 为末尾时只有一条边被替换
+        距离矩阵不对称时翻转段内部的代价也会变化，因此直接比较翻转前后整段的长度
+        :return: 是否有改进 (原地修改 tour)
+        """
+        improved = False
+        size = len(tour)
+        for i in range(1, size - 1):
+            for j in range(i + 1, size):
+                before = TourOptimizer.tour_length(tour[i - 1:j + 2], distances)
+                candidate = tour[:i] + tour[i:j + 1][::-1] + tour[j + 1:]
+                after = TourOptimizer.tour_length(candidate[i - 1:j + 2], distances)
+                if after < before - 1e-9:
+                    tour[:] = candidate
+                    improved = True
+        return improved
+
+    @staticmethod
+    def or_opt(tour: List[int], distances: np.ndarray) -> bool:
+        """
+        Or-opt：把连续 1~3 个站点整段挪到路线的其他位置 (保持原方向)
+        :return: 是否有改进 (原地修改 tour)
+        """
+        improved = False
+        for length in (1, 2, 3):
+            i = 1
+            while i + length <= len(tour):
+                segment = tour[i:i + length]
+                rest = tour[:i] + tour[i + length:]
+                current = TourOptimizer.tour_length(tour, distances)
+                best, best_tour = current, None
+                # 插入到 rest[k-1] 之后 (k >= 1，起点不动)
+                for k in range(1, len(rest) + 1):
+                    if k == i:
+                        continue
+                    candidate = rest[:k] + segment + rest[k:]
+                    length_after = TourOptimizer.tour_length(candidate, distances)
+                    if length_after < best - 1e-9:
+                        best, best_tour = length_after, candidate
+                if best_tour is not None:
+                    tour[:] = best_tour
+                    improved = True
+                i += 1
+        return improved
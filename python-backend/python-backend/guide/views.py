@@ -1,11 +1,26 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
-from django.contrib.gis.geos import Point
+from rest_framework import serializers, status
+from rest_framework.settings import api_settings
+from django.contrib.gis.geos import GEOSGeometry, Point
+from datetime import datetime, timezone
 import json
+import numpy as np
 
 # 导入服务类
-from .services import RoutePlanService
+from .pathfinding import SearchBudgetExceeded
+from .renderers import PolylineJSONRenderer
+from .services import RoutePlanService, ReachabilityService, StoreDistanceMatrixService, TourPlanService, \
+    ClosureService, grid_cache, floor_graph_cache, route_cache, closure_overlay_cache
+
+
+# 返回路线的接口额外支持紧凑的折线编码格式 (Accept: application/vnd.guide.polyline+json 或 ?format=polyline)
+ROUTE_RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + [PolylineJSONRenderer]
+
+
+def route_format_of(request) -> str:
+    """内容协商选中 PolylineJSONRenderer 时路线使用折线编码，否则为 GeoJSON"""
+    return 'polyline' if isinstance(getattr(request, 'accepted_renderer', None), PolylineJSONRenderer) else 'geojson'
 
 
 class RoutePlanView(APIView):
@@ -14,18 +29,27 @@ class RoutePlanView(APIView):
     接收起点终点坐标，返回路径规划结果
     """
     service_class = RoutePlanService
+    renderer_classes = ROUTE_RENDERER_CLASSES
 
     def post(self, request):
         service = self.service_class()
 
         # 读取前端传参
         # 前端传参示例: {"map_id": 1, "start": {"x": 10.0, "y": 20.0}, "end": {"x": 50.0, "y": 60.0}}
+        # 可选参数 engine: "astar" / "jps" / "bidirectional" / "hpa" / "quadtree"，不传时使用 GUIDE_ROUTE_ENGINE 配置
+        # 可选参数 clearance: 路线到障碍物的最小距离 (米)，如轮椅通行传 0.45
+        # 可选参数 centering: 居中代价权重 (如 2.0)，路线尽量走在通道中间
         map_id = request.data.get('map_id')
         start_data = request.data.get('start')
         end_data = request.data.get('end')
+        engine = request.data.get('engine')
+        clearance = request.data.get('clearance')
+        centering = request.data.get('centering')
 
         # 这一步负责检查参数是否存在、格式是否正确、坐标是否可转换为浮点数
-        is_valid, error_msg = service.validate_request_params(map_id, start_data, end_data)
+        is_valid, error_msg = service.validate_request_params(map_id, start_data, end_data, engine)
+        if is_valid:
+            is_valid, error_msg = service.validate_route_options(clearance, centering)
 
         if not is_valid:
             return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
@@ -39,22 +63,373 @@ class RoutePlanView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # 预期 service 返回一个 LineString 对象
-            route_geometry = service.calculate_route(map_id, start_point, end_point)
+            # service 返回 {"route": GeoJSON 或折线编码, "distance": 米, "start": {...}, "end": {...}}
+            # start / end 为吸附到可走格子后的起终点；相同楼层版本与起终点格子的结果来自缓存
+            response_data = service.plan_route(
+                map_id, start_point, end_point, engine,
+                clearance=float(clearance) if clearance is not None else None,
+                centering=float(centering) if centering is not None else None,
+                route_format=route_format_of(request),
+            )
 
-            if not route_geometry:
+            if not response_data:
                 return Response({"error": "Route not found or unreachable"}, status=status.HTTP_404_NOT_FOUND)
 
-            # 构造返回
-            response_data = {
-                # json.loads(route_geometry.geojson) 将 GeoJSON 字符串转为 Python 字典/列表
-                "route": json.loads(route_geometry.geojson),
-                # route_geometry.length 自动计算米制长度，然后保留 2 位小数
-                "distance": round(route_geometry.length, 2)
-            }
-
             return Response(response_data)
 
+        except SearchBudgetExceeded as e:
+            # 搜索超出节点数/耗时预算：与 “不可达” 区分开，客户端不应原样重试
+            return Response({"error": str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         except Exception as e:
             # 捕获如算法内部抛出的业务异常
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class BuildingRoutePlanView(APIView):
+    """
+    POST /api/guide/route/building/
+    跨楼层路径规划：起点、终点可以位于同一建筑的不同楼层
+    """
+    service_class = RoutePlanService
+    renderer_classes = ROUTE_RENDERER_CLASSES
+
+    def post(self, request):
+        service = self.service_class()
+
+        # 前端传参示例:
+        # {"start": {"map_id": 1, "x": 10.0, "y": 20.0}, "end": {"map_id": 3, "x": 50.0, "y": 60.0}, "engine": "jps"}
+        start_data = request.data.get('start')
+        end_data = request.data.get('end')
+        engine = request.data.get('engine')
+
+        is_valid, error_msg = service.validate_building_request_params(start_data, end_data, engine)
+        if not is_valid:
+            return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start_point = Point(float(start_data['x']), float(start_data['y']), srid=2385)
+            end_point = Point(float(end_data['x']), float(end_data['y']), srid=2385)
+            legs = service.calculate_building_route(
+                start_data['map_id'], start_point, end_data['map_id'], end_point, engine
+            )
+
+            if not legs:
+                return Response({"error": "Route not found or unreachable"}, status=status.HTTP_404_NOT_FOUND)
+
+            # 构造返回：按行进顺序的分楼层路线
+            response_legs = []
+            for leg in legs:
+                response_legs.append({
+                    "map_id": leg['map_id'],
+                    "floor_number": leg['floor_number'],
+                    "route": RoutePlanService.format_route(leg['route'].coords, route_format_of(request)),
+                    "distance": round(leg['route'].length, 2),
+                    # 离开本层时乘坐的电梯/扶梯，最后一段为 null
+                    "exit_facility_id": leg['exit_facility_id'],
+                })
+
+            return Response({
+                "legs": response_legs,
+                "distance": round(sum(leg['route'].length for leg in legs), 2)
+            })
+
+        except SearchBudgetExceeded as e:
+            # 搜索超出节点数/耗时预算：与 “不可达” 区分开，客户端不应原样重试
+            return Response({"error": str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class TargetRoutePlanView(APIView):
+    """
+    POST /api/guide/route/targets/
+    一对多路径规划：从一个起点到一组设施/商铺，按步行距离从近到远返回
+    """
+    service_class = RoutePlanService
+    renderer_classes = ROUTE_RENDERER_CLASSES
+
+    def post(self, request):
+        service = self.service_class()
+
+        # 前端传参示例:
+        # {"map_id": 1, "start": {"x": 10.0, "y": 20.0}, "targets": {"facility_type": 1}, "with_paths": false}
+        # targets 三选一: {"facility_ids": [1, 2]} / {"facility_type": 1} / {"store_ids": [3, 4]}
+        map_id = request.data.get('map_id')
+        start_data = request.data.get('start')
+        targets_data = request.data.get('targets')
+
+        is_valid, error_msg = service.validate_targets_request_params(map_id, start_data, targets_data)
+        if not is_valid:
+            return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 表单/查询串客户端传来的是字符串，"false"、"0" 不能按真值处理
+        try:
+            with_paths = serializers.BooleanField().to_internal_value(request.data.get('with_paths', False))
+        except serializers.ValidationError:
+            return Response({"error": "with_paths must be a boolean"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start_point = Point(float(start_data['x']), float(start_data['y']), srid=2385)
+            results = service.calculate_routes_to_targets(map_id, start_point, targets_data)
+
+            response_results = []
+            for item in results:
+                entry = {
+                    "type": item['type'],
+                    "id": item['id'],
+                    "distance": round(item['distance'], 2),
+                }
+                if with_paths:
+                    entry["route"] = service.format_route(item['route'].coords, route_format_of(request))
+                response_results.append(entry)
+
+            return Response({"results": response_results})
+
+        except SearchBudgetExceeded as e:
+            # 搜索超出节点数/耗时预算：与 “不可达” 区分开，客户端不应原样重试
+            return Response({"error": str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class TourPlanView(APIView):
+    """
+    POST /api/guide/route/tour/
+    多站点逛街路线：给定起点与一组商铺，自动安排访问顺序并返回每一段的路线
+    """
+    service_class = TourPlanService
+    renderer_classes = ROUTE_RENDERER_CLASSES
+
+    def post(self, request):
+        service = self.service_class()
+
+        # 前端传参示例:
+        # {"map_id": 1, "start": {"x": 10.0, "y": 20.0}, "store_ids": [3, 4, 8, 15]}
+        map_id = request.data.get('map_id')
+        start_data = request.data.get('start')
+        store_ids = request.data.get('store_ids')
+
+        is_valid, error_msg = service.validate_request_params(map_id, start_data, store_ids)
+        if not is_valid:
+            return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start_point = Point(float(start_data['x']), float(start_data['y']), srid=2385)
+            tour = service.calculate_tour(map_id, start_point, store_ids)
+
+            return Response({
+                "order": tour['order'],
+                "distance": round(tour['distance'], 2),
+                "legs": [{
+                    "from": leg['from'],
+                    "to": leg['to'],
+                    "route": RoutePlanService.format_route(leg['route'].coords, route_format_of(request)),
+                    "distance": round(leg['distance'], 2),
+                } for leg in tour['legs']],
+                "unreachable": tour['unreachable'],
+            })
+
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ReachabilityView(APIView):
+    """
+    POST /api/guide/reachability/
+    可达范围 (等时圈)：从起点 (入口、活动舞台等) 出发，各距离/时间分段内可到达的区域与商铺、设施
+    """
+    service_class = ReachabilityService
+
+    def post(self, request):
+        service = self.service_class()
+
+        # 前端传参示例:
+        # {"map_id": 1, "start": {"x": 10.0, "y": 20.0}, "bands": [60, 120, 300], "unit": "seconds"}
+        # unit 可选 "meters" (默认) / "seconds" (按 GUIDE_WALKING_SPEED 折算)
+        map_id = request.data.get('map_id')
+        start_data = request.data.get('start')
+        bands_data = request.data.get('bands')
+        unit = request.data.get('unit', 'meters')
+
+        is_valid, error_msg = service.validate_request_params(map_id, start_data, bands_data, unit)
+        if not is_valid:
+            return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start_point = Point(float(start_data['x']), float(start_data['y']), srid=2385)
+            results = service.calculate_reachability(map_id, start_point, bands_data, unit)
+
+            response_bands = []
+            for item in results:
+                response_bands.append({
+                    "limit": item['limit'],
+                    "distance": round(item['distance'], 2),
+                    "area": json.loads(item['area'].geojson) if item['area'] is not None else None,
+                    "stores": [dict(entry, distance=round(entry['distance'], 2)) for entry in item['stores']],
+                    "facilities": [dict(entry, distance=round(entry['distance'], 2))
+                                   for entry in item['facilities']],
+                })
+
+            return Response({"unit": unit, "bands": response_bands})
+
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class StoreDistanceMatrixView(APIView):
+    """
+    GET /api/guide/store_distances/?map_id=1[&store_id=5]
+    楼层商铺两两之间的步行距离：
+    - 只传 map_id 时返回整张矩阵
+    - 同时传 store_id 时返回该商铺到其余商铺的距离，从近到远排序
+    矩阵尚未计算 (或楼层刚被修改) 时启动后台计算并返回 202
+    """
+    service_class = StoreDistanceMatrixService
+
+    def get(self, request):
+        service = self.service_class()
+
+        map_id = request.GET.get('map_id', '').strip()
+        store_id = request.GET.get('store_id', '').strip()
+        if not map_id.isdigit():
+            return Response({"error": "map_id must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if store_id and not store_id.isdigit():
+            return Response({"error": "store_id must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = service.get_matrix(int(map_id))
+            if result is None:
+                service.schedule_build(int(map_id))
+                result = service.get_matrix(int(map_id))
+            if result is None:
+                return Response({"status": "building"}, status=status.HTTP_202_ACCEPTED)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+        version, store_ids, distances = result
+        # 不可达用 null 表示 (JSON 不支持 Infinity)
+        rounded = [[round(float(d), 2) if np.isfinite(d) else None for d in row] for row in distances]
+
+        if not store_id:
+            return Response({
+                "map_id": int(map_id),
+                "version": version,
+                "store_ids": store_ids,
+                "distances": rounded,
+            })
+
+        if int(store_id) not in store_ids:
+            return Response({"error": f"Store #{store_id} not on map #{map_id}"}, status=status.HTTP_404_NOT_FOUND)
+        row = rounded[store_ids.index(int(store_id))]
+        neighbors = [
+            {"store_id": other_id, "distance": distance}
+            for other_id, distance in zip(store_ids, row)
+            if other_id != int(store_id) and distance is not None
+        ]
+        neighbors.sort(key=lambda item: item['distance'])
+        return Response({
+            "map_id": int(map_id),
+            "version": version,
+            "store_id": int(store_id),
+            "distances": neighbors,
+        })
+
+
+def serialize_closure(closure: dict) -> dict:
+    """封闭区域的响应格式：几何转 GeoJSON，过期时间转 ISO 8601 (UTC)"""
+    return {
+        "id": closure['id'],
+        "map_id": closure['map_id'],
+        "shape": json.loads(GEOSGeometry(closure['geometry']).geojson),
+        "expires_at": datetime.fromtimestamp(closure['expires_at'], tz=timezone.utc).isoformat(),
+        "reason": closure['reason'],
+    }
+
+
+class ClosureListView(APIView):
+    """
+    GET  /api/guide/closures/?map_id=1  楼层上当前生效的临时封闭区域
+    POST /api/guide/closures/           添加临时封闭区域，立即对寻路生效，不重建导航网格
+    """
+    service_class = ClosureService
+    # 封闭区域会改变所有访客的路线，与编辑器、管理端的写接口使用同一组权限类 (REST_FRAMEWORK.DEFAULT_PERMISSION_CLASSES)
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+
+    def get(self, request):
+        service = self.service_class()
+
+        map_id = request.GET.get('map_id', '').strip()
+        if not map_id.isdigit():
+            return Response({"error": "map_id must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            closures = service.list_closures(int(map_id))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"closures": [serialize_closure(closure) for closure in closures]})
+
+    def post(self, request):
+        service = self.service_class()
+
+        # 前端传参示例:
+        # {"map_id": 1, "shape": "POLYGON((10 0, 10 4, 12 4, 12 0, 10 0))", "duration": 3600, "reason": "检修"}
+        # shape 也可以是 GeoJSON 对象
+        map_id = request.data.get('map_id')
+        shape_data = request.data.get('shape')
+        duration = request.data.get('duration')
+        reason = request.data.get('reason', '')
+
+        is_valid, error_msg = service.validate_create_params(map_id, shape_data, duration)
+        if not is_valid:
+            return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            closure = service.add_closure(int(map_id), shape_data, float(duration), str(reason))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except TimeoutError as e:
+            # 同一楼层的封闭区域正被其他请求修改，等待超时
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(serialize_closure(closure), status=status.HTTP_201_CREATED)
+
+
+class ClosureDetailView(APIView):
+    """
+    DELETE /api/guide/closures/<closure_id>/?map_id=1
+    提前解除临时封闭
+    """
+    service_class = ClosureService
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+
+    def delete(self, request, closure_id):
+        service = self.service_class()
+
+        map_id = request.GET.get('map_id', '').strip()
+        if not map_id.isdigit():
+            return Response({"error": "map_id must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            closure = service.remove_closure(int(map_id), closure_id)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except TimeoutError as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if closure is None:
+            return Response({"error": f"Closure {closure_id} not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class GuideCacheStatsView(APIView):
+    """
+    GET /api/guide/cache_stats/
+    导航模块进程内缓存的监控数据：条目数、容量与命中/未命中次数
+    各工作进程的缓存相互独立，返回的是处理本次请求的进程的统计
+    """
+
+    def get(self, request):
+        return Response({
+            "route": route_cache.stats(),
+            "grid": grid_cache.stats(),
+            "floor_graph": floor_graph_cache.stats(),
+            "closure_overlay": closure_overlay_cache.stats(),
+        })
@@ -1,5 +1,6 @@
 from .context import EventareaContext, OtherareaContext, EventContext, StoreareaContext, FacilityContext, AdminContext
 from core.models import Admin, Map
+from map.context import MapVersionContext
 from django.contrib.auth.hashers import make_password, check_password
 from django.core.exceptions import ValidationError
 
@@ -158,7 +159,11 @@ class EventareaService:
 
         # 如果有其他业务逻辑验证，可以在这里添加
 
-        return EventareaContext.update_eventarea(eventarea_id, data)
+        result = EventareaContext.update_eventarea(eventarea_id, data)
+        # 类型与启用状态会影响导航 (目标筛选等)，修改后使所在楼层的导航缓存失效
+        if 'type' in data or 'is_active' in data:
+            MapVersionContext.bump(MapVersionContext.get_map_ids('event', eventarea_id))
+        return result
 
     @staticmethod
     def delete_eventarea(eventarea_id):
@@ -176,7 +181,11 @@ class EventareaService:
         if eventarea.event_set.exists():
             raise ValueError("Cannot delete eventarea with associated events")
 
-        return EventareaContext.delete_eventarea(eventarea_id)
+        # 关联记录会被级联删除，需要先取出所在地图，删除后使其导航缓存失效
+        map_ids = MapVersionContext.get_map_ids('event', eventarea_id)
+        result = EventareaContext.delete_eventarea(eventarea_id)
+        MapVersionContext.bump(map_ids)
+        return result
 
     @staticmethod
     def update_floor(eventarea_id, new_map_id):
@@ -201,7 +210,12 @@ class EventareaService:
             raise ValueError(f"Invalid map_id: {new_map_id}")
         
         # 3. 调用数据访问层更新楼层信息
-        return EventareaContext.update_floor(eventarea_id, new_map_id)
+        old_map_ids = MapVersionContext.get_map_ids('event', eventarea_id)
+        result = EventareaContext.update_floor(eventarea_id, new_map_id)
+
+        # 4. 新旧楼层的几何都发生了变化
+        MapVersionContext.bump(old_map_ids + [new_map_id])
+        return result
 
 
 class OtherareaService:
@@ -318,7 +332,11 @@ class OtherareaService:
         otherarea = OtherareaContext.get_otherarea_by_id(otherarea_id)
 
 
-        return OtherareaContext.delete_otherarea(otherarea_id)
+        # 关联记录会被级联删除，需要先取出所在地图，删除后使其导航缓存失效
+        map_ids = MapVersionContext.get_map_ids('other', otherarea_id)
+        result = OtherareaContext.delete_otherarea(otherarea_id)
+        MapVersionContext.bump(map_ids)
+        return result
 
     @staticmethod
     def update_floor(otherarea_id, new_map_id):
@@ -343,7 +361,12 @@ class OtherareaService:
             raise ValueError(f"Invalid map_id: {new_map_id}")
         
         # 3. 调用数据访问层更新楼层信息
-        return OtherareaContext.update_floor(otherarea_id, new_map_id)
+        old_map_ids = MapVersionContext.get_map_ids('other', otherarea_id)
+        result = OtherareaContext.update_floor(otherarea_id, new_map_id)
+
+        # 4. 新旧楼层的几何都发生了变化
+        MapVersionContext.bump(old_map_ids + [new_map_id])
+        return result
 
 
 class EventService:
@@ -524,7 +547,10 @@ class StoreareaService:
         Args:
             storearea_id: 店铺区域ID
         """
+        # 关联记录会被级联删除，需要先取出所在地图，删除后使其导航缓存失效
+        map_ids = MapVersionContext.get_map_ids('store', storearea_id)
         StoreareaContext.delete_storearea(storearea_id)
+        MapVersionContext.bump(map_ids)
 
     @staticmethod
     def update_floor(storearea_id, new_map_id):
@@ -549,7 +575,12 @@ class StoreareaService:
             raise ValueError(f"Invalid map_id: {new_map_id}")
         
         # 3. 调用数据访问层更新楼层信息
-        return StoreareaContext.update_floor(storearea_id, new_map_id)
+        old_map_ids = MapVersionContext.get_map_ids('store', storearea_id)
+        result = StoreareaContext.update_floor(storearea_id, new_map_id)
+
+        # 4. 新旧楼层的几何都发生了变化
+        MapVersionContext.bump(old_map_ids + [new_map_id])
+        return result
 
 
 class FacilityService:
@@ -654,7 +685,11 @@ class FacilityService:
                     elif value.lower() == 'false':
                         data[field] = False
 
-        return FacilityContext.update_facility(facility_id, data)
+        result = FacilityContext.update_facility(facility_id, data)
+        # 类型与启用状态决定设施能否作为导航目标、跨楼层换乘设施，修改后使所在楼层的导航缓存失效
+        if 'type' in data or 'is_active' in data:
+            MapVersionContext.bump(MapVersionContext.get_map_ids('facility', facility_id))
+        return result
 
     @staticmethod
     def delete_facility(facility_id):
@@ -670,7 +705,11 @@ class FacilityService:
         # 1. 验证设施是否存在
         facility = FacilityContext.get_facility_by_id(facility_id)
 
-        return FacilityContext.delete_facility(facility_id)
+        # 关联记录会被级联删除，需要先取出所在地图，删除后使其导航缓存失效
+        map_ids = MapVersionContext.get_map_ids('facility', facility_id)
+        result = FacilityContext.delete_facility(facility_id)
+        MapVersionContext.bump(map_ids)
+        return result
 
     @staticmethod
     def update_floor(facility_id, new_map_id):
@@ -695,4 +734,9 @@ class FacilityService:
             raise ValueError(f"Invalid map_id: {new_map_id}")
         
         # 3. 调用数据访问层更新楼层信息
-        return FacilityContext.update_floor(facility_id, new_map_id)
\ No newline at end of file
+        old_map_ids = MapVersionContext.get_map_ids('facility', facility_id)
+        result = FacilityContext.update_floor(facility_id, new_map_id)
+
+        # 4. 新旧楼层的几何都发生了变化
+        MapVersionContext.bump(old_map_ids + [new_map_id])
+        return result
\ No newline at end of file
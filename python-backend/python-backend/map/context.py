@@ -1,5 +1,6 @@
-from core.models import Map, Storearea, Facility, Otherarea, Eventarea
-from django.db.models import Q
+from core.models import Map, Storearea, Facility, Otherarea, Eventarea, StoreareaMap, FacilityMap, OtherareaMap, \
+    EventareaMap
+from django.db.models import Q, F
 from core.context import BaseContext
 
 
@@ -66,4 +67,46 @@ class ElementContext:
     def search_globally(keyword):
         stores = Storearea.objects.filter(store_name__icontains=keyword)
         others = Otherarea.objects.filter(description__icontains=keyword, is_public=True)
-        return stores, others
\ No newline at end of file
+        return stores, others
+
+class MapVersionContext:
+    """
+    地图版本号的数据访问层
+    任何会改变楼层几何的写操作（形状、位置、关联关系）都要递增版本号，导航网格等缓存以 (map_id, version) 为键自动失效
+    """
+
+    # 元素类型 -> (关联表, 元素外键字段)
+    RELATION_MODELS = {
+        'store': (StoreareaMap, 'storearea_id'),
+        'event': (EventareaMap, 'eventarea_id'),
+        'other': (OtherareaMap, 'otherarea_id'),
+        'facility': (FacilityMap, 'facility_id'),
+    }
+
+    @staticmethod
+    def get_version(map_id):
+        """获取地图当前版本号，地图不存在时返回 None"""
+        return Map.objects.filter(pk=map_id).values_list('version', flat=True).first()
+
+    @staticmethod
+    def get_versions(map_ids):
+        """获取一组地图的当前版本号 {map_id: version}"""
+        return dict(Map.objects.filter(pk__in=list(map_ids)).values_list('id', 'version'))
+
+    @staticmethod
+    def bump(map_ids):
+        """递增一组地图的版本号"""
+        map_ids = [map_id for map_id in set(map_ids) if map_id is not None]
+        if map_ids:
+            Map.objects.filter(pk__in=map_ids).update(version=F('version') + 1)
+
+    @classmethod
+    def get_map_ids(cls, element_type, element_id):
+        """获取某个元素所在的全部地图 ID"""
+        relation_model, field = cls.RELATION_MODELS[element_type]
+        return list(relation_model.objects.filter(**{field: element_id}).values_list('map_id', flat=True))
+
+    @classmethod
+    def bump_for_element(cls, element_type, element_id):
+        """递增某个元素所在全部地图的版本号"""
+        cls.bump(cls.get_map_ids(element_type, element_id))
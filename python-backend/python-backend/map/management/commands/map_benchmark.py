@@ -0,0 +1,92 @@
+import math
+import random
+import time
+from typing import List, Tuple
+
+from django.contrib.gis.geos import Polygon
+from django.core.management.base import BaseCommand, CommandError
+
+from map.prepared import PreparedMapGeometry
+
+
+def wavy_ring(center_x: float, center_y: float, radius: float, vertices: int, amplitude: float) -> Polygon:
+    """边缘呈波浪形的近似圆 (顶点数可调，用来模拟 CAD 导入的复杂外轮廓)"""
+    points = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        r = radius + amplitude * math.sin(angle * 37)
+        points.append((center_x + r * math.cos(angle), center_y + r * math.sin(angle)))
+    points.append(points[0])
+    return Polygon(points, srid=2385)
+
+
+def build_complex_floor(size: float, vertices: int, hole_count: int) -> Tuple[Polygon, List[Polygon]]:
+    """
+    合成楼层：波浪形外轮廓 + 若干波浪形镂空 (中庭)，镂空均匀排在外轮廓内部的一圈上
+    :return: (outer_shell, holes)
+    """
+    half = size / 2
+    outer_shell = wavy_ring(half, half, half * 0.95, vertices, size * 0.01)
+    holes = []
+    for i in range(hole_count):
+        angle = 2 * math.pi * i / max(hole_count, 1)
+        holes.append(wavy_ring(half + half * 0.5 * math.cos(angle), half + half * 0.5 * math.sin(angle),
+                               size * 0.06, max(vertices // 10, 16), size * 0.005))
+    return outer_shell, holes
+
+
+class Command(BaseCommand):
+    help = '地图校验性能基准测试：外轮廓/镂空判断使用原始几何与预处理几何的对比 (合成楼层，不访问数据库)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=float, default=300.0, help='合成楼层边长 (米)')
+        parser.add_argument('--vertices', type=int, default=5000, help='外轮廓顶点数')
+        parser.add_argument('--holes', type=int, default=6, help='镂空数量')
+        parser.add_argument('--shapes', type=int, default=2000, help='待校验的随机矩形数量')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        size = options['size']
+        outer_shell, holes = build_complex_floor(size, options['vertices'], options['holes'])
+
+        # 1. 随机矩形 (部分越界、部分压到镂空)
+        rng = random.Random(options['seed'])
+        shapes = []
+        for _ in range(options['shapes']):
+            x, y = rng.uniform(0, size), rng.uniform(0, size)
+            w, h = rng.uniform(1, 10), rng.uniform(1, 10)
+            shapes.append(Polygon(((x, y), (x, y + h), (x + w, y + h), (x + w, y), (x, y)), srid=2385))
+
+        # 2. 原始几何逐一判断
+        start = time.perf_counter()
+        raw = [self.classify(shape, outer_shell, holes) for shape in shapes]
+        raw_time = time.perf_counter() - start
+
+        # 3. 预处理几何 (构建单独计时)
+        start = time.perf_counter()
+        prepared = PreparedMapGeometry(outer_shell, holes)
+        prepare_time = time.perf_counter() - start
+        start = time.perf_counter()
+        fast = [self.classify(shape, prepared.shell, prepared.holes) for shape in shapes]
+        prepared_time = time.perf_counter() - start
+
+        if raw != fast:
+            mismatched = sum(a != b for a, b in zip(raw, fast))
+            raise CommandError(f"预处理几何的判断结果不一致: {mismatched} 个图形不同")
+
+        count = len(shapes)
+        self.stdout.write(f"shell vertices: {options['vertices']}, holes: {len(holes)}, shapes: {count}")
+        self.stdout.write(f"rejected: {sum(result != 'ok' for result in raw)}")
+        self.stdout.write(f"raw GEOS : {raw_time * 1e6 / count:.1f} us/shape")
+        self.stdout.write(f"prepared : {prepared_time * 1e6 / count:.1f} us/shape  (prepare {prepare_time * 1000:.1f} ms)")
+        self.stdout.write(self.style.SUCCESS(f"speedup: {raw_time / prepared_time:.1f}x"))
+
+    @staticmethod
+    def classify(shape, outer_shell, holes) -> str:
+        """与 MapDisplayService.validate_batch 相同的边界与镂空判断"""
+        if not outer_shell.contains(shape):
+            return 'outside'
+        for hole in holes:
+            if hole.intersects(shape) and not hole.touches(shape):
+                return 'hole'
+        return 'ok'
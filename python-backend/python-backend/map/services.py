@@ -1,6 +1,8 @@
 from django.contrib.gis.geos import GEOSGeometry, Polygon
 from typing import Tuple, List
 from map.context import MapContext, ElementContext
+from map.prepared import PreparedMapGeometry
+from map.spatial_index import STRtree
 import json
 from django.contrib.gis.geos import GEOSGeometry
 
@@ -49,6 +51,10 @@ class GeometryAlgorithms:
 
     @staticmethod
     def check_placement(new_shape, outer_shell, holes, existing_obstacles):
+        """
+        放置校验：在外轮廓内、不碰镂空、不与已有区域重叠
+        outer_shell / holes 可以是原始几何，也可以是预处理几何 (PreparedMapGeometry)
+        """
         if not outer_shell: return False, "Map shell missing"
         if not outer_shell.contains(new_shape): return False, "Area exceeds map outer boundary"
         for i, hole in enumerate(holes):
@@ -99,9 +105,8 @@ class MapDisplayService:
         if not map_obj or not map_obj.detail:
             return False, "Map data not found or empty"
 
-        # 解析外轮廓和镂空
-        outer_shell = map_obj.detail[0]
-        holes = list(map_obj.detail[1:]) if len(map_obj.detail) > 1 else []
+        # 外轮廓和镂空使用按楼层版本缓存的预处理几何
+        prepared = PreparedMapGeometry.for_map(map_obj)
 
         # 3. 获取所有障碍物
         obstacles = self._collect_obstacles(map_obj, exclude_id, area_type)
@@ -109,8 +114,8 @@ class MapDisplayService:
         # 4. 调用算法进行物理放置校验
         return GeometryAlgorithms.check_placement(
             new_shape=geometry,
-            outer_shell=outer_shell,
-            holes=holes,
+            outer_shell=prepared.shell,
+            holes=prepared.holes,
             existing_obstacles=obstacles
         )
 
@@ -188,8 +193,10 @@ class MapDisplayService:
         if not map_obj or not map_obj.detail:
             return False, ["地图数据缺失"]
 
-        outer_shell = map_obj.detail[0]
-        holes = list(map_obj.detail[1:]) if len(map_obj.detail) > 1 else []
+        # 外轮廓和镂空使用按楼层版本缓存的预处理几何，每个新几何体的边界检查都复用同一份索引
+        prepared = PreparedMapGeometry.for_map(map_obj)
+        outer_shell = prepared.shell
+        holes = prepared.holes
 
         # 2. 整理新数据 (不再需要解析 JSON，直接取对象)
         new_geometries = []
@@ -238,7 +245,11 @@ class MapDisplayService:
         add_static(active_events, 'event')
 
         # 4. 执行校验
+        # 静态障碍物与新几何体分别建立外包矩形索引，只对外包矩形相交的候选做精确的 intersects / touches 判断
+        # 外包矩形不相交的两个几何体不可能相交，候选按原列表顺序遍历，因此错误信息与逐一比较完全一致
         errors = []
+        static_index = STRtree.from_geometries(static_obstacles)
+        dynamic_index = STRtree.from_geometries(g['shape'] for g in new_geometries)
 
         for curr in new_geometries:
             curr_shape = curr['shape']
@@ -253,14 +264,18 @@ class MapDisplayService:
                     errors.append(f"[{curr['name']}] 进入了地图镂空/中庭区域")
                     break
 
+            extent = curr_shape.extent
+
             # 4.2 静态障碍物碰撞
-            for obs in static_obstacles:
+            for index in static_index.query(extent):
+                obs = static_obstacles[index]
                 if obs.intersects(curr_shape) and not obs.touches(curr_shape):
                     errors.append(f"[{curr['name']}] 与未修改的固定区域重叠")
                     break
 
             # 4.3 动态物体互撞 (A 撞 B)
-            for other in new_geometries:
+            for index in dynamic_index.query(extent):
+                other = new_geometries[index]
                 if curr['id'] == other['id'] and curr['type'] == other['type']:
                     continue
 
@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.dispatch import Signal
+
+# 地图元素 (商铺、活动区域、其他区域、设施) 的形状/位置修改已提交
+# 参数: element_type ('store' / 'event' / 'other' / 'facility'),
+#       old_versions (修改前元素所在各楼层的版本号 {map_id: version}), old_geometry, new_geometry
+# 导航模块在 GuideConfig.ready 中注册接收函数，据此增量更新导航网格
+# 地图与编辑器模块不直接依赖导航模块
+element_geometry_changed = Signal()
+
+
+def notify_geometry_changed(sender, element_type: str, old_versions: dict, old_geometry, new_geometry):
+    """
+    在当前事务提交后发送 element_geometry_changed (不在事务中时立即发送)
+    事务回滚时不发送，接收方不会用未提交的几何修改缓存
+    """
+    transaction.on_commit(lambda: element_geometry_changed.send(
+        sender=sender, element_type=element_type, old_versions=old_versions,
+        old_geometry=old_geometry, new_geometry=new_geometry,
+    ))
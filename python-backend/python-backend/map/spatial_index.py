@@ -0,0 +1,96 @@
+from typing import Iterable, Sequence, Tuple
+
+import numpy as np
+
+
+class STRtree:
+    """
+    外包矩形空间索引 (Sort-Tile-Recursive 打包的 R 树，静态构建、只读查询)
+    构建：按中心 x 排序切成 ceil(sqrt(P)) 个竖条，条内按中心 y 排序，每 node_capacity 个条目打包成一个节点，
+    逐层向上重复直到只剩一个节点以内；每层的节点都覆盖下一层一段连续的条目，因此用 (start, end) 区间表示子节点
+    查询：自顶向下逐层筛选外包矩形相交的节点 (每层一次 NumPy 向量化比较)，返回外包矩形相交的条目下标
+    索引只做外包矩形粗筛，精确的 intersects / touches 判断仍由调用方完成
+    """
+
+    NODE_CAPACITY = 10
+
+    def __init__(self, extents: Sequence[Tuple[float, float, float, float]], node_capacity: int = NODE_CAPACITY):
+        """
+        :param extents: 每个条目的外包矩形 (min_x, min_y, max_x, max_y)，条目下标即列表下标
+        """
+        boxes = np.asarray(extents, dtype=float).reshape(-1, 4)
+        self.size = len(boxes)
+        # levels[0] 为叶子层 (引用条目下标)，其余层引用下一层的 (start, end) 区间；最后一层为根层
+        self.levels = []
+
+        refs = np.arange(self.size)
+        while True:
+            # 1. 本层条目按 STR 顺序排列
+            order = self._str_order(boxes, node_capacity)
+            boxes, refs = boxes[order], refs[order]
+            self.levels.append((boxes, refs))
+            if len(boxes) <= node_capacity:
+                break
+
+            # 2. 每 node_capacity 个相邻条目打包成上一层的节点
+            starts = np.arange(0, len(boxes), node_capacity)
+            ends = np.minimum(starts + node_capacity, len(boxes))
+            boxes = np.column_stack([
+                np.minimum.reduceat(boxes[:, 0], starts),
+                np.minimum.reduceat(boxes[:, 1], starts),
+                np.maximum.reduceat(boxes[:, 2], starts),
+                np.maximum.reduceat(boxes[:, 3], starts),
+            ])
+            refs = np.column_stack([starts, ends])
+
+    @classmethod
+    def from_geometries(cls, geometries: Iterable, node_capacity: int = NODE_CAPACITY) -> 'STRtree':
+        """由 GEOSGeometry 列表构建 (取各自的 extent)"""
+        return cls([geometry.extent for geometry in geometries], node_capacity)
+
+    @staticmethod
+    def _str_order(boxes: np.ndarray, node_capacity: int) -> np.ndarray:
+        """Sort-Tile-Recursive 排列：先按中心 x 分竖条，条内按中心 y 排序"""
+        count = len(boxes)
+        if count <= node_capacity:
+            return np.arange(count)
+        slices = int(np.ceil(np.sqrt(np.ceil(count / node_capacity))))
+        # 竖条容量取 node_capacity 的整数倍，保证节点不跨竖条
+        slice_size = slices * node_capacity
+
+        center_x = boxes[:, 0] + boxes[:, 2]
+        center_y = boxes[:, 1] + boxes[:, 3]
+        by_x = np.argsort(center_x, kind='stable')
+        slice_ids = np.arange(count) // slice_size
+        return by_x[np.lexsort((center_y[by_x], slice_ids))]
+
+    def query(self, extent: Tuple[float, float, float, float]) -> np.ndarray:
+        """
+        外包矩形与 extent 相交 (含边界接触) 的条目
+        :return: 条目下标，升序 (与构建时的列表顺序一致，便于调用方保持原有的遍历顺序)
+        """
+        if self.size == 0:
+            return np.empty(0, dtype=int)
+        min_x, min_y, max_x, max_y = extent
+
+        # 1. 根层全部候选
+        boxes, refs = self.levels[-1]
+        selected = np.arange(len(boxes))
+        for depth in range(len(self.levels) - 1, -1, -1):
+            boxes, refs = self.levels[depth]
+            # 2. 筛选本层外包矩形相交的候选
+            candidate = boxes[selected]
+            hit = (candidate[:, 0] <= max_x) & (candidate[:, 2] >= min_x) & \
+                  (candidate[:, 1] <= max_y) & (candidate[:, 3] >= min_y)
+            selected = selected[hit]
+            if depth == 0 or len(selected) == 0:
+                break
+            # 3. 展开为下一层的条目区间
+            starts, ends = refs[selected, 0], refs[selected, 1]
+            lengths = ends - starts
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+            selected = offsets + np.arange(lengths.sum())
+
+        if depth != 0:
+            return np.empty(0, dtype=int)
+        return np.sort(refs[selected])
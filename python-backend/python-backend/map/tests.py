@@ -1,4 +1,6 @@
+import numpy as np
 from django.test import TestCase
+from unittest.mock import MagicMock
 
 # Create your tests here.
 from rest_framework.test import APITestCase
@@ -6,6 +8,9 @@ from rest_framework import status
 from django.urls import reverse
 from django.contrib.gis.geos import Polygon, GeometryCollection
 from core.models import Building, Map, Storearea, StoreareaMap
+from map.prepared import PreparedMapGeometry, prepared_cache
+from map.services import MapDisplayService
+from map.spatial_index import STRtree
 
 
 class MapViewSetTestCase(APITestCase):
@@ -123,4 +128,99 @@ class MapViewSetTestCase(APITestCase):
         non_existent_url = reverse('map-detail', args=[99999])
         response = self.client.get(non_existent_url)
 
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class STRtreeTestCase(TestCase):
+    """外包矩形索引：查询结果与逐一比较一致"""
+
+    def test_query_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        corners = rng.uniform(0, 100, size=(500, 2))
+        boxes = np.column_stack([corners, corners + rng.uniform(0, 5, size=(500, 2))])
+        tree = STRtree(boxes, node_capacity=4)
+        self.assertGreater(len(tree.levels), 2)
+
+        for _ in range(50):
+            x, y = rng.uniform(0, 100, size=2)
+            extent = (x, y, x + 8, y + 3)
+            expected = [i for i, (x0, y0, x1, y1) in enumerate(boxes)
+                        if x0 <= extent[2] and x1 >= extent[0] and y0 <= extent[3] and y1 >= extent[1]]
+            self.assertEqual(tree.query(extent).tolist(), expected)
+
+        # 边界接触也算候选；空索引返回空结果
+        self.assertIn(0, tree.query((boxes[0][2], boxes[0][3], 200, 200)).tolist())
+        self.assertEqual(STRtree([]).query((0, 0, 1, 1)).tolist(), [])
+
+
+class MapBatchValidationTestCase(TestCase):
+    """批量校验：使用 Mock 屏蔽数据库，验证碰撞检测的错误信息"""
+
+    def setUp(self):
+        prepared_cache.clear()
+        self.service = MapDisplayService()
+        self.service.map_ctx = MagicMock()
+        self.service.elem_ctx = MagicMock()
+
+        shell = Polygon(((0, 0), (0, 100), (100, 100), (100, 0), (0, 0)), srid=2385)
+        self.service.map_ctx.get_map_with_building.return_value = MagicMock(pk=1, version=0, detail=[shell])
+        self.service.map_ctx.get_map_elements.return_value = ([1, 2, 3], [], [], [])
+
+        # 未修改的商铺 2、3；商铺 1 在本次更新中，数据库里的旧形状不参与校验
+        def store(store_id, x0, y0, x1, y1):
+            return MagicMock(id=store_id, shape=Polygon(((x0, y0), (x0, y1), (x1, y1), (x1, y0), (x0, y0)), srid=2385))
+        self.service.elem_ctx.get_stores_by_ids.return_value = [
+            store(1, 0, 0, 100, 100), store(2, 10, 10, 20, 20), store(3, 40, 40, 50, 50)]
+        self.service.elem_ctx.get_facilities_by_ids.return_value = []
+        self.service.elem_ctx.get_others_by_ids.return_value = []
+        self.service.elem_ctx.get_events_by_ids.return_value = []
+
+    @staticmethod
+    def update(item_id, name, x0, y0, x1, y1, item_type='store'):
+        return {'id': item_id, 'type': item_type, 'name': name,
+                'geos_obj': Polygon(((x0, y0), (x0, y1), (x1, y1), (x1, y0), (x0, y0)), srid=2385)}
+
+    def test_validate_batch(self):
+        # 1. 只与固定区域贴边、互不重叠时通过
+        is_valid, errors = self.service.validate_batch(1, [
+            self.update(1, 'A', 20, 10, 30, 20),
+            self.update(4, 'B', 30, 10, 35, 20),
+        ])
+        self.assertTrue(is_valid)
+        self.assertEqual(errors, [])
+
+        # 2. 越界、压到固定区域、新几何体互相重叠 (只由 ID 较小的一方报告)
+        is_valid, errors = self.service.validate_batch(1, [
+            self.update(1, 'A', 15, 15, 25, 25),
+            self.update(4, 'B', 60, 60, 70, 70),
+            self.update(5, 'C', 65, 65, 75, 75),
+            self.update(6, 'D', 95, 95, 105, 105),
+        ])
+        self.assertFalse(is_valid)
+        self.assertEqual(errors, ["[A] 与未修改的固定区域重叠", "[B] 与 [C] 重叠", "[D] 超出地图边界"])
+
+    def test_prepared_geometry_cached_per_version(self):
+        """外轮廓/镂空的预处理几何按楼层版本缓存，判断结果与原始几何一致"""
+        shell = Polygon(((0, 0), (0, 100), (100, 100), (100, 0), (0, 0)), srid=2385)
+        hole = Polygon(((40, 40), (40, 60), (60, 60), (60, 40), (40, 40)), srid=2385)
+        map_obj = MagicMock(pk=1, version=0, detail=[shell, hole])
+
+        prepared = PreparedMapGeometry.for_map(map_obj)
+        self.assertIs(PreparedMapGeometry.for_map(map_obj), prepared)
+        for x0, y0, x1, y1 in ((10, 10, 20, 20), (35, 35, 45, 45), (60, 60, 70, 70), (95, 95, 105, 105)):
+            shape = Polygon(((x0, y0), (x0, y1), (x1, y1), (x1, y0), (x0, y0)), srid=2385)
+            self.assertEqual(prepared.shell.contains(shape), shell.contains(shape))
+            self.assertEqual(prepared.holes[0].intersects(shape), hole.intersects(shape))
+            self.assertEqual(prepared.holes[0].touches(shape), hole.touches(shape))
+
+        # 版本号递增后重新构建，旧版本的条目被清理
+        map_obj.version = 1
+        self.assertIsNot(PreparedMapGeometry.for_map(map_obj), prepared)
+        self.assertEqual(len(prepared_cache), 1)
+
+        # 通过 validate_geometry 走同一份缓存
+        self.service.map_ctx.get_map_with_building.return_value = map_obj
+        self.service.elem_ctx.get_stores_by_ids.return_value = []
+        shape = Polygon(((35, 35), (35, 45), (45, 45), (45, 35), (35, 35)), srid=2385)
+        self.assertEqual(self.service.validate_geometry(shape, 1), (False, "Area intersects with map hole #1"))
+        self.assertEqual(prepared_cache.stats()['hits'], 2)
@@ -169,3 +169,65 @@ CORS_ALLOW_CREDENTIALS = True
 # 确保 Session 在跨域请求中也能被浏览器接受
 SESSION_COOKIE_SAMESITE = 'None'
 SESSION_COOKIE_SECURE = False
+
+# 导航模块 (guide) 配置
+# 进程内缓存的楼层导航网格数量上限 (LRU 淘汰)
+GUIDE_GRID_CACHE_SIZE = 16
+# 进程内缓存的路径结果数量上限 (按楼层版本与起终点格子缓存，楼层几何变化后自动失效)
+GUIDE_ROUTE_CACHE_SIZE = 1024
+# 进程内缓存的临时封闭区域叠加网格数量上限 (按楼层版本与封闭区域组合缓存，LRU 淘汰)
+GUIDE_CLOSURE_OVERLAY_CACHE_SIZE = 16
+# 默认寻路引擎: 'astar'、'jps' (跳点搜索，开阔楼层展开节点更少)、'bidirectional' (双向 A*)
+# 'hpa' (分层寻路，超大楼层的长距离路线) 或 'quadtree' (四叉树自适应精度，开阔区域节点少)
+# 请求中可用 engine 参数覆盖
+GUIDE_ROUTE_ENGINE = 'astar'
+# 是否按视线拉直网格路径 (只保留转折点，缩小响应体积并修正阶梯状路径的距离)
+GUIDE_SMOOTH_PATH = True
+# 起终点落在商铺内或外轮廓外时，吸附到此距离 (米) 内最近的可走格子，超出则报错
+GUIDE_ENDPOINT_SNAP_DISTANCE = 10.0
+# 路径请求 clearance 参数 (路线到障碍物的最小距离，米) 的上限
+GUIDE_MAX_CLEARANCE = 2.0
+# 路径请求 centering 参数生效的范围：离障碍物不足此距离 (米) 的格子代价被放大
+GUIDE_CENTERING_RADIUS = 2.0
+# 单楼层寻路使用的工作进程数 (0 表示在请求线程内直接计算)
+# 生产环境建议设为 CPU 核数减一，给同进程的其他接口留出余量
+GUIDE_ROUTE_WORKERS = 0
+# 多进程寻路时等待单次搜索的超时时间 (秒)
+GUIDE_ROUTE_TIMEOUT = 10.0
+# 单次搜索的预算：展开节点数上限与耗时上限 (秒)，超出时返回 “budget exceeded” 错误，None 表示不限制
+GUIDE_SEARCH_MAX_EXPANDED = 500000
+GUIDE_SEARCH_TIME_LIMIT = 5.0
+# 跨楼层寻路：视为垂直交通的设施类型 (0 = 电动扶梯/电梯)
+GUIDE_CONNECTOR_FACILITY_TYPES = [0]
+# 设施点本身是障碍物，在此距离 (米) 内寻找最近的可走格子作为落脚点
+GUIDE_CONNECTOR_SNAP_DISTANCE = 2.0
+# 相邻楼层上距离不超过此值 (米) 的两个设施视为同一部扶梯/电梯
+GUIDE_CONNECTOR_LINK_DISTANCE = 2.0
+# 每跨一层的换乘代价 (折算为步行米数)
+GUIDE_FLOOR_TRANSITION_COST = 15.0
+# 进程内缓存的建筑楼层转换图数量上限
+GUIDE_FLOOR_GRAPH_CACHE_SIZE = 8
+# 一对多寻路：商铺/设施周围此距离 (米) 内的可走格子都算作到达
+GUIDE_TARGET_SNAP_DISTANCE = 1.0
+# 可达范围接口：步行速度 (米/秒，用于按秒计算的分段)、单次请求的最大步行距离 (米) 与最大分段数
+GUIDE_WALKING_SPEED = 1.2
+GUIDE_REACHABILITY_MAX_DISTANCE = 500.0
+GUIDE_REACHABILITY_MAX_BANDS = 10
+# 多站点逛街路线：单次请求最多的商铺数
+GUIDE_TOUR_MAX_STOPS = 15
+# 临时封闭区域保存在哪个 Django 缓存中 (多进程部署需配置共享后端，如 Redis)，以及单个封闭区域的最长有效时长 (秒)
+GUIDE_CLOSURE_CACHE = 'default'
+GUIDE_CLOSURE_MAX_DURATION = 7 * 24 * 3600
+# 导航预计算数据 (商铺距离矩阵等) 的存放目录，文件名带楼层版本号
+GUIDE_DATA_DIR = os.path.join(BASE_DIR, 'guide_data')
+# 商铺距离矩阵是否在后台线程中计算 (False 时请求内同步计算)
+GUIDE_STORE_MATRIX_ASYNC = True
+# 是否把构建好的导航网格写入 GUIDE_DATA_DIR (按楼层版本一个文件)，进程重启或新开进程时直接 mmap 加载
+GUIDE_GRID_STORE = True
+# 加载网格文件时是否读取楼层几何并与文件头中的源几何指纹比对 (默认按版本号信任文件)
+# 数据库重置或重新导入后可临时开启，或执行 manage.py guide_grid_verify 一次性清理不一致的文件
+GUIDE_GRID_VERIFY = False
+
+# 地图模块 (map) 配置
+# 进程内缓存的楼层外轮廓/镂空预处理几何数量上限 (按楼层版本缓存，LRU 淘汰)
+MAP_PREPARED_CACHE_SIZE = 32
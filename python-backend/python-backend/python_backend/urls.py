@@ -22,7 +22,8 @@ from django.urls import path,include
 from rest_framework.routers import DefaultRouter
 from map.views import MapViewSet, MapValidationView, MapBatchValidationView
 
-from guide.views import RoutePlanView
+from guide.views import RoutePlanView, BuildingRoutePlanView, TargetRoutePlanView, StoreDistanceMatrixView, \
+    GuideCacheStatsView, ReachabilityView, TourPlanView, ClosureListView, ClosureDetailView
 
 from management.views import AdminAuthView, AdminProfileView
 
@@ -38,6 +39,14 @@ urlpatterns = [
     path('api/maps/validate/', MapValidationView.as_view(), name='map-validate'),
     path('api/maps/validate_batch/', MapBatchValidationView.as_view(), name='map-validate-batch'),
     path('api/guide/route/',RoutePlanView.as_view(), name='route-plan'),
+    path('api/guide/route/building/', BuildingRoutePlanView.as_view(), name='route-plan-building'),
+    path('api/guide/route/targets/', TargetRoutePlanView.as_view(), name='route-plan-targets'),
+    path('api/guide/route/tour/', TourPlanView.as_view(), name='route-plan-tour'),
+    path('api/guide/reachability/', ReachabilityView.as_view(), name='guide-reachability'),
+    path('api/guide/store_distances/', StoreDistanceMatrixView.as_view(), name='store-distances'),
+    path('api/guide/closures/', ClosureListView.as_view(), name='guide-closures'),
+    path('api/guide/closures/<str:closure_id>/', ClosureDetailView.as_view(), name='guide-closure-detail'),
+    path('api/guide/cache_stats/', GuideCacheStatsView.as_view(), name='guide-cache-stats'),
     path('api/', include(router.urls)),
     path('api/management/auth/<str:action>/', AdminAuthView.as_view(), name='admin-auth'),
     path('api/management/profile/', AdminProfileView.as_view(), name='admin-profile'),